@@ -0,0 +1,273 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Micro-benchmarks for the hot paths of study expansion.
+
+Each benchmark times one function of the 'merlin run' critical path over a
+range of problem sizes (samples, labels or steps), and measures its peak
+python memory allocation with tracemalloc in a separate, untimed call. The
+results are written as json lines tagged with the current git commit, so
+runs from different commits can be compared:
+
+    python benchmarks/expansion.py --output before.jsonl
+    git checkout my-branch
+    python benchmarks/expansion.py --output after.jsonl --compare before.jsonl
+
+Sizes go up to 1e7 samples and 1000 labels, but the defaults stay small
+enough to run in a minute; pass e.g. '--samples 1e3 1e5 1e7' for a full sweep.
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from maestrowf.datastructures.core.study import StudyStep
+from tabulate import tabulate
+
+from merlin.common.sample_index import uniform_directories
+from merlin.common.sample_index_factory import create_hierarchy
+from merlin.spec.expansion import expand_by_line, parameter_substitutions_for_sample
+from merlin.study.dag import DAG
+from merlin.study.step import MerlinStepRecord, Step
+
+
+# Each benchmark maps a size to (function, args), with the function called
+# as function(*args) for every timed repeat. The dimension is the kind of
+# size the benchmark is swept over.
+BENCHMARKS = OrderedDict()
+
+# Minimum time (in seconds) of a batch of timed calls.
+MIN_BATCH_TIME = 0.01
+
+
+def benchmark(dimension):
+    """Register a benchmark swept over 'samples', 'labels' or 'steps'."""
+
+    def register(setup):
+        BENCHMARKS[setup.__name__] = (dimension, setup)
+        return setup
+
+    return register
+
+
+def make_hierarchy(n_samples):
+    """The sample index 'merlin run' builds for n_samples, one sample per bundle."""
+    return create_hierarchy(n_samples, 1, uniform_directories(n_samples, 1, 100))
+
+
+def make_step(n_labels, name="step"):
+    """A step whose cmd references n_labels sample columns."""
+    study_step = StudyStep()
+    study_step.name = name
+    study_step.description = "benchmark step"
+    study_step.run = {
+        "cmd": "\n".join(f"echo $(LABEL_{i}) $(MERLIN_SAMPLE_ID)" for i in range(n_labels)),
+        "restart": "",
+        "task_queue": "benchmark",
+    }
+    return Step(MerlinStepRecord("workspace", study_step))
+
+
+@benchmark("samples")
+def create_hierarchy_(n_samples):
+    return create_hierarchy, (n_samples, 1, uniform_directories(n_samples, 1, 100))
+
+
+@benchmark("samples")
+def make_directory_string(n_samples):
+    return make_hierarchy(n_samples).make_directory_string, ()
+
+
+@benchmark("samples")
+def traverse(n_samples):
+    index = make_hierarchy(n_samples)
+    return (lambda: sum(1 for _ in index.traverse_all())), ()
+
+
+@benchmark("labels")
+def parameter_substitutions(n_labels):
+    labels = [f"LABEL_{i}" for i in range(n_labels)]
+    sample = [float(i) for i in range(n_labels)]
+    return parameter_substitutions_for_sample, (sample, labels, 12345, "1/23/45")
+
+
+@benchmark("labels")
+def clone_changing_workspace_and_cmd(n_labels):
+    step = make_step(n_labels)
+    labels = [f"LABEL_{i}" for i in range(n_labels)]
+    pairs = parameter_substitutions_for_sample([float(i) for i in range(n_labels)], labels, 12345, "1/23/45")
+    return (lambda: step.clone_changing_workspace_and_cmd(cmd_replacement_pairs=pairs, new_workspace="1/23/45")), ()
+
+
+@benchmark("labels")
+def expand_by_line_(n_labels):
+    var_dict = {f"VAR_{i}": f"value_{i}" for i in range(n_labels)}
+    text = "\n".join(f"key_{i}: $(VAR_{i}) plain text" for i in range(n_labels))
+    return expand_by_line, (text, var_dict)
+
+
+@benchmark("steps")
+def group_tasks(n_steps):
+    # Four independent chains of n_steps / 4 steps each, hanging off the source.
+    adjacency = {"_source": []}
+    values = {"_source": None}
+    n_chains = 4
+    for chain in range(n_chains):
+        previous = "_source"
+        for i in range(max(1, n_steps // n_chains)):
+            name = f"step_{chain}_{i}"
+            adjacency[previous].append(name)
+            adjacency[name] = []
+            values[name] = make_step(1, name).mstep
+            previous = name
+    labels = ["LABEL_0"]
+
+    def run():
+        return DAG(SimpleNamespace(adjacency_table=adjacency, values=values), labels).group_tasks("_source")
+
+    return run, ()
+
+
+def measure(setup, size, repeat):
+    """
+    Time function(*args) repeat times and measure its peak allocation. Fast
+    functions are called in batches of at least MIN_BATCH_TIME seconds.
+
+    :return: dict of min and mean seconds per call and peak memory in bytes
+    """
+    function, args = setup(size)
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    first = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    number = max(1, int(MIN_BATCH_TIME / max(first, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(number):
+            function(*args)
+        times.append((time.perf_counter() - start) / number)
+    return {"min": min(times), "mean": sum(times) / len(times), "peak_memory": peak}
+
+
+def git_commit():
+    """The current commit of the merlin source tree, if it is a git checkout."""
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__), stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file):
+    """Print the time and memory ratios of results to those in baseline_file."""
+    with open(baseline_file) as f:
+        baseline = {(r["name"], r["size"]): r for r in map(json.loads, f) if r}
+    rows = []
+    for result in results:
+        base = baseline.get((result["name"], result["size"]))
+        if base is None:
+            continue
+        rows.append(
+            [
+                result["name"],
+                result["size"],
+                f"{base['min']:.3g}",
+                f"{result['min']:.3g}",
+                f"{result['min'] / base['min']:.2f}",
+                f"{result['peak_memory'] / max(base['peak_memory'], 1):.2f}",
+            ]
+        )
+    print(
+        tabulate(rows, headers=["benchmark", "size", "base (s)", "new (s)", "time ratio", "memory ratio"]),
+        file=sys.stderr,
+    )
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    def size(value):
+        return int(float(value))
+
+    parser.add_argument("--samples", type=size, nargs="+", default=[1000, 10000, 100000], help="Sample counts")
+    parser.add_argument("--labels", type=size, nargs="+", default=[10, 100, 1000], help="Label counts")
+    parser.add_argument("--steps", type=size, nargs="+", default=[10, 100, 1000], help="Step counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls per benchmark and size")
+    parser.add_argument("-k", dest="filter", default="", help="Only run the benchmarks whose names contain this string")
+    parser.add_argument("--output", default="-", help="File to write the json lines of results to. Default: stdout")
+    parser.add_argument("--compare", default=None, help="A previous output file to compare the results to")
+    return parser
+
+
+def main():
+    args = setup_argparse().parse_args()
+    commit = git_commit()
+    results = []
+    output = sys.stdout if args.output == "-" else open(args.output, "w")  # pylint: disable=consider-using-with
+    try:
+        for name, (dimension, setup) in BENCHMARKS.items():
+            name = name.rstrip("_")
+            if args.filter not in name:
+                continue
+            for size in getattr(args, dimension):
+                result = {"name": name, dimension: size, "size": size, "commit": commit}
+                result.update(measure(setup, size, args.repeat))
+                results.append(result)
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Measure merlin's per-task overhead with null steps on a single machine.
+
+For every combination of sample count, chain length and worker concurrency,
+a study of `chain length` null steps per sample (plus a final step gathering
+all samples, as in the null_spec example) is generated and run, either
+locally (`merlin run --local`) or against a broker such as a local redis
+server. The per-task timing records of the workers (see MERLIN_TASK_TIMING)
+are collected and reduced to one json line of metrics per run:
+
+  - tasks: the number of step tasks run
+  - makespan: seconds from launching the study to the end of its last task
+  - tasks_per_sec: tasks / makespan
+  - enqueue_time: seconds spent in 'merlin run' queueing the study (for
+    local runs, this includes running it)
+  - expansion_time: seconds from launching the study to the start of its
+    first step task, i.e. study setup and the first sample expansion
+  - dequeue_p50, dequeue_p95: seconds tasks waited on the broker
+  - overhead_mean: mean seconds per task spent outside the step's script
+  - run_mean: mean seconds per task spent running the step's script
+
+Examples:
+
+    # Serial, in-process runs; no servers needed.
+    python benchmarks/null_overhead.py --local --samples 10 100 1000 --chain-length 1 4
+
+    # Against a throwaway redis server started on port 6390.
+    python benchmarks/null_overhead.py --start-redis 6390 --concurrency 1 4 16
+"""
+
+import argparse
+import glob
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import yaml
+
+
+MERLIN = [sys.executable, "-m", "merlin.main", "--level", "ERROR"]
+
+# How long (in seconds) to wait for a distributed run to finish.
+RUN_TIMEOUT = 3600
+
+
+def make_spec(path, samples_file, n_samples, chain_length, concurrency):
+    """
+    Write a spec running chain_length null steps per sample, then one step
+    depending on all of them.
+
+    :return: The number of step tasks the spec will run
+    """
+    name = f"null_s{n_samples}_l{chain_length}_c{concurrency}"
+    steps = []
+    for i in range(chain_length):
+        step = {
+            "name": f"null_{i}",
+            "description": "exit immediately",
+            "run": {"cmd": "# $(SAMPLE)\nexit $(MERLIN_SUCCESS)", "task_queue": name},
+        }
+        if i > 0:
+            step["run"]["depends"] = [f"null_{i - 1}"]
+        steps.append(step)
+    steps.append(
+        {
+            "name": "verify",
+            "description": "gather all samples",
+            "run": {"cmd": "exit $(MERLIN_SUCCESS)", "depends": [f"null_{chain_length - 1}_*"], "task_queue": name},
+        }
+    )
+    spec = {
+        "description": {"name": name, "description": "merlin overhead benchmark"},
+        "env": {"variables": {"OUTPUT_PATH": "./studies"}},
+        "study": steps,
+        "merlin": {
+            "resources": {
+                "workers": {
+                    f"worker_{name}": {
+                        "args": f"-O fair --prefetch-multiplier 1 --concurrency {concurrency} -l warning",
+                        "steps": ["all"],
+                    }
+                }
+            },
+            "samples": {"file": samples_file, "column_labels": ["SAMPLE"]},
+        },
+    }
+    with open(path, "w") as f:
+        yaml.safe_dump(spec, f, sort_keys=False)
+    return n_samples * chain_length + 1
+
+
+def read_records(timing_dir):
+    """Read all timing records written to timing_dir."""
+    records = []
+    for path in glob.glob(os.path.join(timing_dir, "*.jsonl")):
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def merlin(args, workdir, env):
+    """Run a merlin command in workdir, raising on failure."""
+    subprocess.run(MERLIN + args, cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def run_once(workdir, n_samples, chain_length, concurrency, local):
+    """
+    Run one benchmark configuration in workdir.
+
+    :return: dict of metrics
+    """
+    timing_dir = os.path.join(workdir, "timing")
+    os.makedirs(timing_dir, exist_ok=True)
+    env = dict(os.environ, MERLIN_TASK_TIMING=timing_dir)
+
+    samples_file = os.path.join(workdir, f"samples_{n_samples}.npy")
+    np.save(samples_file, np.arange(n_samples).reshape(-1, 1))
+    spec = os.path.join(workdir, "null.yaml")
+    n_tasks = make_spec(spec, samples_file, n_samples, chain_length, concurrency)
+
+    if not local:
+        merlin(["purge", "-f", spec], workdir, env)
+    start = time.time()
+    merlin(["run", spec] + (["--local"] if local else []), workdir, env)
+    enqueue_time = time.time() - start
+
+    if not local:
+        merlin(["run-workers", spec], workdir, env)
+        try:
+            deadline = start + RUN_TIMEOUT
+            while len(read_records(timing_dir)) < n_tasks:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Timed out waiting for {n_tasks} tasks")
+                time.sleep(0.5)
+        finally:
+            merlin(["stop-workers", "--spec", spec], workdir, env)
+
+    records = read_records(timing_dir)
+    end = max(r["start"] + r["total"] for r in records)
+    makespan = end - start
+    dequeue = [r["dequeue"] for r in records if r.get("dequeue") is not None]
+    run = np.array([r.get("run", 0.0) for r in records])
+    total = np.array([r["total"] for r in records])
+    return {
+        "mode": "local" if local else "broker",
+        "samples": n_samples,
+        "chain_length": chain_length,
+        "concurrency": concurrency,
+        "tasks": len(records),
+        "makespan": makespan,
+        "tasks_per_sec": len(records) / makespan,
+        "enqueue_time": enqueue_time,
+        "expansion_time": min(r["start"] for r in records) - start,
+        "dequeue_p50": float(np.percentile(dequeue, 50)) if dequeue else None,
+        "dequeue_p95": float(np.percentile(dequeue, 95)) if dequeue else None,
+        "overhead_mean": float((total - run).mean()),
+        "run_mean": float(run.mean()),
+    }
+
+
+def start_redis(port, workdir):
+    """Start a throwaway redis server and point merlin at it with a local app.yaml."""
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no"],
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"redis://localhost:{port}/0"
+    with open(os.path.join(workdir, "app.yaml"), "w") as f:
+        yaml.safe_dump({"broker": {"url": url}, "results_backend": {"url": url}}, f)
+    time.sleep(1)
+    return server
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, nargs="+", default=[10, 100, 1000], help="Sample counts to sweep")
+    parser.add_argument("--chain-length", type=int, nargs="+", default=[1, 4], help="Chain lengths to sweep")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1], help="Worker concurrencies to sweep (ignored with --local)"
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each configuration")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--local", action="store_true", help="Run the studies with 'merlin run --local'")
+    group.add_argument(
+        "--start-redis",
+        type=int,
+        metavar="PORT",
+        default=None,
+        help="Start a redis server on PORT for the broker and results backend",
+    )
+    parser.add_argument("--workdir", default=None, help="Directory to run in. Default: a temporary directory")
+    parser.add_argument("--output", default="-", help="File to write the json lines of metrics to. Default: stdout")
+    return parser
+
+
+def main():
+    args = setup_argparse().parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="merlin_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    concurrencies = [1] if args.local else args.concurrency
+    server = start_redis(args.start_redis, workdir) if args.start_redis is not None else None
+    output = sys.stdout if args.output == "-" else open(args.output, "a")  # pylint: disable=consider-using-with
+    try:
+        for n_samples, chain_length, concurrency in itertools.product(args.samples, args.chain_length, concurrencies):
+            for _ in range(args.repeat):
+                shutil.rmtree(os.path.join(workdir, "timing"), ignore_errors=True)
+                shutil.rmtree(os.path.join(workdir, "studies"), ignore_errors=True)
+                metrics = run_once(workdir, n_samples, chain_length, concurrency, args.local)
+                output.write(json.dumps(metrics) + "\n")
+                output.flush()
+    finally:
+        if server is not None:
+            server.terminate()
+        if output is not sys.stdout:
+            output.close()
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Measure how fast a single expansion task can add step tasks to its chord.
+
+An expansion task adds one merlin_step signature per sample to the chord it
+is a member of. This benchmark publishes a sweep of message counts of such
+signatures (pickled steps with a cmd of --labels substitutions) from one
+simulated chord member, either one message at a time as Task.add_to_chord
+does ('single'), or with merlin.common.publishing.publish_to_chord ('bulk'),
+and prints one json line per run:
+
+  - mode: 'single' or 'bulk'
+  - messages: the number of signatures published
+  - seconds: the time to count and publish them
+  - messages_per_sec: messages / seconds
+
+The broker defaults to kombu's in-process memory transport, which measures
+the client side cost only; point --broker at a real server for the round
+trips. The chord counter is kept in the redis results backend given with
+--backend, or in memory.
+
+Examples:
+
+    python benchmarks/publish.py --messages 1000 10000
+    python benchmarks/publish.py --broker redis://localhost:6379/0 --backend redis://localhost:6379/0
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+
+from celery import Celery
+from maestrowf.datastructures.core.study import StudyStep
+
+from merlin.common.publishing import PUBLISH_BATCH_SIZE, publish_to_chord
+from merlin.study.step import MerlinStepRecord, Step
+
+
+QUEUE = "merlin_publish_benchmark"
+
+
+class MemoryChordBackend:
+    """A stand-in for the redis results backend's chord counter."""
+
+    def __init__(self):
+        self.client = self
+        self.counters = {}
+
+    @staticmethod
+    def get_key_for_group(group_id, suffix=""):
+        return f"{group_id}{suffix}"
+
+    def incrby(self, key, amount):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_to_chord(self, group_id, result):  # pylint: disable=unused-argument
+        self.incrby(self.get_key_for_group(group_id, ".t"), 1)
+
+
+def make_step(n_labels, sample_id):
+    """A step as expanded for one sample, with n_labels substituted values."""
+    study_step = StudyStep()
+    study_step.name = "benchmark"
+    study_step.description = "publish benchmark step"
+    study_step.run = {
+        "cmd": "\n".join(f"echo {i}.0 {sample_id}" for i in range(n_labels)),
+        "restart": "",
+        "task_queue": QUEUE,
+        "shell": "/bin/bash",
+        "max_retries": 30,
+    }
+    return Step(MerlinStepRecord(f"workspace/{sample_id:08d}", study_step))
+
+
+def benchmark_step(step, adapter_config):  # pylint: disable=unused-argument
+    """The task the published signatures call; never run."""
+
+
+def make_chord_member(app, backend):
+    """A stand-in for a running expansion task that is a member of a chord."""
+    request = argparse.Namespace(
+        is_eager=False, chord=str(uuid.uuid4()), group=str(uuid.uuid4()), group_index=0, root_id=str(uuid.uuid4())
+    )
+    return argparse.Namespace(app=app, backend=backend, request=request)
+
+
+def publish_single(task, signatures):
+    """Publish signatures the way Task.add_to_chord(sig, lazy=False) does."""
+    request = task.request
+    for sig in signatures:
+        sig.set(group_id=request.group, group_index=request.group_index, chord=request.chord, root_id=request.root_id)
+        task.backend.add_to_chord(request.group, sig.freeze())
+        sig.delay()
+
+
+def run_once(app, backend, mode, n_messages, n_labels, batch_size):
+    """
+    Publish n_messages signatures in the given mode.
+
+    :return: dict of metrics
+    """
+    step_task = app.tasks["merlin:benchmark_step"]
+    signatures = [
+        step_task.s(make_step(n_labels, sample_id), {"type": "local"}).set(queue=QUEUE) for sample_id in range(n_messages)
+    ]
+    task = make_chord_member(app, backend)
+    start = time.perf_counter()
+    if mode == "bulk":
+        publish_to_chord(task, signatures, batch_size=batch_size)
+    else:
+        publish_single(task, signatures)
+    seconds = time.perf_counter() - start
+    with app.connection_for_write() as conn:
+        conn.default_channel.queue_purge(QUEUE)
+    return {
+        "mode": mode,
+        "messages": n_messages,
+        "labels": n_labels,
+        "seconds": seconds,
+        "messages_per_sec": n_messages / seconds,
+    }
+
+
+def setup_argparse():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[1000, 10000], help="Message counts to sweep")
+    parser.add_argument("--labels", type=int, default=10, help="Sample labels substituted in each step's cmd")
+    parser.add_argument("--modes", nargs="+", choices=["single", "bulk"], default=["single", "bulk"])
+    parser.add_argument("--batch-size", type=int, default=PUBLISH_BATCH_SIZE, help="Chord counter batch size")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each configuration")
+    parser.add_argument("--broker", default="memory://", help="Broker url. Default: in-process memory transport")
+    parser.add_argument("--backend", default=None, help="Redis results backend url. Default: an in-memory counter")
+    parser.add_argument("--output", default="-", help="File to write the json lines of metrics to. Default: stdout")
+    return parser
+
+
+def main():
+    args = setup_argparse().parse_args()
+    app = Celery("merlin_publish_benchmark", broker=args.broker, backend=args.backend)
+    app.conf.update(task_serializer="pickle", accept_content=["pickle"])
+    app.task(name="merlin:benchmark_step")(benchmark_step)
+    backend = app.backend if args.backend else MemoryChordBackend()
+    output = sys.stdout if args.output == "-" else open(args.output, "a")  # pylint: disable=consider-using-with
+    try:
+        for n_messages in args.messages:
+            for mode in args.modes:
+                for _ in range(args.repeat):
+                    metrics = run_once(app, backend, mode, n_messages, args.labels, args.batch_size)
+                    output.write(json.dumps(metrics) + "\n")
+                    output.flush()
+    finally:
+        with app.connection_for_write() as conn:
+            conn.default_channel.queue_delete(QUEUE)
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -33,82 +33,79 @@ from __future__ import absolute_import, print_function
 
 import logging
 import os
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import billiard
 import psutil
 from celery import Celery
+from celery.local import Proxy
 from celery.signals import worker_process_init
 
-import merlin.common.security.encrypt_backend_traffic
-from merlin.config import broker, celeryconfig, results_backend
-from merlin.config.configfile import CONFIG
-from merlin.config.utils import Priority, get_priority
+from merlin.common.affinity import AFFINITY_ENV, POLICY_ENV, affinity_from_env
+from merlin.common.resource_pool import mark_prefork_child
+from merlin.common.retry_queue import RetryReleaser
+from merlin.config import celeryconfig
 from merlin.router import route_for_task
-from merlin.utils import nested_namespace_to_dicts
 
 
 LOG: logging.Logger = logging.getLogger(__name__)
 
-merlin.common.security.encrypt_backend_traffic.set_backend_funcs()
-
-
-BROKER_SSL: bool = True
-RESULTS_SSL: bool = False
-BROKER_URI: Optional[str] = ""
-RESULTS_BACKEND_URI: Optional[str] = ""
-try:
-    BROKER_URI = broker.get_connection_string()
-    LOG.debug("broker: %s", broker.get_connection_string(include_password=False))
-    BROKER_SSL = broker.get_ssl_config()
-    LOG.debug("broker_ssl = %s", BROKER_SSL)
-    RESULTS_BACKEND_URI = results_backend.get_connection_string()
-    RESULTS_SSL = results_backend.get_ssl_config(celery_check=True)
-    LOG.debug("results: %s", results_backend.get_connection_string(include_password=False))
-    LOG.debug("results: redis_backed_use_ssl = %s", RESULTS_SSL)
-except ValueError:
-    # These variables won't be set if running with '--local'.
-    BROKER_URI = None
-    RESULTS_BACKEND_URI = None
-
-# initialize app with essential properties
-app: Celery = Celery(
-    "merlin",
-    broker=BROKER_URI,
-    backend=RESULTS_BACKEND_URI,
-    broker_use_ssl=BROKER_SSL,
-    redis_backend_use_ssl=RESULTS_SSL,
-    task_routes=(route_for_task,),
-)
-
-# set task priority defaults to prioritize workflow tasks over task-expansion tasks
-task_priority_defaults: Dict[str, Union[int, Priority]] = {
-    "task_queue_max_priority": 10,
-    "task_default_priority": get_priority(Priority.mid),
-}
-if CONFIG.broker.name.lower() == "redis":
-    app.conf.broker_transport_options = {
-        "priority_steps": list(range(1, 11)),
-        "queue_order_strategy": "priority",
-    }
-app.conf.update(**task_priority_defaults)
-
-# load merlin config defaults
-app.conf.update(**celeryconfig.DICT)
-
-# load config overrides from app.yaml
-if (
-    not hasattr(CONFIG.celery, "override")
-    or (CONFIG.celery.override is None)
-    or (not nested_namespace_to_dicts(CONFIG.celery.override))  # only true if len == 0
-):
-    LOG.debug("Skipping celery config override; 'celery.override' field is empty.")
-else:
+# The cached celery application, built on first use by get_app().
+_APP: Optional[Celery] = None
+
+
+def get_server_uris() -> Tuple[Optional[str], Optional[str], bool, bool]:
+    """
+    Resolve the broker and results backend connection strings and ssl settings
+    from the merlin app config.
+
+    :return: (broker uri, results backend uri, broker ssl, results ssl)
+    :rtype: Tuple
+    """
+    # pylint: disable=import-outside-toplevel
+    from merlin.config import broker, results_backend
+
+    broker_ssl: bool = True
+    results_ssl: bool = False
+    try:
+        broker_uri: Optional[str] = broker.get_connection_string()
+        LOG.debug("broker: %s", broker.get_connection_string(include_password=False))
+        broker_ssl = broker.get_ssl_config()
+        LOG.debug("broker_ssl = %s", broker_ssl)
+        results_backend_uri: Optional[str] = results_backend.get_connection_string()
+        results_ssl = results_backend.get_ssl_config(celery_check=True)
+        LOG.debug("results: %s", results_backend.get_connection_string(include_password=False))
+        LOG.debug("results: redis_backed_use_ssl = %s", results_ssl)
+    except ValueError:
+        # These variables won't be set if running with '--local'.
+        broker_uri = None
+        results_backend_uri = None
+    return broker_uri, results_backend_uri, broker_ssl, results_ssl
+
+
+def apply_config_overrides(celery_app: Celery) -> None:
+    """
+    Load the 'celery.override' section of app.yaml into the application config.
+
+    :param `celery_app`: The celery application to update
+    """
+    # pylint: disable=import-outside-toplevel
+    from merlin.config.configfile import CONFIG
+    from merlin.utils import nested_namespace_to_dicts
+
+    if (
+        not hasattr(CONFIG.celery, "override")
+        or (CONFIG.celery.override is None)
+        or (not nested_namespace_to_dicts(CONFIG.celery.override))  # only true if len == 0
+    ):
+        LOG.debug("Skipping celery config override; 'celery.override' field is empty.")
+        return
+
     override_dict: Dict = nested_namespace_to_dicts(CONFIG.celery.override)
     override_str: str = ""
     i: int = 0
     for k, v in override_dict.items():
-        if k not in str(app.conf.__dict__):
+        if k not in str(celery_app.conf.__dict__):
             raise ValueError(f"'{k}' is not a celery configuration.")
         override_str += f"\t{k}:\t{v}"
         if i != len(override_dict) - 1:
@@ -118,28 +115,107 @@ else:
         "Overriding default celery config with 'celery.override' in 'app.yaml':\n%s",
         override_str,
     )
-    app.conf.update(**override_dict)
+    celery_app.conf.update(**override_dict)
+
+
+def create_app() -> Celery:
+    """
+    Build a new, fully configured merlin celery application.
+
+    This wires up encrypted results backend traffic, resolves the broker and
+    results backend from app.yaml, applies merlin's celery defaults and any
+    user overrides, and registers merlin's tasks.
+
+    :return: The configured celery application
+    :rtype: Celery
+    """
+    # pylint: disable=import-outside-toplevel
+    import merlin.common.security.encrypt_backend_traffic
+    from merlin.config.configfile import CONFIG
+    from merlin.config.utils import Priority, get_priority
+
+    merlin.common.security.encrypt_backend_traffic.set_backend_funcs()
+
+    broker_uri, results_backend_uri, broker_ssl, results_ssl = get_server_uris()
+
+    # initialize app with essential properties
+    celery_app: Celery = Celery(
+        "merlin",
+        broker=broker_uri,
+        backend=results_backend_uri,
+        broker_use_ssl=broker_ssl,
+        redis_backend_use_ssl=results_ssl,
+        task_routes=(route_for_task,),
+    )
+
+    # set task priority defaults to prioritize workflow tasks over task-expansion tasks
+    task_priority_defaults: Dict[str, Union[int, Priority]] = {
+        "task_queue_max_priority": 10,
+        "task_default_priority": get_priority(Priority.mid),
+    }
+    if CONFIG.broker.name.lower() == "redis":
+        celery_app.conf.broker_transport_options = {
+            "priority_steps": list(range(1, 11)),
+            "queue_order_strategy": "priority",
+        }
+    celery_app.conf.update(**task_priority_defaults)
+
+    # load merlin config defaults
+    celery_app.conf.update(**celeryconfig.DICT)
+
+    # load config overrides from app.yaml
+    apply_config_overrides(celery_app)
+
+    # release the step retries held in the results backend from every worker
+    celery_app.steps["worker"].add(RetryReleaser)
+
+    # auto-discover tasks
+    celery_app.autodiscover_tasks(["merlin.common"])
+    return celery_app
+
+
+def get_app() -> Celery:
+    """
+    Return the merlin celery application, building and caching it on first use.
+
+    Importing this module is cheap; the broker and results backend are only
+    configured once a task server operation actually asks for the app.
+
+    :return: The configured celery application
+    :rtype: Celery
+    """
+    global _APP  # pylint: disable=global-statement
+    if _APP is None:
+        _APP = create_app()
+    return _APP
+
 
-# auto-discover tasks
-app.autodiscover_tasks(["merlin.common"])
+# Lazy handle on the application so 'celery -A merlin' and existing
+# 'from merlin.celery import app' imports keep working.
+app: Celery = Proxy(get_app)
 
 
 # Pylint believes the args are unused, I believe they're used after decoration
 @worker_process_init.connect()
 def setup(**kwargs):  # pylint: disable=W0613
     """
-    Set affinity for the worker on startup (works on toss3 nodes)
+    Set affinity for the worker on startup, within the cpus the worker is
+    allowed to use, by the policy in CELERY_AFFINITY_POLICY (see merlin.common.affinity),
+    and enable core accounting (see merlin.common.resource_pool) in this prefork child.
 
     :param `**kwargs`: keyword arguments
     """
-    if "CELERY_AFFINITY" in os.environ and int(os.environ["CELERY_AFFINITY"]) > 1:
-        # Number of cpus between workers.
-        cpu_skip: int = int(os.environ["CELERY_AFFINITY"])
-        npu: int = psutil.cpu_count()
-        process: psutil.Process = psutil.Process()
+    mark_prefork_child()
+    if AFFINITY_ENV in os.environ or POLICY_ENV in os.environ:
         # pylint is upset that typing accesses a protected class, ignoring W0212
         # pylint is upset that billiard doesn't have a current_process() method - it does
         current: billiard.process._MainProcess = billiard.current_process()  # pylint: disable=W0212, E1101
         prefork_id: int = current._identity[0] - 1  # pylint: disable=W0212  # range 0:nworkers-1
-        cpu_slot: int = (prefork_id * cpu_skip) % npu
-        process.cpu_affinity(list(range(cpu_slot, cpu_slot + cpu_skip)))
+        try:
+            cpus: Optional[List[int]] = affinity_from_env(prefork_id)
+            if cpus:
+                LOG.debug(f"Pinning worker process {prefork_id} to cpus {cpus}")
+                psutil.Process().cpu_affinity(cpus)
+        except (ValueError, OSError, psutil.Error) as e:
+            # A bad setting or an unreadable topology should not take down the worker process.
+            LOG.warning(f"Not pinning worker process {prefork_id} to cpus: {e}")
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Topology-aware cpu affinity for the prefork children of celery workers.
+
+The cpus a worker may use are the affinity mask it was started with, which
+already reflects the cgroup cpuset and any binding from the batch launcher.
+Those cpus are grouped by NUMA domain (from /sys/devices/system/node) and by
+physical core (from the hyperthread siblings in /sys/devices/system/cpu), and
+each child is pinned by a policy:
+
+  - compact: consecutive blocks of cpus, filling the hyperthreads of a core
+    and the cores of a domain before moving on to the next one.
+  - scatter: children alternate between NUMA domains, and take one
+    hyperthread of each core before any core's siblings.
+  - numa: each child gets all the cpus of one NUMA domain.
+
+Pinning keeps the pages a step's threads touch first in the child's NUMA
+domain, since Linux allocates memory on the node of the touching cpu.
+
+The policy is chosen with the CELERY_AFFINITY_POLICY environment variable of
+the worker, and the number of cpus per child with CELERY_AFFINITY.
+"""
+import glob
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+
+LOG = logging.getLogger(__name__)
+
+AFFINITY_ENV = "CELERY_AFFINITY"
+POLICY_ENV = "CELERY_AFFINITY_POLICY"
+
+POLICIES = ("compact", "scatter", "numa")
+
+SYSFS = "/sys/devices/system"
+
+
+class Cpu(NamedTuple):
+    """A logical cpu and its place in the machine's topology."""
+
+    cpu: int
+    node: int
+    package: int
+    core: int
+    thread: int  # The cpu's rank among the hyperthreads of its core
+
+
+def parse_cpulist(cpulist: str) -> List[int]:
+    """
+    Return the cpus of a list in the kernel's format, e.g. '0-3,8,10-11'.
+
+    :param `cpulist`: The cpu list
+    """
+    cpus = []
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as _file:
+            return _file.read().strip()
+    except OSError:
+        return None
+
+
+def read_topology(allowed: Optional[Iterable[int]] = None, sysfs: str = SYSFS) -> List[Cpu]:
+    """
+    Return the allowed cpus with their NUMA domain, package, core and thread
+    rank. Missing topology files are treated as one domain of single-thread cores.
+
+    :param `allowed`: The cpus to place, defaults to this process's affinity mask
+    :param `sysfs`: The sysfs directory holding the 'node' and 'cpu' trees
+    """
+    allowed_set: Set[int] = set(os.sched_getaffinity(0) if allowed is None else allowed)
+
+    node_of: Dict[int, int] = {}
+    for node_dir in glob.glob(os.path.join(sysfs, "node", "node[0-9]*")):
+        cpulist = _read(os.path.join(node_dir, "cpulist"))
+        if cpulist is None:
+            continue
+        node = int(re.search(r"(\d+)$", node_dir).group(1))
+        for cpu in parse_cpulist(cpulist):
+            node_of[cpu] = node
+
+    cpus = []
+    for cpu in sorted(allowed_set):
+        topology_dir = os.path.join(sysfs, "cpu", f"cpu{cpu}", "topology")
+        package = _read(os.path.join(topology_dir, "physical_package_id"))
+        core = _read(os.path.join(topology_dir, "core_id"))
+        siblings = _read(os.path.join(topology_dir, "thread_siblings_list"))
+        sibling_cpus = parse_cpulist(siblings) if siblings else [cpu]
+        cpus.append(
+            Cpu(
+                cpu=cpu,
+                node=node_of.get(cpu, 0),
+                package=int(package) if package else 0,
+                core=int(core) if core else cpu,
+                thread=sibling_cpus.index(cpu) if cpu in sibling_cpus else 0,
+            )
+        )
+    return cpus
+
+
+def _block(cpus: List[Cpu], start: int, count: int) -> List[int]:
+    """Return count cpus from start, wrapping around the end of the list."""
+    return sorted({cpus[(start + i) % len(cpus)].cpu for i in range(min(count, len(cpus)))})
+
+
+def plan_affinity(topology: List[Cpu], child: int, cpus_per_child: int = 1, policy: str = "compact") -> List[int]:
+    """
+    Return the cpus for a prefork child under a policy. Children beyond the
+    capacity of the allowed cpus wrap around and share them.
+
+    :param `topology`: The allowed cpus, from read_topology
+    :param `child`: The index of the prefork child, from 0
+    :param `cpus_per_child`: The number of cpus for each child (compact and scatter)
+    :param `policy`: One of POLICIES
+    """
+    if not topology:
+        return []
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown affinity policy '{policy}', expected one of {', '.join(POLICIES)}")
+    cpus_per_child = max(cpus_per_child, 1)
+
+    if policy == "compact":
+        ordered = sorted(topology, key=lambda c: (c.node, c.package, c.core, c.thread, c.cpu))
+        return _block(ordered, child * cpus_per_child, cpus_per_child)
+
+    nodes: Dict[int, List[Cpu]] = {}
+    for cpu in topology:
+        nodes.setdefault(cpu.node, []).append(cpu)
+    node_ids = sorted(nodes)
+    node_cpus = nodes[node_ids[child % len(node_ids)]]
+    if policy == "numa":
+        return sorted(cpu.cpu for cpu in node_cpus)
+
+    # scatter: the first hyperthread of every core of the domain, then the second, ...
+    ordered = sorted(node_cpus, key=lambda c: (c.thread, c.package, c.core, c.cpu))
+    return _block(ordered, (child // len(node_ids)) * cpus_per_child, cpus_per_child)
+
+
+def affinity_from_env(child: int, environ=None, topology: Optional[List[Cpu]] = None) -> Optional[List[int]]:
+    """
+    Return the cpus a prefork child should be pinned to according to the
+    worker's environment, or None if it should not be pinned.
+
+    Pinning is enabled when CELERY_AFFINITY is more than 1 (as before the
+    policies were added, with the compact policy) or a policy is named.
+
+    :param `child`: The index of the prefork child, from 0
+    :param `environ`: The environment, defaults to os.environ
+    :param `topology`: The allowed cpus, defaults to read_topology()
+    """
+    environ = os.environ if environ is None else environ
+    cpus_per_child = int(environ.get(AFFINITY_ENV) or 1)
+    policy = environ.get(POLICY_ENV, "").strip().lower()
+    if not policy:
+        if cpus_per_child <= 1:
+            return None
+        policy = "compact"
+    if topology is None:
+        topology = read_topology()
+    return plan_affinity(topology, child, cpus_per_child, policy)
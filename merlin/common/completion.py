@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Completion counters for studies run without task results.
+
+When a study sets 'task_results: False' in its merlin resources, the step
+tasks are sent with ignore_result, so celery no longer stores a result (and
+its metadata) in the results backend for every sample. Chord bookkeeping for
+the sync points between step groups still goes through the backend.
+
+To keep track of progress, each step task instead increments a counter in a
+single hash per study on a redis results backend, with one field per step
+name and return code, e.g. 'hello:OK'. Other backends keep no counters;
+the MERLIN_FINISHED files in the step workspaces remain the durable record
+of which samples completed.
+"""
+import logging
+from typing import Dict, Optional
+
+
+LOG = logging.getLogger(__name__)
+
+COMPLETION_KEY = "merlin-completed:{}"
+
+# Time (in seconds) a counter hash lives after its latest update, when the
+# results backend does not set an expiry for results.
+DEFAULT_EXPIRY = 86400
+
+
+def completion_key(study_name: str) -> str:
+    """Return the name of the counter hash of a study."""
+    return COMPLETION_KEY.format(study_name)
+
+
+def _client(backend):
+    """Return the redis client of a results backend, or None if it is not redis."""
+    client = getattr(backend, "client", None)
+    if client is None or not hasattr(client, "hincrby"):
+        return None
+    return client
+
+
+def count_completion(backend, key: str, step_name: str, result_name: str) -> bool:
+    """
+    Increment the counter of a step name and return code in one round trip.
+
+    :param `backend`: The celery results backend
+    :param `key`: The counter hash, from completion_key
+    :param `step_name`: The name of the step that finished
+    :param `result_name`: The name of the step's ReturnCode
+    :return: True if the counter was incremented
+    """
+    client = _client(backend)
+    if client is None:
+        LOG.debug(f"The results backend keeps no completion counters for {key}.")
+        return False
+    expires: Optional[float] = getattr(backend, "expires", None)
+    with client.pipeline() as pipe:
+        pipe.hincrby(key, f"{step_name}:{result_name}", 1)
+        pipe.expire(key, int(expires or DEFAULT_EXPIRY))
+        pipe.execute()
+    return True
+
+
+def reset_completion(backend, key: str):
+    """Remove the counters of a previous run before a study is queued."""
+    client = _client(backend)
+    if client is not None:
+        client.delete(key)
+
+
+def get_completion_counts(backend, key: str) -> Dict[str, int]:
+    """
+    Return the counters of a study.
+
+    :param `backend`: The celery results backend
+    :param `key`: The counter hash, from completion_key
+    :return: dict of '<step name>:<return code>' to the number of tasks
+    """
+    client = _client(backend)
+    if client is None:
+        return {}
+    counts = client.hgetall(key)
+    return {
+        (field.decode() if isinstance(field, bytes) else field): int(count) for field, count in sorted(counts.items())
+    }
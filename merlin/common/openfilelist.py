@@ -43,21 +43,37 @@
 
   reads the concatenation of file1.txt, file2.txt, etc.
 
+    with OpenFileList(["file1.bin","file2.bin",...], "rb") as f :
+      f.seek(1024)
+      f.readinto(buf)         # fill buf from byte 1024 on, across files
+      for view in f.views() :
+        process(view)         # memory mapped contents of each file, no copies
+
   file methods supported :
 
-    f.read([bytes])
-    f.readlines([bytes])
-    f.readline([bytes])
+    f.read([size])
+    f.readinto(buffer)         (binary mode)
+    f.readlines([hint])
+    f.readline([size])
+    f.seek(offset[, whence])
     f.tell()
     f.close()
     f.__iter__()
 
-  TODO:
-    implement a seek method
+  and, to work on the contents without copying them :
+
+    f.views()                  memory maps of each file, in order, one at a time
+    f.view([start[, stop]])    bytes [start, stop) of the concatenation
+
+  Offsets are byte offsets into the concatenated files. As with a regular
+  text file, seek positions in text mode should come from tell().
 
 """
 
+import bisect
 import copy
+import mmap
+import os
 
 
 class OpenFileList:
@@ -69,94 +85,222 @@ class OpenFileList:
         return super(OpenFileList, cls).__new__(cls)
 
     def __init__(self, files, *v, **kw):
-        self.files = copy.copy(files)
+        self.filenames = copy.copy(files)
         self.argv, self.argkw = (v, kw)
-        if self.files:
-            self.fnnow = self.files.pop(0)
-            self.fnow = open(self.fnnow, *v, **kw) if files else None
-            self.atend = False
-        else:
-            self.fnnow = self.fnow = None
-            self.atend = True
+        mode = v[0] if v else kw.get("mode", "r")
+        self.binary = "b" in mode
+        self._empty = b"" if self.binary else ""
+        self._newline = b"\n" if self.binary else "\n"
+        self._starts = None  # Offset of each file in the concatenation, computed on demand.
+        self.fno = -1
+        self.fnnow = self.fnow = None
         self._tell = 0
+        self.atend = False
+        self.closed = False
+        self._open_file(0)
 
     def _errclosed(self):
         raise ValueError("I/O operation on closed file")
 
+    def _open_file(self, fno):
+        """Make file number fno the current file, or move to the end if there is none."""
+        if self.fnow is not None:
+            self.fnow.close()
+        self.fno = fno
+        if fno < len(self.filenames):
+            self.fnnow = self.filenames[fno]
+            self.fnow = open(self.fnnow, *self.argv, **self.argkw)
+            self.atend = False
+        else:
+            self.fnnow = self.fnow = None
+            self.atend = True
+
     def _tonext(self):
         if self.fnow is not None:
             self._tell += self.fnow.tell()
-            self.fnow.close()
-            if self.files:
-                self.fnnow = self.files.pop(0)
-                self.fnow = open(self.fnnow, *self.argv, **self.argkw)
-            else:
-                self.fnnow = self.fnow = None
-                self.atend = True
+            self._open_file(self.fno + 1)
+
+    @property
+    def starts(self):
+        """The offset of each file in the concatenation, with the total size last."""
+        if self._starts is None:
+            starts = [0]
+            for filename in self.filenames:
+                starts.append(starts[-1] + os.path.getsize(filename))
+            self._starts = starts
+        return self._starts
 
     def tell(self):
+        if self.closed:
+            self._errclosed()
         if self.fnow is None:
             return self._tell
         return self._tell + self.fnow.tell()
 
+    def seek(self, offset, whence=os.SEEK_SET):
+        if self.closed:
+            self._errclosed()
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += self.starts[-1]
+        elif whence != os.SEEK_SET:
+            raise ValueError(f"invalid whence ({whence})")
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        # The last file starting at or before offset, skipping empty files.
+        fno = bisect.bisect_right(self.starts, offset) - 1
+        if fno >= len(self.filenames):
+            self._open_file(len(self.filenames))
+            self._tell = self.starts[-1]
+            return self._tell
+        if fno != self.fno or self.fnow is None:
+            self._open_file(fno)
+        self._tell = self.starts[fno]
+        self.fnow.seek(offset - self._tell)
+        return offset
+
     def read(self, n=None):
-        if self.atend:
-            return ""
-        if self.fnow is None:
+        if self.closed:
             self._errclosed()
-        if n is None:
-            n = 1 << 32
-        s = ""
-        while n and (self.files or self.fnow is not None):
-            ns = self.fnow.read(n)
-            if ns:
-                n -= len(ns)
-                s += ns
+        if n is None or n < 0:
+            chunks = []
+            while self.fnow is not None:
+                chunks.append(self.fnow.read())
+                self._tonext()
+            return self._empty.join(chunks)
+        chunks = []
+        while n and self.fnow is not None:
+            chunk = self.fnow.read(n)
+            if chunk:
+                n -= len(chunk)
+                chunks.append(chunk)
             else:
                 self._tonext()
-        return s
+        return self._empty.join(chunks)
 
-    def readlines(self, b=None):
-        if self.atend:
-            return []
-        if self.fnow is None:
+    def readinto(self, buffer):
+        """Read into a preallocated, writable buffer; returns the number of bytes read."""
+        if self.closed:
             self._errclosed()
-        s = self.read(b)
-        if not s:
-            return []
-        if not s.endswith("\n"):
-            ch = ""
-            while ch != "\n":
-                ch = self.read(1)
-                if ch == "" or ch == "\n":
-                    break
-                s += ch
-            return s.split("\n")
-        else:
-            return s[:-1].split("\n")
+        if not self.binary:
+            raise ValueError("readinto requires a file list opened in binary mode")
+        view = memoryview(buffer).cast("B")
+        nread = 0
+        while nread < len(view) and self.fnow is not None:
+            count = self.fnow.readinto(view[nread:])
+            if count:
+                nread += count
+            else:
+                self._tonext()
+        return nread
 
     def readline(self, b=None):
-        if self.atend:
-            return []
-        if self.fnow is None:
-            return self._errclosed()
-        if b is None:
-            s = self.fnow.readline()
-        else:
-            s = self.fnow.readline(b)
-        if not s:
-            self._tonext()
-        return s
+        if self.closed:
+            self._errclosed()
+        if b is None or b < 0:
+            b = -1
+        # A line that is not newline terminated continues into the next file.
+        chunks = []
+        while b and self.fnow is not None:
+            chunk = self.fnow.readline(b)
+            if chunk:
+                chunks.append(chunk)
+                if chunk.endswith(self._newline):
+                    break
+                if b > 0:
+                    b -= len(chunk)
+            else:
+                self._tonext()
+        return self._empty.join(chunks)
+
+    def readlines(self, b=None):
+        if self.closed:
+            self._errclosed()
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if b is not None and 0 < b <= total:
+                break
+        return lines
 
     def __iter__(self):
-        while not self.atend:
-            yield self.readline()
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+    def _map(self, fno):
+        """
+        Return a read-only memory map of file number fno, or empty bytes for
+        an empty file, which cannot be mapped.
+        """
+        with open(self.filenames[fno], "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @staticmethod
+    def _unmap(view):
+        """Close a map from _map, unless it is still exported (then it is unmapped once released)."""
+        if isinstance(view, mmap.mmap):
+            try:
+                view.close()
+            except BufferError:
+                pass
+
+    def views(self):
+        """
+        Yield read-only memory maps of the files, in order; together they are
+        the concatenated contents. Empty files are empty bytes, as they cannot
+        be mapped. The files are mapped one at a time, and each map is closed
+        when the next one is requested, so only one file is held open.
+        """
+        if self.closed:
+            self._errclosed()
+        for fno in range(len(self.filenames)):
+            view = self._map(fno)
+            try:
+                yield view
+            finally:
+                self._unmap(view)
+
+    def view(self, start=0, stop=None):
+        """
+        Return bytes [start, stop) of the concatenated files from their memory
+        maps: a zero copy memoryview when the range lies in a single file, and
+        the joined bytes otherwise. Only the files the range spans are mapped.
+        """
+        if self.closed:
+            self._errclosed()
+        total = self.starts[-1]
+        stop = total if stop is None else min(stop, total)
+        start = min(max(start, 0), stop)
+        if start == stop:
+            return b""
+        first = bisect.bisect_right(self.starts, start) - 1
+        last = max(bisect.bisect_left(self.starts, stop) - 1, first)
+        if first == last:
+            # The map lives as long as the memoryview over it.
+            return memoryview(self._map(first))[start - self.starts[first] : stop - self.starts[first]]
+        pieces = []
+        for fno in range(first, last + 1):
+            lo = max(start, self.starts[fno]) - self.starts[fno]
+            hi = min(stop, self.starts[fno + 1]) - self.starts[fno]
+            view = self._map(fno)
+            with memoryview(view) as piece:
+                pieces.append(bytes(piece[lo:hi]))
+            self._unmap(view)
+        return b"".join(pieces)
 
     def close(self):
         if self.fnow is not None:
             self.fnow.close()
-        self.files = []
         self.atend = True
+        self.closed = True
         self.fnow = self.fnnow = None
 
     def __enter__(self):
@@ -35,9 +35,11 @@ smallnpylib
 
 A simple library to read the .npy file header and return a dict
 containing the header from the .npy file as well as a few other
-keys. Also provides the OpenNPY class which is a way of seeking
-into .npy files without using the memory mapping functionality
-in the load function. Finally, there is the OpenNPYList class
+keys. Headers are parsed with numpy's own .npy format reader and
+cached by path until the file changes. Also provides the OpenNPY
+class which is a way of seeking into .npy files without loading
+them; strided slices and index arrays are gathered through a
+memory map of the file. Finally, there is the OpenNPYList class
 which opens a list of OpenNPY files and allows for random
 access among all of them.
 
@@ -63,7 +65,9 @@ access among all of them.
    with OpenNPY("myfile.npy") as a :
      print a[5]         # print row number 5
      print a[1:4]       # print rows from 1,2,3
+     print a[::10]      # print every tenth row
      my_array = a.to_array();
+     view = a.as_memmap()   # read-only memory map of the array
      print len(a)       # number of rows in file
      for i in a :
        print i          # print all the rows in a
@@ -73,7 +77,10 @@ access among all of them.
    with OpenNPYList(["myfile1.npy","myfile2.npy",...]) as a :
      print a[5]         # print row number 5
      print a[1:4]       # print rows from 1,2,3
-     my_array = a.to_array();
+     print a[[7,2,9]]   # print rows 7, 2 and 9
+     my_array = a.to_array();   # files are read in parallel
+     for batch in a.iter_batches(1000) :
+       print batch.shape  # stream the rows 1000 at a time
      print len(a)       # number of rows in file
      for i in a :
        print i          # print all the rows in a
@@ -81,98 +88,80 @@ access among all of them.
      print a.dtype      # dtype of array
 
 """
-from typing import List, Tuple
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 import numpy as np
 
 
 try:
     unistr = (unicode, str)
-    npy_magic = "\x93NUMPY"
 except NameError:
     unistr = str
-    npy_magic = b"\x93NUMPY"
 
 
-def _get_npy_info2(f):
-    if isinstance(f, unistr):
-        f = open(f, "rb")
-    magic = f.read(6)  # must be .npy file
-    assert magic == npy_magic  # must be .npy file or ELSE
-    major, _ = list(map(ord, f.read(2)))
-    if major == 1:
-        hlen_char = list(map(ord, f.read(2)))
-        hlen = hlen_char[0] + 256 * hlen_char[1]
-    elif major == 2:
-        hlen_char = list(map(ord, f.read(4)))
-        # fmt: off
-        hlen = (
-            hlen_char[0]
-            + 256 * hlen_char[1]
-            + 65536 * hlen_char[2]
-            + (1 << 24) * hlen_char[3]
-        )
-        # fmt: on
-    else:
-        raise Exception("unknown .npy format, e.g. not 1 or 2")
-    hdr = eval(f.read(hlen))  # TODO remove eval
-    hdr["dtype"] = np.dtype(hdr["descr"])
-    hdr["offset"] = f.tell()  # location of data start
-    hdr["itemsize"] = np.dtype(hdr["descr"]).itemsize
-    hdr["rowsize"] = hdr["itemsize"] * np.product(hdr["shape"][1:])
-    hdr["items"] = np.product(hdr["shape"])
-    hdr["size"] = hdr["itemsize"] * hdr["items"]
-    return f, hdr
+# Number of .npy headers kept in the header cache.
+HEADER_CACHE_SIZE = 4096
 
+# Most bytes of rows an OpenNPYList iterator holds in memory at once.
+ITER_BATCH_BYTES = 1 << 24
 
-def _get_npy_info3(f):
-    if isinstance(f, unistr):
-        f = open(f, "rb")
-    magic = f.read(6)  # must be .npy file
-    assert magic == npy_magic  # must be .npy file or ELSE
-    major, _ = list(f.read(2))
-    if major == 1:
-        hlen_char = list(f.read(2))
-        hlen = hlen_char[0] + 256 * hlen_char[1]
-    elif major == 2:
-        hlen_char = list(f.read(4))
-        # fmt: off
-        hlen = (
-            hlen_char[0]
-            + 256 * hlen_char[1]
-            + 65536 * hlen_char[2]
-            + (1 << 24) * hlen_char[3]
-        )
-        # fmt: on
+
+def _read_npy_header(f):
+    """
+    Parse the header of the open .npy file f with numpy's own format reader,
+    leaving f positioned at the start of the data.
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
     else:
         raise Exception("unknown .npy format, e.g. not 1 or 2")
-    hdr = eval(f.read(hlen))  # TODO remove eval
-    hdr["dtype"] = np.dtype(hdr["descr"])
-    hdr["offset"] = f.tell()  # location of data start
-    hdr["itemsize"] = np.dtype(hdr["descr"]).itemsize
-    hdr["rowsize"] = hdr["itemsize"] * np.product(hdr["shape"][1:])
-    hdr["items"] = np.product(hdr["shape"])
+    hdr = {
+        "shape": shape,
+        "fortran_order": fortran_order,
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "dtype": dtype,
+        "offset": f.tell(),  # location of data start
+        "itemsize": dtype.itemsize,
+    }
+    hdr["rowsize"] = hdr["itemsize"] * int(np.prod(shape[1:]))
+    hdr["items"] = int(np.prod(shape))
     hdr["size"] = hdr["itemsize"] * hdr["items"]
-    return f, hdr
+    return hdr
 
 
-def _get_npy_info(f):
-    d = None
-    try:
-        d = _get_npy_info2(f)
-    except TypeError:
-        d = _get_npy_info3(f)
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def _cached_npy_header(path, mtime_ns, size):  # pylint: disable=unused-argument
+    """Parse the header of the .npy file at path; the modification time and size key the cache."""
+    with open(path, "rb") as f:
+        return _read_npy_header(f)
 
-    return d
+
+def _get_npy_info(f):
+    """
+    Return the open file and the header of the .npy file f, a path or an open
+    binary file. Headers read by path are cached until the file changes.
+    """
+    if isinstance(f, unistr):
+        path = os.path.abspath(f)
+        f = open(path, "rb")
+        stat = os.fstat(f.fileno())
+        hdr = dict(_cached_npy_header(path, stat.st_mtime_ns, stat.st_size))
+        f.seek(hdr["offset"])
+    else:
+        hdr = _read_npy_header(f)
+    return f, hdr
 
 
 def get_npy_info(f):
-    try:
-        d = _get_npy_info2(f)
-    except TypeError:
-        d = _get_npy_info3(f)
-    d[0].close()
-    return d[1]
+    f, hdr = _get_npy_info(f)
+    f.close()
+    return hdr
 
 
 def read_items(f, hdr, idx, n=-1, sep=""):
@@ -193,6 +182,27 @@ def read_rows(f, hdr, idx, n=-1, sep=""):
     return np.reshape(a, (n,) + hdr["shape"][1:])
 
 
+def read_rows_into(f, hdr, idx, out):
+    """
+    Read len(out) rows starting at row idx straight into the preallocated
+    array out, without an intermediate copy when out is C-contiguous and of
+    the file's dtype.
+    """
+    n = len(out)
+    if not out.flags.c_contiguous or out.dtype != hdr["dtype"] or hdr["fortran_order"]:
+        out[...] = read_rows(f, hdr, idx, n)
+        return out
+    f.seek(hdr["offset"] + idx * hdr["rowsize"])
+    buf = memoryview(out.reshape(-1).view(np.uint8))
+    nread = 0
+    while nread < len(buf):
+        count = f.readinto(buf[nread:])
+        if not count:
+            raise ValueError(f"{getattr(f, 'name', 'file')} ends before row {idx + n}")
+        nread += count
+    return out
+
+
 def verify_open(func):  # A wrapper function used by FileSamples.
     """
     :param func: (function) a class instance method that needs to call
@@ -209,15 +219,17 @@ def verify_open(func):  # A wrapper function used by FileSamples.
 class OpenNPY:
     def __init__(self, f):
         self.hdr = self.f = None
+        self.memmap = None
         if isinstance(f, unistr):
             self.fname = f
         else:
+            self.fname = getattr(f, "name", None)
             self.f = f
-            self._verify_open()
+            self.hdr = _read_npy_header(f)
 
     def _verify_open(self):
         if self.f is None:
-            self.f, self.hdr = _get_npy_info(self.f if self.f is not None else self.fname)
+            self.f, self.hdr = _get_npy_info(self.fname)
 
     @verify_open
     def load_header(self, close=True):
@@ -229,6 +241,7 @@ class OpenNPY:
         if self.f is not None:
             self.f.close()
             self.f = None
+        self.memmap = None
 
     def __del__(self):
         self.close()
@@ -251,21 +264,43 @@ class OpenNPY:
 
     dtype = property(fget=_dtype)
 
+    def as_memmap(self):
+        """
+        Return a read-only memory map of the array, built from the cached
+        header rather than reparsing the file.
+        """
+        if self.memmap is None:
+            if self.hdr is None:
+                self._verify_open()
+            self.memmap = np.memmap(
+                self.fname if self.fname is not None else self.f,
+                dtype=self.hdr["dtype"],
+                mode="r",
+                offset=self.hdr["offset"],
+                shape=self.hdr["shape"],
+                order="F" if self.hdr["fortran_order"] else "C",
+            )
+        return self.memmap
+
     @verify_open
     def __getitem__(self, k):
-        if isinstance(k, int):
-            return read_rows(self.f, self.hdr, k, 1)[0]
-        elif isinstance(k, slice):
-            if k.step == 1 or k.step is None:
-                return read_rows(self.f, self.hdr, k.start, k.stop - k.start)
-            else:
-                return np.asarray(
-                    [read_rows(self.f, self.hdr, _, 1)[0] for _ in range(k.start, k.stop, 1 if k.step is None else k.step)]
-                )
+        if isinstance(k, (int, np.integer)):
+            rows = self.hdr["shape"][0]
+            if k < 0:
+                k += rows  # Negative indexing.
+            if k >= rows or k < 0:
+                raise IndexError("index %d is out of bounds" % k)
+            return read_rows(self.f, self.hdr, int(k), 1)[0]
+        if isinstance(k, slice):
+            start, stop, step = k.indices(self.hdr["shape"][0])
+            if step == 1:
+                return read_rows(self.f, self.hdr, start, max(stop - start, 0))
+        # Strided slices and index arrays are one gather from the memory map.
+        return np.array(self.as_memmap()[k])
 
     @verify_open
     def __len__(self):
-        return self.hdr["items"]
+        return self.hdr["shape"][0]
 
     @verify_open
     def __iter__(self):
@@ -277,13 +312,25 @@ class OpenNPY:
         return read_rows(self.f, self.hdr, 0)
 
 
+def _load_npy(filename):
+    """Return an OpenNPY of filename with its header loaded and the file closed."""
+    npy = OpenNPY(filename)
+    npy.load_header()
+    return npy
+
+
 class OpenNPYList:
-    def __init__(self, filename_strs: List[str]):
+    def __init__(self, filename_strs: List[str], max_workers: Optional[int] = None):
+        """
+        :param `filename_strs`: The .npy files, in row order
+        :param `max_workers`: The number of threads used to read headers and
+            to fill arrays, defaults to the ThreadPoolExecutor default
+        """
         self.filenames: List[str] = filename_strs
-        self.files: List[OpenNPY] = [OpenNPY(file_str) for file_str in self.filenames]
-        i: OpenNPY
-        for i in self.files:
-            i.load_header()
+        self.max_workers: Optional[int] = max_workers
+        # Gather the headers concurrently; the reads are dominated by file system latency.
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            self.files: List[OpenNPY] = list(executor.map(_load_npy, self.filenames))
         self.shapes: List[Tuple[int]] = [openNPY_obj.hdr["shape"] for openNPY_obj in self.files]
         k: Tuple[int]
         for k in self.shapes[1:]:
@@ -292,6 +339,8 @@ class OpenNPYList:
                 raise AttributeError(f"Mismatch in subsequent axes shapes: {k[1:]} != {self.shapes[0][1:]}")
         self.tells: np.ndarray = np.cumsum([arr_shape[0] for arr_shape in self.shapes])  # Tell locations.
         self.tells = np.hstack(([0], self.tells))
+        self.dtype: np.dtype = np.result_type(*[openNPY_obj.hdr["dtype"] for openNPY_obj in self.files])
+        self.shape: Tuple[int] = (int(self.tells[-1]),) + tuple(self.shapes[0][1:])
 
     def close(self):
         for i in self.files:
@@ -301,27 +350,102 @@ class OpenNPYList:
         self.close()
 
     def __iter__(self):
-        for i in self.files:
-            for j in i:
-                yield j
+        # Read ahead in batches of at most ITER_BATCH_BYTES, rather than whole files.
+        row_bytes = int(np.prod(self.shape[1:], dtype=np.int64)) * self.dtype.itemsize
+        for batch in self.iter_batches(max(ITER_BATCH_BYTES // max(row_bytes, 1), 1)):
+            yield from batch
+
+    def iter_batches(self, batch_size: int):
+        """
+        Stream the rows as arrays of batch_size rows (the last may be shorter),
+        so consumers never hold more than one batch in memory.
+
+        :param `batch_size`: The number of rows per batch
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, not {batch_size}")
+        for start in range(0, len(self), batch_size):
+            yield self._read_range(start, min(start + batch_size, len(self)))
+
+    def _file_index(self, k):
+        """Return the numbers of the files holding the rows k (an int or array)."""
+        return np.searchsorted(self.tells, k, side="right") - 1
+
+    def _fill_from_file(self, fno, start, out):
+        """Read len(out) rows of file number fno, from its row start, into out."""
+        with open(self.filenames[fno], "rb") as f:
+            read_rows_into(f, self.files[fno].hdr, start, out)
+
+    def _read_range(self, start, stop):
+        """Read the contiguous rows [start, stop) with one read per file they span."""
+        out = np.empty((max(stop - start, 0),) + self.shape[1:], dtype=self.dtype)
+        if stop <= start:
+            return out
+        for fno in range(self._file_index(start), self._file_index(stop - 1) + 1):
+            lo = max(start, self.tells[fno])
+            hi = min(stop, self.tells[fno + 1])
+            if hi > lo:
+                self._fill_from_file(fno, lo - self.tells[fno], out[lo - start : hi - start])
+        return out
+
+    def _read_rows(self, k):
+        """
+        Read the rows at the indices in k, an integer array or a boolean mask
+        over the rows. Each file holding some of them is opened once, read in
+        runs of consecutive rows and closed again, so no descriptors are kept.
+        """
+        k = np.asarray(k)
+        if k.dtype == np.bool_:
+            if k.shape != (len(self),):
+                raise IndexError(f"boolean index of shape {k.shape} does not match {len(self)} rows")
+            k = np.flatnonzero(k)
+        k = k.astype(np.int64, copy=False)
+        k = np.where(k < 0, k + self.tells[-1], k)
+        if k.size and (k.min() < 0 or k.max() >= self.tells[-1]):
+            raise IndexError(f"index out of bounds for {self.tells[-1]} rows")
+        out = np.empty(k.shape + self.shape[1:], dtype=self.dtype)
+        fnos = self._file_index(k)
+        for fno in np.unique(fnos):
+            selected = fnos == fno
+            rows, inverse = np.unique(k[selected] - self.tells[fno], return_inverse=True)
+            found = np.empty((len(rows),) + self.shape[1:], dtype=self.dtype)
+            # Split the sorted rows into runs of consecutive rows, one read each.
+            breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+            with open(self.filenames[fno], "rb") as f:
+                for lo, hi in zip(np.hstack(([0], breaks)), np.hstack((breaks, [len(rows)]))):
+                    read_rows_into(f, self.files[fno].hdr, int(rows[lo]), found[lo:hi])
+            out[selected] = found[inverse.reshape(-1)]
+        return out
 
     def __getitem__(self, k):
-        if isinstance(k, int):
+        if isinstance(k, (int, np.integer)):
             if k < 0:
                 k = self.tells[-1] + k  # Negative indexing.
-            if k >= self.tells[-1]:
+            if k >= self.tells[-1] or k < 0:
                 raise IndexError("index %d is out of bounds" % k)
-            fno = (self.tells > k).argmax()
-            return self.files[fno - 1][k - self.tells[fno - 1]]
-        else:  # Slice indexing.
-            # TODO : Implement a faster version.
-            return np.asarray([self[_] for _ in np.arange(k.start, k.stop, k.step if k.step is not None else 1)])
+            return self._read_range(k, k + 1)[0]
+        if isinstance(k, slice):
+            start, stop, step = k.indices(len(self))
+            if step == 1:
+                return self._read_range(start, stop)
+            return self._read_rows(np.arange(start, stop, step))
+        return self._read_rows(k)  # Array (fancy) indexing.
 
     def to_array(self):
-        return np.vstack([_.to_array() for _ in self.files])
+        """Read all the rows into one preallocated array, filling it from the files in parallel."""
+        out = np.empty(self.shape, dtype=self.dtype)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._fill_from_file, fno, 0, out[self.tells[fno] : self.tells[fno + 1]])
+                for fno in range(len(self.files))
+                if self.tells[fno + 1] > self.tells[fno]
+            ]
+            for future in futures:
+                future.result()
+        return out
 
     def __len__(self):
-        return self.tells[-1]
+        return int(self.tells[-1])
 
     def __enter__(self):
         return self
@@ -336,11 +460,11 @@ __all__ = [
     "unistr",
     "read_items",
     "read_rows",
+    "read_rows_into",
     "get_npy_info",
 ]
 
 if __name__ == "__main__":
-    import os
     import sys
     import unittest
     import uuid
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Bulk publishing of the tasks an expansion task adds to its chord.
+
+Celery's Task.add_to_chord bumps the chord's counter in the results backend
+and then publishes the new task, checking a producer out of the pool, for
+every signature. An expansion task adding thousands of children makes two
+broker and backend round trips per child that way.
+
+publish_to_chord instead publishes all of the signatures through a single
+producer (one connection and channel), and on a redis results backend bumps
+the chord counter once per batch of PUBLISH_BATCH_SIZE signatures, ahead of
+publishing that batch. With a 'confirm_publish' broker transport option, the
+publisher confirms are still waited on message by message.
+"""
+import logging
+from itertools import islice
+from typing import Iterable
+
+
+LOG = logging.getLogger(__name__)
+
+# The number of signatures counted in the chord per backend round trip.
+PUBLISH_BATCH_SIZE = 1000
+
+
+def batched(iterable: Iterable, size: int):
+    """Yield lists of up to size items of iterable."""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def extend_chord(backend, group_id: str, results: list) -> None:
+    """
+    Count results as members of the chord of group_id, with a single
+    increment of the chord counter on a redis results backend.
+
+    :param `backend`: The celery results backend
+    :param `group_id`: The id of the chord's header group
+    :param `results`: The AsyncResults of the new members
+    """
+    client = getattr(backend, "client", None)
+    if client is not None and hasattr(client, "incrby") and hasattr(backend, "get_key_for_group"):
+        client.incrby(backend.get_key_for_group(group_id, ".t"), len(results))
+        return
+    for result in results:
+        backend.add_to_chord(group_id, result)
+
+
+def publish(app, signatures: Iterable, producer=None) -> int:
+    """
+    Publish signatures through one producer.
+
+    :param `app`: The celery app
+    :param `signatures`: The signatures to send
+    :param `producer`: (Optional) The producer to use; one is checked out of
+        the app's pool if not given
+    :return: The number of signatures published
+    """
+    count = 0
+    with app.producer_or_acquire(producer) as shared_producer:
+        for sig in signatures:
+            sig.apply_async(producer=shared_producer)
+            count += 1
+    return count
+
+
+def join_chord(task, signatures: list) -> list:
+    """
+    Make signatures members of the chord the running task is a member of,
+    counted in the chord but not yet published.
+
+    :param `task`: The bound task, a member of a chord
+    :param `signatures`: The signatures to add
+    :return: The AsyncResults of the signatures
+    """
+    request = task.request
+    if not request.chord:
+        raise ValueError("Current task is not member of any chord")
+    results = []
+    for sig in signatures:
+        sig.set(
+            group_id=request.group,
+            group_index=request.group_index,
+            chord=request.chord,
+            root_id=request.root_id,
+        )
+        results.append(sig.freeze())
+    extend_chord(task.backend, request.group, results)
+    return results
+
+
+def publish_to_chord(task, signatures: Iterable, batch_size: int = PUBLISH_BATCH_SIZE) -> int:
+    """
+    Add signatures to the chord the running task is a member of and publish
+    them, or run them in order if the task is running eagerly.
+
+    :param `task`: The bound task, a member of a chord
+    :param `signatures`: The signatures to add
+    :param `batch_size`: The number of signatures to count in the chord
+        per backend round trip
+    :return: The number of signatures published
+    """
+    request = task.request
+    if request.is_eager:
+        count = 0
+        for sig in signatures:
+            sig.delay()
+            count += 1
+        return count
+    if not request.chord:
+        raise ValueError("Current task is not member of any chord")
+
+    count = 0
+    with task.app.producer_or_acquire() as producer:
+        for batch in batched(signatures, batch_size):
+            join_chord(task, batch)
+            count += publish(task.app, batch, producer=producer)
+    LOG.debug(f"published {count} tasks to chord {request.group}")
+    return count
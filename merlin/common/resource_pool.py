@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Core accounting between the processes of one celery worker.
+
+A worker launched with the MERLIN_WORKER_CORES environment variable (set from
+the 'cores' entry of the worker in the spec) has that many cores to share
+between its steps. Before it runs a step, merlin_step reserves the cores the
+step declares (its procs per node times its cores per task) and waits while
+they are not available, so steps of mixed sizes pack the node without
+oversubscribing it. Workers should then be given a --concurrency above their
+core budget, so that small steps can fill the cores left by large ones.
+
+The prefork children of a worker share a small ledger file, locked with
+flock, in the system's temporary directory; reservations of processes that
+died are dropped. Processes waiting for cores are served first come, first
+served, so a large step is not starved by smaller ones that would fit in the
+cores it waits for. A step needing more cores than the budget runs once it
+has the worker to itself.
+
+The ledger is keyed by process, so cores are only accounted for in the
+children of the prefork pool; workers with the threads, gevent, eventlet or
+solo pools run their steps without reservations.
+"""
+import fcntl
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import psutil
+
+
+LOG = logging.getLogger(__name__)
+
+CORES_ENV = "MERLIN_WORKER_CORES"
+
+# Longest time (in seconds) between checks for free cores.
+MAX_POLL_INTERVAL = 2.0
+
+
+def worker_cores(environ=None) -> Optional[int]:
+    """
+    Return the core budget of this worker, or None if it does not account for cores.
+    'auto' is the number of cpus the worker may use.
+
+    :param `environ`: The environment, defaults to os.environ
+    """
+    value = (os.environ if environ is None else environ).get(CORES_ENV, "").strip().lower()
+    if not value:
+        return None
+    if value == "auto":
+        return len(os.sched_getaffinity(0))
+    return max(int(value), 1)
+
+
+class CorePool:
+    """
+    A budget of cores shared by the processes of a worker through a ledger file.
+
+    :example:
+
+    >>> pool = CorePool(36)
+    >>> with pool.reserve(8):
+    ...     run_step()
+    """
+
+    def __init__(self, cores: int, path: Optional[str] = None):
+        """
+        :param `cores`: The number of cores to share
+        :param `path`: The ledger file, defaults to one per worker (the parent
+            process of the prefork children) in the temporary directory
+        """
+        self.cores = cores
+        if path is None:
+            path = os.path.join(tempfile.gettempdir(), f"merlin-cores-{socket.gethostname()}-{os.getppid()}.json")
+        self.path = path
+
+    @contextmanager
+    def _ledger(self):
+        """
+        Yield the ledger under an exclusive lock, saving changes on exit: the
+        cores held by pid ('held') and the pids waiting for cores, in the
+        order they started waiting ('waiting').
+        """
+        with open(self.path, "a+") as ledger_file:
+            fcntl.flock(ledger_file, fcntl.LOCK_EX)
+            try:
+                ledger_file.seek(0)
+                try:
+                    ledger = json.loads(ledger_file.read() or "{}")
+                except ValueError:
+                    ledger = {}
+                held: Dict[str, int] = ledger.get("held", {})
+                waiting: List[str] = ledger.get("waiting", [])
+                before = {"held": dict(held), "waiting": list(waiting)}
+                # Drop the reservations and places in line of processes that died.
+                for pid in [pid for pid in held if not psutil.pid_exists(int(pid))]:
+                    del held[pid]
+                waiting[:] = [pid for pid in waiting if psutil.pid_exists(int(pid))]
+                ledger = {"held": held, "waiting": waiting}
+                yield ledger
+                if ledger != before:
+                    ledger_file.seek(0)
+                    ledger_file.truncate()
+                    json.dump(ledger, ledger_file)
+                    ledger_file.flush()
+            finally:
+                fcntl.flock(ledger_file, fcntl.LOCK_UN)
+
+    def try_acquire(self, cores: int, wait: bool = False) -> bool:
+        """
+        Reserve cores for this process if they are free and no process ahead
+        of it is waiting for cores; return whether it did.
+
+        :param `cores`: The number of cores to reserve
+        :param `wait`: Whether to join the line of waiting processes (or keep
+            this process's place in it) when the cores could not be reserved
+        """
+        pid = str(os.getpid())
+        with self._ledger() as ledger:
+            held, waiting = ledger["held"], ledger["waiting"]
+            ahead = waiting[: waiting.index(pid)] if pid in waiting else waiting
+            if not ahead and (sum(held.values()) + cores <= self.cores or not held):
+                held[pid] = cores
+                if pid in waiting:
+                    waiting.remove(pid)
+                return True
+            if wait and pid not in waiting:
+                waiting.append(pid)
+        return False
+
+    def release(self):
+        """Drop this process's reservation, or its place in the line of waiting processes."""
+        pid = str(os.getpid())
+        with self._ledger() as ledger:
+            ledger["held"].pop(pid, None)
+            if pid in ledger["waiting"]:
+                ledger["waiting"].remove(pid)
+
+    def acquire(self, cores: int):
+        """Wait in line until cores are free and reserve them for this process."""
+        delay = 0.05
+        try:
+            while not self.try_acquire(cores, wait=True):
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_POLL_INTERVAL)
+        except BaseException:
+            # Give up this process's place in line, e.g. when the task is revoked.
+            self.release()
+            raise
+
+    @contextmanager
+    def reserve(self, cores: int):
+        """Wait until cores are free, and hold them for the duration of the block."""
+        self.acquire(cores)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+_POOL: Optional[CorePool] = None
+
+# Whether this process is a child of a worker's prefork pool, set by merlin.celery on worker_process_init.
+_PREFORK_CHILD = False
+
+
+def mark_prefork_child():
+    """Record that this process is a child of a worker's prefork pool, where cores are accounted for."""
+    global _PREFORK_CHILD  # pylint: disable=global-statement
+    _PREFORK_CHILD = True
+
+
+@lru_cache(maxsize=None)
+def _warn_not_prefork():
+    """Warn, once per process, that cores are not accounted for outside the prefork pool."""
+    LOG.warning(f"{CORES_ENV} is only supported by the prefork pool; running steps without core reservations.")
+
+
+def get_core_pool() -> Optional[CorePool]:
+    """
+    Return the core pool of this worker process, or None if the worker does
+    not account for cores or does not run its tasks in a prefork pool.
+    """
+    global _POOL  # pylint: disable=global-statement
+    if _POOL is None:
+        cores = worker_cores()
+        if cores is None:
+            return None
+        if not _PREFORK_CHILD:
+            _warn_not_prefork()
+            return None
+        _POOL = CorePool(cores)
+    return _POOL
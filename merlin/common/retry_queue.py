@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+A retry queue for step tasks, held in the results backend.
+
+Celery's Task.retry re-sends a task with a countdown: the broker delivers it
+right away and a worker holds it in memory until it is due, where it counts
+against the worker's prefetch. When many steps ask to be retried at once,
+they come back at once too.
+
+Instead, merlin_step adds the signature of a step it retries to a sorted set
+of its queue on a redis results backend, scored by the time it is due, after
+an exponential backoff with jitter capped by the step's max_retry_delay.
+Every merlin worker runs a RetryReleaser that moves the retries that are due
+back to the queues the worker consumes from, and purging a queue also drops
+its retries. Without a redis results backend, steps fall back to Task.retry
+with the same backoff.
+"""
+import logging
+import random
+import time
+from typing import Iterable, Optional
+
+from celery import bootsteps, signature
+
+from merlin.common.publishing import publish
+
+
+LOG = logging.getLogger(__name__)
+
+RETRY_KEY = "merlin-retries:{}"
+
+# Seconds between each worker's checks for retries that are due.
+RELEASE_INTERVAL = 1.0
+
+# The most retries released per round trip to the results backend.
+RELEASE_BATCH_SIZE = 100
+
+
+def backoff_delay(base: float, retries: int, cap: float, rng: Optional[random.Random] = None) -> float:
+    """
+    Return the delay before a retry, drawn uniformly between base and
+    base * 2**retries, which is capped at cap.
+
+    :param `base`: The step's retry_delay, the delay of its first retry
+    :param `retries`: The number of times the step was already retried
+    :param `cap`: The step's max_retry_delay
+    :param `rng`: (Optional) The random number generator to use
+    """
+    ceiling = min(cap, base * 2 ** min(retries, 64))
+    return (rng or random).uniform(min(base, ceiling), ceiling)
+
+
+def retry_key(queue: str) -> str:
+    """Return the name of the sorted set holding the retries of a queue."""
+    return RETRY_KEY.format(queue)
+
+
+def _client(backend):
+    """Return the redis client of a results backend, or None if it is not redis."""
+    client = getattr(backend, "client", None)
+    if client is None or not hasattr(client, "zadd"):
+        return None
+    return client
+
+
+def holds_retries(backend) -> bool:
+    """Whether the results backend can hold retries, i.e. whether it is redis."""
+    return _client(backend) is not None
+
+
+def schedule_retry(backend, sig, delay: float) -> bool:
+    """
+    Hold a task's signature in the retry queue until delay seconds from now.
+
+    :param `backend`: The celery results backend
+    :param `sig`: The signature of the retry, from Task.signature_from_request,
+        with the queue it is sent to in its options
+    :param `delay`: Seconds until the retry is due
+    :return: True if the retry was queued, False if the backend is not redis
+    """
+    client = _client(backend)
+    if client is None:
+        return False
+    queue = sig["options"]["queue"]
+    client.zadd(retry_key(queue), {backend.encode(dict(sig)): time.time() + delay})
+    return True
+
+
+def clear_retries(backend, queues: Iterable[str]) -> bool:
+    """
+    Drop the retries waiting to be sent to queues.
+
+    :param `backend`: The celery results backend
+    :param `queues`: The names of the queues
+    :return: True if the retries were dropped, False if the backend is not redis
+    """
+    client = _client(backend)
+    if client is None:
+        return False
+    keys = [retry_key(queue) for queue in queues]
+    if keys:
+        client.delete(*keys)
+    return True
+
+
+def release_due(
+    app,
+    backend=None,
+    now: Optional[float] = None,
+    limit: int = RELEASE_BATCH_SIZE,
+    queues: Optional[Iterable[str]] = None,
+) -> int:
+    """
+    Send up to limit retries that are due back to their queues. A retry is
+    only sent by the caller that removes it from the retry queue, so workers
+    can release concurrently.
+
+    :param `app`: The celery app
+    :param `backend`: (Optional) The results backend, defaults to the app's
+    :param `now`: (Optional) The current time
+    :param `limit`: The most retries to release
+    :param `queues`: (Optional) The queues to release retries to, defaults
+        to the queues the app consumes from
+    :return: The number of retries sent
+    """
+    backend = app.backend if backend is None else backend
+    client = _client(backend)
+    if client is None:
+        return 0
+    now = time.time() if now is None else now
+    queues = app.amqp.queues.consume_from if queues is None else queues
+    sigs = []
+    for queue in queues:
+        key = retry_key(queue)
+        due = client.zrangebyscore(key, "-inf", now, start=0, num=limit - len(sigs))
+        if not due:
+            continue
+        with client.pipeline() as pipe:
+            for member in due:
+                pipe.zrem(key, member)
+            claimed = pipe.execute()
+        sigs.extend(signature(backend.decode(member), app=app) for member, removed in zip(due, claimed) if removed)
+        if len(sigs) >= limit:
+            break
+    return publish(app, sigs) if sigs else 0
+
+
+class RetryReleaser(bootsteps.StartStopStep):
+    """
+    A worker bootstep that releases the retries that are due to the worker's
+    queues every RELEASE_INTERVAL seconds.
+    """
+
+    requires = {"celery.worker.components:Timer"}
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.tref = None
+
+    def start(self, parent):
+        self.tref = parent.timer.call_repeatedly(RELEASE_INTERVAL, self.release, (parent,), priority=10)
+
+    def stop(self, parent):
+        if self.tref is not None:
+            self.tref.cancel()
+            self.tref = None
+
+    @staticmethod
+    def release(parent):
+        """Release all of the retries that are due to the worker's queues."""
+        try:
+            while release_due(parent.app) == RELEASE_BATCH_SIZE:
+                pass
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.warning(f"Could not release due retries: {e}")
@@ -98,6 +98,30 @@ class SampleIndex:
         # The unique leaf ID of this node
         self.leafid = leafid
 
+        # Cached depths, relative to this node, at which leaves are found
+        # below it. Cleared when a sub tree is inserted below this node.
+        self._leaf_depths = None
+
+    @property
+    def leaf_depths(self):
+        """
+        The set of depths, relative to this node, at which there are leaves
+        below it: {0} for a leaf, {1} for the direct parent of leaves only.
+        """
+        if self._leaf_depths is None:
+            if self.is_leaf:
+                self._leaf_depths = frozenset((0,))
+            else:
+                self._leaf_depths = frozenset(
+                    depth + 1 for child_val in self.children.values() for depth in child_val.leaf_depths
+                )
+        return self._leaf_depths
+
+    @property
+    def height(self):
+        """The number of levels between this node and its deepest leaf."""
+        return max(self.leaf_depths)
+
     @property
     def is_leaf(self):
         """Returns whether this is a leaf in the graph"""
@@ -111,34 +135,19 @@ class SampleIndex:
     @property
     def is_parent_of_leaf(self):
         """Returns whether this is the direct parent of a leaf in the graph"""
-        if not self.is_directory:
-            return False
-        for child_val in self.children.values():
-            if child_val.is_leaf:
-                return True
-        return False
+        return 1 in self.leaf_depths
 
     @property
     def is_grandparent_of_leaf(self):
         """Returns whether this is the parent of a parent of a leaf in the graph"""
-        if not self.is_directory:
-            return False
-        for child_val in self.children.values():
-            if child_val.is_parent_of_leaf:
-                return True
-        return False
+        return 2 in self.leaf_depths
 
     @property
     def is_great_grandparent_of_leaf(self):
         """Returns whether this is the parent of a parent of a leaf in the graph"""
-        if not self.is_directory:
-            return False
-        for child_val in self.children.values():
-            if child_val.is_grandparent_of_leaf:
-                return True
-        return False
+        return 3 in self.leaf_depths
 
-    def traverse(self, path=None, conditional=lambda c: True, bottom_up=True, top_level=True):
+    def traverse(self, path=None, conditional=lambda c: True, bottom_up=True, descend=None):
         """
         Yield the full path and associated node for each node that meets the
         conditional
@@ -148,28 +157,30 @@ class SampleIndex:
 
         param:bottom_up: If True, yield leaves of the tree first. Otherwise,
             yield top level nodes first.
-        param:top_level: used to allow filtering of yielded values based off
-            the conditional. Should only be set to False internally for the
-            recursive calls.
+        param:descend: An optional lambda that takes a SampleIndex and returns
+            False for nodes whose sub trees should not be visited at all.
         """
         if path is None:
             path = self.name
 
-        if not bottom_up and conditional(self):
-            yield path, self
-
-        for child_val in self.children.values():
-            child_path = os.path.join(path, child_val.name)
-            for node in child_val.traverse(child_path, conditional, bottom_up=bottom_up, top_level=False):
-                if node != "SKIP ME":
-                    yield node
-
-        if bottom_up and conditional(self):
-            yield path, self
-
-        # Always yield something, unless this is the end of the recursion.
-        if not top_level:
-            yield "SKIP ME"
+        # An explicit stack of (path, node, children_visited) entries, with
+        # children pushed in reverse so they are visited in order.
+        stack = [(path, self, False)]
+        while stack:
+            node_path, node, children_visited = stack.pop()
+            if children_visited:
+                if conditional(node):
+                    yield node_path, node
+                continue
+
+            if not bottom_up and conditional(node):
+                yield node_path, node
+            elif bottom_up:
+                stack.append((node_path, node, True))
+
+            for child_val in reversed(list(node.children.values())):
+                if descend is None or descend(child_val):
+                    stack.append((os.path.join(node_path, child_val.name), child_val, False))
 
     def traverse_all(self, bottom_up=True):
         """
@@ -189,7 +200,22 @@ class SampleIndex:
         Returns a generator that will traverse all Directories in the
         SampleIndex.
         """
-        return self.traverse(path=self.name, conditional=lambda c: c.is_directory, bottom_up=bottom_up)
+        return self.traverse(
+            path=self.name, conditional=lambda c: c.is_directory, bottom_up=bottom_up, descend=lambda c: c.is_directory
+        )
+
+    def traverse_height(self, height, bottom_up=True):
+        """
+        Returns a generator that will traverse the nodes in the SampleIndex
+        that have leaves exactly height levels below them, without visiting
+        the sub trees that are too short to hold any.
+        """
+        return self.traverse(
+            path=self.name,
+            conditional=lambda c: height in c.leaf_depths,
+            bottom_up=bottom_up,
+            descend=lambda c: c.height >= height,
+        )
 
     @staticmethod
     def check_valid_addresses_for_insertion(full_address, sub_tree):
@@ -213,6 +239,9 @@ class SampleIndex:
             # This should never happen.
             raise KeyError
 
+        # The sub tree lands below this node, which may change its leaves.
+        self._leaf_depths = None
+
         delete_me = None
         for child_val in list(self.children.values()):
             if full_address[0 : len(child_val.address)] == child_val.address:
@@ -31,9 +31,12 @@
 """
 SampleIndex factory methods
 """
+import os
+
 from parse import parse
 
 from merlin.common.sample_index import MAX_SAMPLE, SampleIndex
+from merlin.common.sample_index_file import SampleIndexFile
 from merlin.utils import cd
 
 
@@ -155,8 +158,16 @@ def create_hierarchy_from_max_sample(
 
 def read_hierarchy(path):
     """
-    TODO
+    Read a SampleIndex back from disk.
+
+    :param path: Either a binary sample index file, whose directory is taken
+        as the root of the index, or the root directory of a tree of
+        'sample_index.txt' files.
     """
+    if os.path.isfile(path):
+        with SampleIndexFile(path) as index_file:
+            return index_file.to_hierarchy(name=os.path.dirname(path))
+
     children = {}
     min_sample = MAX_SAMPLE
     max_sample = -MAX_SAMPLE
@@ -165,7 +176,7 @@ def read_hierarchy(path):
         with open("sample_index.txt", "r") as _file:
             token = _file.readline()
             while token:
-                parsed_token = parse("{type}:{ID}\tname:{name}\tsamples:[{min:d},{max:d})\n", token)
+                parsed_token = parse("{type}:{ID}\tname:{name}\tSAMPLES:[{min:d}, {max:d})\n", token)
                 if parsed_token["type"] == "DIR":
                     subhierarchy = read_hierarchy(parsed_token["name"])
                     subhierarchy.address = parsed_token["ID"]
@@ -0,0 +1,236 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+A single, binary, memory-mappable file holding a whole SampleIndex.
+
+The file starts with a fixed-width header, followed by a table with one
+fixed-width record per bundle (leaf) sorted by sample id, and a block of
+the bundles' paths and addresses:
+
+  header:  magic (8 bytes), version (u4), record size (u4), number of
+           records (u8), offset of the records (u8), offset of the strings
+           (u8), zero padded to HEADER_SIZE bytes.
+  records: min sample (i8), max sample (i8), leaf id (i8), offset of the
+           path in the strings (u8), path length (u4), address length (u4).
+  strings: for each record, its utf-8 path relative to the index root,
+           immediately followed by its address.
+
+Looking up the bundle of a sample id is a binary search over the mapped
+records, so post-processing tools can map sample ids to paths without
+reading the whole index or walking the sample directories.
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from merlin.common.sample_index import SampleIndex
+
+
+MAGIC = b"MRLNSIDX"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")
+HEADER_SIZE = 64
+RECORD_DTYPE = np.dtype(
+    [
+        ("min", "<i8"),
+        ("max", "<i8"),
+        ("leafid", "<i8"),
+        ("offset", "<u8"),
+        ("path_length", "<u4"),
+        ("address_length", "<u4"),
+    ]
+)
+
+
+def write_sample_index_file(sample_index, filepath):
+    """
+    Write a SampleIndex to a single binary index file.
+
+    :param sample_index: The SampleIndex to write.
+    :param filepath: The file to write.
+    :return: The number of bundles written.
+    """
+    # An empty index is a root without children, which is not a bundle.
+    bundles = sorted(
+        sample_index.traverse(path="", conditional=lambda c: c.is_leaf and c is not sample_index),
+        key=lambda bundle: bundle[1].min,
+    )
+    paths = [path.encode() for path, _ in bundles]
+    addresses = [node.address.encode() for _, node in bundles]
+    records = np.zeros(len(bundles), dtype=RECORD_DTYPE)
+    records["min"] = [node.min for _, node in bundles]
+    records["max"] = [node.max for _, node in bundles]
+    records["leafid"] = [node.leafid for _, node in bundles]
+    records["path_length"] = [len(path) for path in paths]
+    records["address_length"] = [len(address) for address in addresses]
+    lengths = records["path_length"].astype("<u8") + records["address_length"]
+    records["offset"][1:] = np.cumsum(lengths)[:-1]
+    strings = [b"".join(pair) for pair in zip(paths, addresses)]
+
+    table_offset = HEADER_SIZE
+    strings_offset = table_offset + records.nbytes
+    header = HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, len(records), table_offset, strings_offset)
+    with open(filepath, "wb") as _file:
+        _file.write(header.ljust(HEADER_SIZE, b"\0"))
+        _file.write(records.tobytes())
+        _file.write(b"".join(strings))
+    return len(records)
+
+
+class SampleIndexFile:
+    """
+    A read-only, memory-mapped view of a binary sample index file.
+
+    :example:
+
+    >>> with SampleIndexFile("sample_index.bin") as index:
+    ...     index.get_path_to_sample(123456)
+    '1/23/samples123456-123457.ext'
+    """
+
+    def __init__(self, filepath):
+        """
+        :param filepath: The index file to open.
+        """
+        self.filepath = filepath
+        with open(filepath, "rb") as _file:
+            if os.fstat(_file.fileno()).st_size < HEADER_SIZE:
+                raise ValueError(f"'{filepath}' is not a merlin sample index file")
+            self._map = mmap.mmap(_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, n_records, table_offset, strings_offset = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"'{filepath}' is not a merlin sample index file")
+        if version != VERSION or record_size != RECORD_DTYPE.itemsize:
+            self.close()
+            raise ValueError(f"Unsupported merlin sample index file version {version} in '{filepath}'")
+        self.records = np.frombuffer(self._map, dtype=RECORD_DTYPE, count=n_records, offset=table_offset)
+        self._strings_offset = strings_offset
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def min(self):
+        """The minimum sample id in the index."""
+        return int(self.records["min"][0]) if len(self) else 0
+
+    @property
+    def max(self):
+        """The maximum sample id (exclusive) in the index."""
+        return int(self.records["max"][-1]) if len(self) else 0
+
+    def find(self, sample_ids):
+        """
+        Find the records of the bundles holding the given sample ids.
+
+        :param sample_ids: A sample id, or an array of them.
+        :return: The index of the record for each sample id.
+        :raises KeyError: If a sample id is not in the index.
+        """
+        ids = np.asarray(sample_ids)
+        found = np.searchsorted(self.records["min"], ids, side="right") - 1
+        valid = (found >= 0) & (ids < self.records["max"][np.maximum(found, 0)])
+        if not np.all(valid):
+            missing = ids[~valid] if ids.ndim else ids
+            raise KeyError(f"Sample ids not in the index: {missing}")
+        return int(found) if found.ndim == 0 else found
+
+    def get_path(self, record):
+        """The path, relative to the index root, of the bundle of a record."""
+        _, _, _, offset, path_length, _ = self.records[record]
+        start = self._strings_offset + int(offset)
+        return self._map[start : start + int(path_length)].decode()
+
+    def get_address(self, record):
+        """The address of the bundle of a record."""
+        _, _, _, offset, path_length, address_length = self.records[record]
+        start = self._strings_offset + int(offset) + int(path_length)
+        return self._map[start : start + int(address_length)].decode()
+
+    def get_path_to_sample(self, sample_id, root=""):
+        """
+        Retrieves the file path to the bundle file with the sample_id of
+        interest.
+
+        :param sample_id: The sample id.
+        :param root: The path of the index root to prepend.
+        """
+        return os.path.join(root, self.get_path(self.find(sample_id)))
+
+    def to_hierarchy(self, name=""):
+        """
+        Rebuild the full SampleIndex held in the file.
+
+        :param name: The name (path) of the root of the index.
+        """
+        root = SampleIndex(self.min, self.max, {}, name, leafid=-1, num_bundles=len(self))
+        directories = {"": root}
+        strings = self._map[self._strings_offset :]
+        columns = [self.records[column].tolist() for column in ("min", "max", "leafid", "offset", "path_length")]
+        address_ends = (self.records["offset"] + self.records["path_length"] + self.records["address_length"]).tolist()
+        for i, (min_sample, max_sample, leafid, offset, path_length, address_end) in enumerate(zip(*columns, address_ends)):
+            parts = strings[offset : offset + path_length].decode().split("/")
+            address = strings[offset + path_length : address_end].decode()
+            address_parts = address.split(".")
+            # Addresses may carry a prefix from where the index sits in a larger one.
+            prefix = len(address_parts) - len(parts)
+            if i == 0:
+                root.address = ".".join(address_parts[:prefix])
+            parent = root
+            for depth in range(len(parts) - 1):
+                node_address = ".".join(address_parts[: prefix + depth + 1])
+                node = directories.get(node_address)
+                if node is None:
+                    node = SampleIndex(min_sample, max_sample, {}, parts[depth], address=node_address)
+                    parent.children[node_address] = node
+                    directories[node_address] = node
+                else:
+                    node.max = max(node.max, max_sample)
+                node.num_bundles += 1
+                parent = node
+            parent.children[address] = SampleIndex(min_sample, max_sample, {}, parts[-1], leafid=leafid, address=address)
+        return root
+
+    def close(self):
+        """Release the mapping of the file."""
+        self.records = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tback):
+        self.close()
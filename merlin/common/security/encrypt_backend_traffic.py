@@ -36,8 +36,6 @@ import celery.backends.base
 from merlin.common.security import encrypt
 
 
-encrypt.init_key()
-
 # remember what the original encode / decode are so we can call it in our
 # wrapper
 old_encode = celery.backends.base.Backend.encode
@@ -64,5 +62,6 @@ def set_backend_funcs():
     """
     Set the encode / decode to our own encrypt_encode / encrypt_decode.
     """
+    encrypt.init_key()
     celery.backends.base.Backend.encode = _encrypt_encode
     celery.backends.base.Backend.decode = _decrypt_decode
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Step templates, stored once per study instead of in every task message.
+
+Every sample's step task used to carry its whole step definition (name,
+description, run section with shell, batch settings and restart command)
+and the adapter config. expand_tasks_with_samples instead writes each step
+of a chain, with the adapter config, to a file in the study's
+merlin_info/step_templates directory named by the hash of its content. The
+step task of each sample carries a StepReference: the template's path and
+queue, and the sample's workspace and cmd substitutions. Workers load the
+templates through an LRU cache, so each is read about once per worker
+process.
+"""
+import hashlib
+import logging
+import os
+import pickle
+from copy import deepcopy
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+
+LOG = logging.getLogger(__name__)
+
+TEMPLATE_DIRNAME = "step_templates"
+
+# The number of templates each worker process keeps loaded.
+TEMPLATE_CACHE_SIZE = 128
+
+
+def write_step_template(directory: str, step, adapter_config: Dict) -> str:
+    """
+    Write a step and adapter config to a file named by the hash of their
+    content, unless it already exists.
+
+    :param `directory`: The directory of the study's templates
+    :param `step`: The Step
+    :param `adapter_config`: The adapter config to run the step with
+    :return: The path to the template
+    """
+    payload = pickle.dumps((step, adapter_config))
+    path = os.path.join(directory, hashlib.sha256(payload).hexdigest() + ".pkl")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as _file:
+            _file.write(payload)
+        os.replace(tmp_path, path)
+        LOG.debug(f"Wrote the template of step '{step.name()}' to '{path}'.")
+    return path
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def load_step_template(path: str) -> Tuple:
+    """
+    Load a template written by write_step_template. Templates are never
+    rewritten, so they are cached by path.
+
+    :return: The (Step, adapter config) of the template
+    """
+    with open(path, "rb") as _file:
+        return pickle.load(_file)
+
+
+class StepReference:
+    """
+    A step task's reference to a step template, with the changes made to it
+    for one sample.
+    """
+
+    def __init__(
+        self,
+        template: str,
+        queue: str,
+        workspace: Optional[str] = None,
+        cmd_replacement_pairs: Optional[List[Tuple[str, str]]] = None,
+    ):
+        """
+        :param `template`: The path to the step template
+        :param `queue`: The task queue of the step
+        :param `workspace`: (Optional) The workspace of the step, if not the template's
+        :param `cmd_replacement_pairs`: (Optional) Replacements to make in the
+            step's cmd and restart cmd
+        """
+        self.template = template
+        self.queue = queue
+        self.workspace = workspace
+        self.cmd_replacement_pairs = cmd_replacement_pairs
+        self.restart = False
+        self._resolved = None
+
+    def get_task_queue(self) -> str:
+        """Return the task queue of the step."""
+        return self.queue
+
+    def resolve(self) -> Tuple:
+        """
+        Build the step from its template. The step is kept, so a restart
+        flag set on it is sent along with retries of the task.
+
+        :return: The (Step, adapter config) to run
+        """
+        if self._resolved is None:
+            step, adapter_config = load_step_template(self.template)
+            step = step.clone_changing_workspace_and_cmd(
+                cmd_replacement_pairs=self.cmd_replacement_pairs, new_workspace=self.workspace
+            )
+            step.restart = self.restart
+            self._resolved = (step, deepcopy(adapter_config))
+        return self._resolved
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._resolved is not None:
+            state["restart"] = self._resolved[0].restart
+        state["_resolved"] = None
+        return state
+
+    def __repr__(self):
+        return f"StepReference({self.template!r}, workspace={self.workspace!r})"
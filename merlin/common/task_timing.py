@@ -0,0 +1,205 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Structured per-task timing for merlin_step.
+
+Each merlin_step records how long it spent in each phase of its execution
+(waiting in the queue, checking for MERLIN_FINISHED, setting up the
+workspace, writing the script and running it) together with the cpu time
+and peak memory of the step's child processes. The records are handed to a
+sink, which by default is chosen by the MERLIN_TASK_TIMING environment
+variable of the worker:
+
+  - unset or empty: timing records are discarded.
+  - "log": each record is logged at the INFO level.
+  - a directory: each worker process appends json lines to its own file,
+    <directory>/<hostname>.<pid>.jsonl, so no locking is needed.
+
+Any callable taking a record dict can be installed with set_sink.
+"""
+import json
+import logging
+import os
+import resource
+import socket
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+LOG = logging.getLogger(__name__)
+
+TIMING_ENV = "MERLIN_TASK_TIMING"
+
+# Message header stamped on merlin_step tasks when they are published, used
+# to compute the time each task waited in the queue.
+SENT_TIME_HEADER = "merlin_sent_time"
+
+_SINK: Optional[Callable[[Dict], None]] = None
+_SINK_CONFIGURED = False
+
+
+class TaskTimer:
+    """
+    Accumulates the durations of the named phases of one task.
+
+    :example:
+
+    >>> timer = TaskTimer()
+    >>> with timer.phase("setup_workspace"):
+    ...     step.mstep.setup_workspace()
+    >>> timer.record
+    {'setup_workspace': 0.0012}
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self._start_counter = time.perf_counter()
+        self.record: Dict = {}
+
+    @contextmanager
+    def phase(self, name: str, children: bool = False):
+        """
+        Time the enclosed block as the phase 'name'.
+
+        :param `name`: The name of the phase
+        :param `children`: Also record the cpu time (in seconds) and the max
+            resident set size (in kB on linux) of child processes that
+            finished during the phase. Note that the max rss is the largest
+            of any child of this worker process so far, not of this phase only.
+        """
+        if children:
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record[name] = self.record.get(name, 0.0) + time.perf_counter() - start
+            if children:
+                after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                self.record["child_cpu"] = (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime)
+                self.record["child_maxrss"] = after.ru_maxrss
+
+    def finish(self, **fields) -> Dict:
+        """
+        Complete the record with the total time of the task and extra fields.
+
+        :return: The record
+        """
+        self.record["start"] = self.start
+        self.record["total"] = time.perf_counter() - self._start_counter
+        self.record.update(fields)
+        return self.record
+
+
+class FileSink:
+    """Append timing records as json lines to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", buffering=1)  # pylint: disable=consider-using-with
+
+    def __call__(self, record: Dict):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+def log_sink(record: Dict):
+    """Log a timing record."""
+    LOG.info(f"Task timing: {json.dumps(record, separators=(',', ':'))}")
+
+
+def sink_from_env() -> Optional[Callable[[Dict], None]]:
+    """Build the sink configured by the MERLIN_TASK_TIMING environment variable."""
+    target = os.environ.get(TIMING_ENV, "")
+    if not target:
+        return None
+    if target.lower() == "log":
+        return log_sink
+    os.makedirs(target, exist_ok=True)
+    return FileSink(os.path.join(target, f"{socket.gethostname()}.{os.getpid()}.jsonl"))
+
+
+def get_sink() -> Optional[Callable[[Dict], None]]:
+    """
+    Return the sink timing records are sent to, configuring it from the
+    environment the first time it is needed in this process.
+    """
+    global _SINK, _SINK_CONFIGURED  # pylint: disable=global-statement
+    if not _SINK_CONFIGURED:
+        try:
+            _SINK = sink_from_env()
+        except OSError as e:
+            LOG.warning(f"Cannot write task timing to '{os.environ.get(TIMING_ENV)}', disabling it. {e}")
+            _SINK = None
+        _SINK_CONFIGURED = True
+    return _SINK
+
+
+def set_sink(sink: Optional[Callable[[Dict], None]]):
+    """
+    Send timing records to sink, a callable taking a record dict, or discard
+    them if sink is None.
+    """
+    global _SINK, _SINK_CONFIGURED  # pylint: disable=global-statement
+    _SINK = sink
+    _SINK_CONFIGURED = True
+
+
+def emit(record: Dict):
+    """Send a timing record to the sink, if there is one."""
+    sink = get_sink()
+    if sink is None:
+        return
+    try:
+        sink(record)
+    except Exception as e:  # pylint: disable=broad-except
+        LOG.warning(f"Failed to record task timing. {e}")
+
+
+def stamp_sent_time(headers: Dict):
+    """Record the publish time of a task in its message headers."""
+    headers[SENT_TIME_HEADER] = time.time()
+
+
+def dequeue_latency(request) -> Optional[float]:
+    """
+    The time between publishing a task and starting it, or None if the task
+    was not stamped when published.
+
+    :param `request`: The celery request of the task
+    """
+    sent_time = request.get(SENT_TIME_HEADER)
+    if sent_time is None:
+        return None
+    return max(0.0, time.time() - float(sent_time))
@@ -35,16 +35,27 @@ import logging
 import os
 from typing import Any, Dict, Optional
 
+import numpy as np
 from celery import chain, chord, group, shared_task, signature
-from celery.exceptions import MaxRetriesExceededError, OperationalError, TimeoutError
+from celery.exceptions import MaxRetriesExceededError, OperationalError, Retry, TimeoutError
+from celery.signals import before_task_publish
 
 from merlin.common.abstracts.enums import ReturnCode
+from merlin.common.completion import completion_key, count_completion, reset_completion
+from merlin.common.opennpylib import OpenNPY
+from merlin.common.publishing import join_chord, publish_to_chord
+from merlin.common.resource_pool import get_core_pool
+from merlin.common.retry_queue import backoff_delay, holds_retries, schedule_retry
 from merlin.common.sample_index import uniform_directories
 from merlin.common.sample_index_factory import create_hierarchy
+from merlin.common.sample_index_file import write_sample_index_file
+from merlin.common.step_templates import TEMPLATE_DIRNAME, StepReference, write_step_template
+from merlin.common.task_timing import TaskTimer, dequeue_latency, emit, stamp_sent_time
 from merlin.config.utils import Priority, get_priority
 from merlin.exceptions import HardFailException, InvalidChainException, RestartException, RetryException
 from merlin.router import stop_workers
 from merlin.spec.expansion import parameter_substitutions_for_cmd, parameter_substitutions_for_sample
+from merlin.study.queue_stats import QueueStatsClient
 from merlin.study.step import Step
 
 
@@ -62,6 +73,28 @@ LOG = logging.getLogger(__name__)
 
 STOP_COUNTDOWN = 60
 
+# The height in the sample index (levels above the sample leaves) of the
+# sub trees that expand_tasks_with_samples hands to expansion tasks.
+EXPANSION_HEIGHT = 3
+
+# The name of the binary sample index file of a study or step workspace.
+SAMPLE_INDEX_FILENAME = "sample_index.bin"
+
+# The name of the copy of a study's samples that expansion tasks read sample
+# ranges from, when they release them as their queue drains.
+SAMPLES_FILENAME = "streamed_samples.npy"
+
+# Seconds between checks of the backlog of a queue that sample ranges are
+# streamed to (see the merlin.resources.max_queued_tasks spec option).
+STREAM_INTERVAL = 10
+
+
+@before_task_publish.connect(sender="merlin.common.tasks.merlin_step")
+def stamp_merlin_step(headers=None, **kwargs):  # pylint: disable=W0613
+    """Stamp merlin_step messages with their publish time to measure queue latency."""
+    if headers is not None:
+        stamp_sent_time(headers)
+
 
 @shared_task(  # noqa: C901
     bind=True,
@@ -76,25 +109,35 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
     :param kwargs: The optional keyword arguments that describe adapter_config and
                    the next step in the chain, if there is one.
 
+    The step can also be a StepReference to a step template, which holds the
+    adapter_config.
+
     Example kwargs dict:
     {"adapter_config": {'type':'local'},
-     "next_in_chain": <Step object> } # merlin_step will be added to the current chord
+     "next_in_chain": <Step object>,  # merlin_step will be added to the current chord
                                       # with next_in_chain as an argument
+     "completion_key": <str> }        # count the step's completion in this hash, for
+                                      # tasks sent without a stored result
     """
     step: Optional[Step] = None
+    template_config: Dict[str, str] = {"type": "local"}
     LOG.debug(f"args is {len(args)} long")
 
     arg: Any
     for arg in args:
         if isinstance(arg, Step):
             step = arg
+        elif isinstance(arg, StepReference):
+            step, template_config = arg.resolve()
         else:
             LOG.debug(f"discard argument {arg}, not of type Step.")
 
-    config: Dict[str, str] = kwargs.pop("adapter_config", {"type": "local"})
+    config: Dict[str, str] = kwargs.pop("adapter_config", template_config)
     next_in_chain: Optional[Step] = kwargs.pop("next_in_chain", None)
+    completion: Optional[str] = kwargs.pop("completion_key", None)
 
     if step:
+        timer: TaskTimer = TaskTimer()
         self.max_retries = step.max_retries
         step_name: str = step.name()
         step_dir: str = step.get_workspace()
@@ -102,11 +145,33 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
         finished_filename: str = os.path.join(step_dir, "MERLIN_FINISHED")
         # if we've already finished this task, skip it
         result: ReturnCode
-        if os.path.exists(finished_filename):
+        with timer.phase("finished_check"):
+            finished: bool = os.path.exists(finished_filename)
+        if finished:
             LOG.info(f"Skipping step '{step_name}' in '{step_dir}'.")
             result = ReturnCode.OK
         else:
-            result = step.execute(config)
+            core_pool = None if self.request.is_eager else get_core_pool()
+            if core_pool is None:
+                result = step.execute(config, timer=timer)
+            else:
+                # Hold the step's cores of the worker's budget while it runs.
+                with timer.phase("reserve_cores"):
+                    core_pool.acquire(step.cores)
+                try:
+                    result = step.execute(config, timer=timer)
+                finally:
+                    core_pool.release()
+        emit(
+            timer.finish(
+                task_id=self.request.id,
+                step=step_name,
+                workspace=step_dir,
+                retries=self.request.retries,
+                dequeue=dequeue_latency(self.request),
+                result=result.name,
+            )
+        )
         if result == ReturnCode.OK:
             LOG.info(f"Step '{step_name}' in '{step_dir}' finished successfully.")
             # touch a file indicating we're done with this step
@@ -119,7 +184,7 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
                 LOG.info(
                     f"Step '{step_name}' in '{step_dir}' is being restarted ({self.request.retries + 1}/{self.max_retries})..."
                 )
-                self.retry(countdown=step.retry_delay)
+                retry_step(self, step)
             except MaxRetriesExceededError:
                 LOG.warning(
                     f"*** Step '{step_name}' in '{step_dir}' exited with a MERLIN_RESTART command, but has already reached its retry limit ({self.max_retries}). Continuing with workflow."
@@ -131,7 +196,7 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
                 LOG.info(
                     f"Step '{step_name}' in '{step_dir}' is being retried ({self.request.retries + 1}/{self.max_retries})..."
                 )
-                self.retry(countdown=step.retry_delay)
+                retry_step(self, step)
             except MaxRetriesExceededError:
                 LOG.warning(
                     f"*** Step '{step_name}' in '{step_dir}' exited with a MERLIN_RETRY command, but has already reached its retry limit ({self.max_retries}). Continuing with workflow."
@@ -149,6 +214,8 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
             shutdown.set(queue=step_queue)
             shutdown.apply_async(countdown=STOP_COUNTDOWN)
 
+            if completion is not None:
+                count_completion(self.backend, completion, step_name, result.name)
             raise HardFailException
         elif result == ReturnCode.STOP_WORKERS:
             LOG.warning(f"*** Shutting down all workers in {STOP_COUNTDOWN} secs!")
@@ -157,6 +224,8 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
             shutdown.apply_async(countdown=STOP_COUNTDOWN)
         else:
             LOG.warning(f"**** Step '{step_name}' in '{step_dir}' had unhandled exit code {result}. Continuing with workflow.")
+        if completion is not None:
+            count_completion(self.backend, completion, step_name, result.name)
         # queue off the next task in a chain while adding it to the current chord so that the chordfinisher actually
         # waits for the next task in the chain
         if next_in_chain is not None:
@@ -166,12 +235,267 @@ def merlin_step(self, *args: Any, **kwargs: Any) -> Optional[ReturnCode]:  # noq
             else:
                 LOG.debug(f"adding {next_in_chain} to chord")
                 self.add_to_chord(next_in_chain, lazy=False)
+        if completion is not None:
+            # The result backend still keeps the return value of a chord member
+            # until the chord joins, even with ignore_result; the count is the record.
+            return None
         return result
 
     LOG.error("Failed to find step!")
     return None
 
 
+def retry_step(self, step):
+    """
+    Retry the current step task after a jittered exponential backoff, held in
+    the retry queue of the results backend rather than by a worker if the
+    backend is redis.
+
+    :param self: The current task.
+    :param step: The Step being retried.
+    :raises Retry: Always, once the retry is scheduled.
+    :raises MaxRetriesExceededError: If the step is out of retries.
+    """
+    delay = backoff_delay(step.retry_delay, self.request.retries, step.max_retry_delay)
+    if self.request.is_eager:
+        self.retry(countdown=delay)
+    if self.max_retries is not None and self.request.retries >= self.max_retries:
+        raise MaxRetriesExceededError(f"Can't retry {self.name}[{self.request.id}] args:{self.request.args}")
+    sig = self.signature_from_request(queue=step.get_task_queue(), retries=self.request.retries + 1)
+    if not schedule_retry(self.backend, sig, delay):
+        self.retry(countdown=delay)
+    raise Retry(f"Retry in {delay:.1f}s", when=delay, sig=sig)
+
+
+def step_signature(task_type, step, adapter_config, completion=None):
+    """
+    Return the signature of a task running step on the step's queue.
+
+    :param task_type: The celery task signature type, currently always merlin_step.
+    :param step: The Step to run, or a StepReference to its template.
+    :param adapter_config: The adapter config, or None for a StepReference,
+        whose template holds it.
+    :param completion: (Optional) The completion counter hash; if given the task
+        is sent without a stored result and counts its completion there instead.
+    """
+    kwargs = {} if adapter_config is None else {"adapter_config": adapter_config}
+    if completion is None:
+        sig = task_type.s(step, **kwargs)
+    else:
+        sig = task_type.s(step, completion_key=completion, **kwargs).set(ignore_result=True)
+    return sig.set(queue=step.get_task_queue())
+
+
+def sample_step(step, template, workspace, cmd_replacement_pairs):
+    """
+    Return the step to send for one sample: a StepReference to the step's
+    template if it has one, else a clone of the step.
+
+    :param step: The Step to expand.
+    :param template: The path to the step's template, or None.
+    :param workspace: The sample's workspace.
+    :param cmd_replacement_pairs: The sample's substitutions.
+    """
+    if template is None:
+        return step.clone_changing_workspace_and_cmd(new_workspace=workspace, cmd_replacement_pairs=cmd_replacement_pairs)
+    return StepReference(template, step.get_task_queue(), workspace, cmd_replacement_pairs)
+
+
+def create_sample_index(n_samples, level_max_dirs):
+    """
+    Create the sample index for a study's samples, with one sample per leaf.
+
+    :param n_samples: The number of samples.
+    :param level_max_dirs: The max number of directories per level in the sample hierarchy.
+    :return: The sample index and a glob matching all of its leaf directories.
+    """
+    directory_sizes = uniform_directories(n_samples, bundle_size=1, level_max_dirs=level_max_dirs)
+    sample_index = create_hierarchy(
+        n_samples,
+        bundle_size=1,
+        directory_sizes=directory_sizes,
+        root="",
+        n_digits=len(str(level_max_dirs)),
+    )
+    return sample_index, "*/" * len(directory_sizes)
+
+
+def write_sample_paths_file(study):
+    """
+    Write the paths of the study's samples, one per line, to a file in its
+    merlin_info directory if any step references $(MERLIN_PATHS_ALL).
+
+    :param study: The MerlinStudy.
+    :return: The path to the file, or None if no step needs it.
+    """
+    if not any(study.dag.step(name).references("MERLIN_PATHS_ALL") for name in study.dag.dag.values if name != "_source"):
+        return None
+    sample_index, _ = create_sample_index(len(study.samples), study.level_max_dirs)
+    filepath = os.path.join(study.info, "sample_paths.txt")
+    with open(filepath, "w") as _file:
+        for path, node in sample_index.traverse_directories():
+            if node.is_parent_of_leaf:
+                _file.write(path + "\n")
+    return filepath
+
+
+def write_study_sample_index(study):
+    """
+    Write the sample index of the study's samples to its merlin_info
+    directory. Its paths are relative to each sample-expanded step's workspace.
+
+    :param study: The MerlinStudy.
+    :return: The path to the file.
+    """
+    sample_index, _ = create_sample_index(len(study.samples), study.level_max_dirs)
+    filepath = os.path.join(study.info, SAMPLE_INDEX_FILENAME)
+    write_sample_index_file(sample_index, filepath)
+    return filepath
+
+
+def write_samples_file(study):
+    """
+    Write the study's samples to a .npy file in its merlin_info directory,
+    for expansion tasks to read ranges of samples from as they need them.
+
+    :param study: The MerlinStudy.
+    :return: The path to the file.
+    """
+    filepath = os.path.join(study.info, SAMPLES_FILENAME)
+    np.save(filepath, np.asarray(study.samples))
+    return filepath
+
+
+def sample_subtree(stream, path, min_sample, max_sample):
+    """
+    Rebuild the sub tree of a study's sample index holding a range of
+    samples, without building the whole index.
+
+    :param stream: The stream settings of the study, from expand_tasks_with_samples.
+    :param path: The path of the sub tree's root in the index.
+    :param min_sample: The first sample of the sub tree.
+    :param max_sample: One past the last sample of the sub tree.
+    """
+    directory_sizes = stream["directory_sizes"]
+    return create_hierarchy(
+        max_sample - min_sample,
+        bundle_size=1,
+        directory_sizes=directory_sizes[len(directory_sizes) - stream["height"] + 1 :],
+        root=path,
+        start_sample_id=min_sample,
+        n_digits=stream["n_digits"],
+    )
+
+
+def split_ranges(ranges, capacity):
+    """
+    Split sample ranges into the leading ones whose samples fit in capacity,
+    and the rest. A first range larger than a positive capacity is taken on
+    its own, so that streaming always progresses.
+
+    :param ranges: A list of (path, min_sample, max_sample) tuples.
+    :param capacity: The number of samples that can be released.
+    """
+    taken = 0
+    released = 0
+    for _, min_sample, max_sample in ranges:
+        size = max_sample - min_sample
+        if capacity <= 0 or (released and taken + size > capacity):
+            break
+        taken += size
+        released += 1
+    return ranges[:released], ranges[released:]
+
+
+def expansion_signature(task_type, steps, samples, labels, sample_index, adapter_config, completion=None, templates=None):
+    """
+    Return the signature of a task expanding a chain of steps over the samples
+    of a sub tree of the sample index.
+    """
+    sig = add_merlin_expanded_chain_to_chord.s(
+        task_type,
+        steps,
+        samples,
+        labels,
+        sample_index,
+        adapter_config,
+        sample_index.min,
+        completion=completion,
+        templates=templates,
+    )
+    return sig.set(queue=steps[0].get_task_queue(), ignore_result=completion is not None)
+
+
+def release_sample_ranges(self, task_type, steps, labels, adapter_config, ranges, stream, completion=None):
+    """
+    Add the expansion tasks of as many sample ranges to the current chord as
+    fit under the stream's limit of tasks queued for the steps, and a
+    stream_sample_ranges task to release the rest once the queue drains. The
+    latter waits STREAM_INTERVAL seconds in the retry queue on a redis
+    results backend, or as a countdown otherwise.
+
+    :param self: The current task.
+    :param ranges: A list of (path, min_sample, max_sample) tuples, the sub
+        trees of the sample index not yet expanded.
+    :param stream: The stream settings of the study, from expand_tasks_with_samples.
+    :param completion: (Optional) The completion counter hash of a study run
+        without task results.
+    """
+    queue = steps[0].get_task_queue()
+    backlog = 0
+    capacity = float("inf")
+    if not self.request.is_eager:
+        with QueueStatsClient(app=self.app) as client:
+            backlog = sum(jobs for _, jobs, _ in client.query([queue]))
+        capacity = stream["max_queued_tasks"] - backlog
+    released, remaining = split_ranges(ranges, capacity)
+    LOG.info(f"releasing {len(released)} of {len(ranges)} sample ranges to {queue} with {backlog} tasks queued")
+
+    sigs = []
+    with OpenNPY(stream["samples_file"]) as samples:
+        for path, min_sample, max_sample in released:
+            sample_index = sample_subtree(stream, path, min_sample, max_sample)
+            sigs.append(
+                expansion_signature(
+                    task_type,
+                    steps,
+                    samples[min_sample:max_sample],
+                    labels,
+                    sample_index,
+                    adapter_config,
+                    completion,
+                    stream.get("templates"),
+                )
+            )
+    if remaining:
+        sig = stream_sample_ranges.s(task_type, steps, labels, adapter_config, remaining, stream, completion=completion)
+        sig.set(queue=queue, ignore_result=completion is not None)
+        if not self.request.is_eager and holds_retries(self.backend):
+            # Hold the continuation in the retry queue rather than in a worker's memory.
+            join_chord(self, [sig])
+            schedule_retry(self.backend, sig, STREAM_INTERVAL)
+        else:
+            sigs.append(sig.set(countdown=STREAM_INTERVAL))
+    publish_to_chord(self, sigs)
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=retry_exceptions,
+    retry_backoff=True,
+    priority=get_priority(Priority.low),
+)
+def stream_sample_ranges(self, task_type, steps, labels, adapter_config, ranges, stream, completion=None):
+    """
+    Release more of a study's sample ranges to the current chord, once the
+    backlog of the steps' queue is below the stream's limit.
+
+    See release_sample_ranges for the arguments.
+    """
+    release_sample_ranges(self, task_type, steps, labels, adapter_config, ranges, stream, completion)
+    return ReturnCode.OK
+
+
 def is_chain_expandable(chain_, labels):
     """
     Returns whether to expand the steps in the given chain.
@@ -237,6 +561,8 @@ def add_merlin_expanded_chain_to_chord(
     sample_index,
     adapter_config,
     min_sample_id,
+    completion=None,
+    templates=None,
 ):
     """
     Expands tasks in a chain, then adds the expanded tasks to the current chord.
@@ -248,6 +574,10 @@ def add_merlin_expanded_chain_to_chord(
     :param sample_index: The sample index that contains the directory structure for tasks.
     :param adapter_config: The adapter config.
     :param min_sample_id: offset to use for the sample_index.
+    :param completion: (Optional) The completion counter hash of a study run
+        without task results.
+    :param templates: (Optional) The paths to the templates of the steps in
+        chain_, to send references to instead of the steps.
     """
     # Use the index to get a path to each sample
     LOG.debug(f"recursing with {len(samples)} samples {samples}")
@@ -258,7 +588,7 @@ def add_merlin_expanded_chain_to_chord(
             os.path.dirname(sample_index.get_path_to_sample(sample_id + min_sample_id)) for sample_id in range(len(samples))
         ]
         LOG.debug(f"recursing grandparent with relative paths {relative_paths}")
-        for step in chain_:
+        for step, template in zip(chain_, templates or [None] * len(chain_)):
 
             # Make a list of new task objects with modified cmd and workspace
             # based off of the parameter substitutions and relative_path for
@@ -267,19 +597,22 @@ def add_merlin_expanded_chain_to_chord(
             LOG.debug(f"expanding step {step.name()} in workspace {workspace}")
             new_chain = []
             for sample_id, sample in enumerate(samples):
-                new_step = task_type.s(
-                    step.clone_changing_workspace_and_cmd(
-                        new_workspace=os.path.join(workspace, relative_paths[sample_id]),
-                        cmd_replacement_pairs=parameter_substitutions_for_sample(
+                new_step = step_signature(
+                    task_type,
+                    sample_step(
+                        step,
+                        template,
+                        os.path.join(workspace, relative_paths[sample_id]),
+                        parameter_substitutions_for_sample(
                             sample,
                             labels,
                             sample_id + min_sample_id,
                             relative_paths[sample_id],
                         ),
                     ),
-                    adapter_config=adapter_config,
+                    adapter_config if template is None else None,
+                    completion,
                 )
-                new_step.set(queue=step.get_task_queue())
                 new_chain.append(new_step)
 
             all_chains.append(new_chain)
@@ -289,47 +622,53 @@ def add_merlin_expanded_chain_to_chord(
     else:
         # recurse down the sample_index hierarchy
         LOG.debug("recursing down sample_index hierarchy")
+        next_steps = []
         for next_index in sample_index.children.values():
             next_index.name = os.path.join(sample_index.name, next_index.name)
             LOG.debug("generating next step")
-            next_step = add_merlin_expanded_chain_to_chord.s(
+            next_step = expansion_signature(
                 task_type,
                 chain_,
                 samples[next_index.min - min_sample_id : next_index.max - min_sample_id],
                 labels,
                 next_index,
                 adapter_config,
-                next_index.min,
+                completion,
+                templates,
             )
-            next_step.set(queue=chain_[0].get_task_queue())
             LOG.debug(f"recursing with range {next_index.min}:{next_index.max}, {next_index.name} {signature(next_step)}")
-            LOG.debug(f"queuing samples[{next_index.min}:{next_index.max}] in for {chain_} in {next_index.name}...")
-            if self.request.is_eager:
-                next_step.delay()
-            else:
-                self.add_to_chord(next_step, lazy=False)
-            LOG.debug(f"queued for samples[{next_index.min}:{next_index.max}] in for {chain_} in {next_index.name}")
+            next_steps.append(next_step)
+        LOG.debug(f"queuing {len(next_steps)} expansion tasks for {chain_} in {sample_index.name}...")
+        publish_to_chord(self, next_steps)
+        LOG.debug(f"queued {len(next_steps)} expansion tasks for {chain_} in {sample_index.name}")
 
     return ReturnCode.OK
 
 
-def add_simple_chain_to_chord(self, task_type, chain_, adapter_config):
+def add_simple_chain_to_chord(self, task_type, chain_, adapter_config, completion=None, templates=None):
     """
     Adds a chain of tasks to the current chord.
     :param self: The current task.
     :param task_type: The celery task signature type the new tasks should be.
     :param chain_: The list of tasks to expand.
     :param adapter_config: The adapter config.
+    :param completion: (Optional) The completion counter hash of a study run
+        without task results.
+    :param templates: (Optional) The paths to the templates of the steps in
+        chain_, to send references to instead of the steps.
     """
     LOG.debug(f"simple chain with {chain_}")
     all_chains = []
-    for step in chain_:
+    for step, template in zip(chain_, templates or [None] * len(chain_)):
 
         # Make a list of new task signatures with modified cmd and workspace
         # based off of the parameter substitutions and relative_path for
         # a given sample.
 
-        new_steps = [task_type.s(step, adapter_config=adapter_config).set(queue=step.get_task_queue())]
+        if template is None:
+            new_steps = [step_signature(task_type, step, adapter_config, completion)]
+        else:
+            new_steps = [step_signature(task_type, StepReference(template, step.get_task_queue()), None, completion)]
         all_chains.append(new_steps)
     add_chains_to_chord(self, all_chains)
 
@@ -344,11 +683,7 @@ def add_chains_to_chord(self, all_chains):
     if len(all_chains) == 1:
         # enqueue the steps as a single parallel group
         LOG.debug(f"launching group with {signature(all_chains[0][0])}")
-        for sig in all_chains[0]:
-            if self.request.is_eager:
-                sig.delay()
-            else:
-                self.add_to_chord(sig, lazy=False)
+        publish_to_chord(self, all_chains[0])
 
     if len(all_chains) > 1:
         # in this case, we need to make a chain.
@@ -376,12 +711,8 @@ def add_chains_to_chord(self, all_chains):
                     all_chains[g][i] = all_chains[g][i].replace(kwargs=new_kwargs)
             chain_steps.append(all_chains[0][i])
 
-        for sig in chain_steps:
-            LOG.debug(f"launching chain {signature(sig)}")
-            if self.request.is_eager:
-                sig.delay()
-            else:
-                self.add_to_chord(sig, lazy=False)
+        LOG.debug(f"launching {len(chain_steps)} chains with {signature(chain_steps[0])}")
+        publish_to_chord(self, chain_steps)
     return ReturnCode.OK
 
 
@@ -413,84 +744,93 @@ def expand_tasks_with_samples(
     :task_type : The celery task type to create. Currently always merlin_step.
     :adapter_config : A dictionary used for configuring maestro script adapters.
     :level_max_dirs : The max number of directories per level in the sample hierarchy.
+    :sample_paths_file : (Optional kwarg) A file listing the sample paths, to
+        substitute for $(MERLIN_PATHS_ALL) instead of the paths themselves.
+    :completion_key : (Optional kwarg) The completion counter hash; when given
+        the step tasks are sent without stored results.
+    :max_queued_tasks : (Optional kwarg) Release the samples to the steps'
+        queue in ranges, keeping about this many tasks queued.
+    :samples_file : (Optional kwarg) A .npy copy of the samples, to read the
+        ranges from; required with max_queued_tasks.
+    :template_dir : (Optional kwarg) A directory to write the templates of
+        the steps to; when given the step tasks reference them instead of
+        carrying the steps.
     """
     LOG.debug(f"expand_tasks_with_samples called with chain,{chain_}\n")
-    # Figure out how many directories there are, make a glob string
-    directory_sizes = uniform_directories(len(samples), bundle_size=1, level_max_dirs=level_max_dirs)
-
-    glob_path = "*/" * len(directory_sizes)
-
     LOG.debug("creating sample_index")
-    # Write a hierarchy to get the all paths string
-    sample_index = create_hierarchy(
-        len(samples),
-        bundle_size=1,
-        directory_sizes=directory_sizes,
-        root="",
-        n_digits=len(str(level_max_dirs)),
-    )
-
-    LOG.debug("creating sample_paths")
-    sample_paths = sample_index.make_directory_string()
+    sample_index, glob_path = create_sample_index(len(samples), level_max_dirs)
 
     LOG.debug("assembling steps")
     # the steps in the chain
     steps = [dag.step(name) for name in chain_]
 
+    # The list of all sample paths can be huge, so only build it for chains
+    # that use it, unless it was written to a file when the study was queued.
+    sample_paths = kwargs.get("sample_paths_file")
+    if sample_paths is None and any(step.references("MERLIN_PATHS_ALL") for step in steps):
+        LOG.debug("creating sample_paths")
+        sample_paths = sample_index.make_directory_string()
+
     # sub in globs prior to expansion
     # sub the glob command
-    steps = [
-        step.clone_changing_workspace_and_cmd(cmd_replacement_pairs=parameter_substitutions_for_cmd(glob_path, sample_paths))
-        for step in steps
-    ]
+    cmd_replacement_pairs = parameter_substitutions_for_cmd(glob_path, sample_paths)
+    steps = [step.clone_changing_workspace_and_cmd(cmd_replacement_pairs=cmd_replacement_pairs) for step in steps]
 
     # workspaces = [step.get_workspace() for step in steps]
     # LOG.debug(f"workspaces : {workspaces}")
 
     needs_expansion = is_chain_expandable(steps, labels)
+    completion = kwargs.get("completion_key")
+    templates = None
+    if kwargs.get("template_dir"):
+        templates = [write_step_template(kwargs["template_dir"], step, adapter_config) for step in steps]
 
     LOG.debug(f"needs_expansion {needs_expansion}")
 
     if needs_expansion:
         # prepare_chain_workspace(sample_index, steps)
         sample_index.name = ""
+        # Queue an expansion task for every sub tree at most three levels
+        # above the sample leaves.
+        height = min(sample_index.height, EXPANSION_HEIGHT)
+        if kwargs.get("max_queued_tasks"):
+            ranges = [(path, node.min, node.max) for path, node in sample_index.traverse_height(height)]
+            stream = {
+                "samples_file": kwargs["samples_file"],
+                "max_queued_tasks": kwargs["max_queued_tasks"],
+                "directory_sizes": uniform_directories(len(samples), bundle_size=1, level_max_dirs=level_max_dirs),
+                "height": height,
+                "n_digits": len(str(level_max_dirs)),
+                "templates": templates,
+            }
+            LOG.info(f"streaming {len(ranges)} sample ranges, with at most {stream['max_queued_tasks']} tasks queued")
+            release_sample_ranges(self, task_type, steps, labels, adapter_config, ranges, stream, completion)
+            return
+
         LOG.debug("queuing merlin expansion tasks")
-        found_tasks = False
-        conditions = [
-            lambda c: c.is_great_grandparent_of_leaf,
-            lambda c: c.is_grandparent_of_leaf,
-            lambda c: c.is_parent_of_leaf,
-            lambda c: c.is_leaf,
-        ]
-        for condition in conditions:
-            if not found_tasks:
-                for next_index_path, next_index in sample_index.traverse(conditional=condition):
-                    LOG.info(
-                        f"generating next step for range {next_index.min}:{next_index.max} {next_index.max-next_index.min}"
-                    )
-                    next_index.name = next_index_path
-
-                    sig = add_merlin_expanded_chain_to_chord.s(
-                        task_type,
-                        steps,
-                        samples[next_index.min : next_index.max],
-                        labels,
-                        next_index,
-                        adapter_config,
-                        next_index.min,
-                    )
-                    sig.set(queue=steps[0].get_task_queue())
-
-                    if self.request.is_eager:
-                        sig.delay()
-                    else:
-                        LOG.info(f"queuing expansion task {next_index.min}:{next_index.max}")
-                        self.add_to_chord(sig, lazy=False)
-                    LOG.info(f"merlin expansion task {next_index.min}:{next_index.max} queued")
-                    found_tasks = True
+        sigs = []
+        for next_index_path, next_index in sample_index.traverse_height(height):
+            LOG.info(f"generating next step for range {next_index.min}:{next_index.max} {next_index.max-next_index.min}")
+            next_index.name = next_index_path
+            sigs.append(
+                expansion_signature(
+                    task_type,
+                    steps,
+                    samples[next_index.min : next_index.max],
+                    labels,
+                    next_index,
+                    adapter_config,
+                    completion,
+                    templates,
+                )
+            )
+
+        LOG.info(f"queuing {len(sigs)} merlin expansion tasks")
+        publish_to_chord(self, sigs)
+        LOG.info(f"{len(sigs)} merlin expansion tasks queued")
     else:
         LOG.debug("queuing simple chain task")
-        add_simple_chain_to_chord(self, task_type, steps, adapter_config)
+        add_simple_chain_to_chord(self, task_type, steps, adapter_config, completion, templates)
         LOG.debug("simple chain task queued")
 
 
@@ -553,6 +893,32 @@ def queue_merlin_study(study, adapter):
     LOG.info("Calculating task groupings from DAG.")
     groups_of_chains = egraph.group_tasks("_source")
 
+    if study.sample_index_file and len(samples) > 0:
+        LOG.info(f"Wrote the sample index to '{write_study_sample_index(study)}'.")
+
+    expansion_kwargs = {}
+    if study.paths_all_file and len(samples) > 0:
+        sample_paths_file = write_sample_paths_file(study)
+        if sample_paths_file is not None:
+            LOG.info(f"Wrote the sample paths for $(MERLIN_PATHS_ALL) to '{sample_paths_file}'.")
+            expansion_kwargs["sample_paths_file"] = sample_paths_file
+
+    # Step tasks reference the steps' templates, written once to merlin_info.
+    expansion_kwargs["template_dir"] = os.path.join(study.info, TEMPLATE_DIRNAME)
+    os.makedirs(expansion_kwargs["template_dir"], exist_ok=True)
+
+    if study.max_queued_tasks and len(samples) > 0 and not merlin_step.app.conf.task_always_eager:
+        expansion_kwargs["max_queued_tasks"] = study.max_queued_tasks
+        expansion_kwargs["samples_file"] = write_samples_file(study)
+        LOG.info(f"Samples will be released as their queues drain, from '{expansion_kwargs['samples_file']}'.")
+
+    if not study.task_results and not merlin_step.app.conf.task_always_eager:
+        # Step tasks count their completion instead of storing results; only
+        # the chords between groups of steps go through the results backend.
+        expansion_kwargs["completion_key"] = completion_key(study.expanded_spec.name)
+        reset_completion(merlin_step.backend, expansion_kwargs["completion_key"])
+        LOG.info(f"Step tasks will not store results; completions are counted in '{expansion_kwargs['completion_key']}'.")
+
     # magic to turn graph into celery tasks
     LOG.info("Converting graph to tasks.")
     celery_dag = chain(
@@ -567,7 +933,11 @@ def queue_merlin_study(study, adapter):
                         merlin_step,
                         adapter,
                         study.level_max_dirs,
-                    ).set(queue=egraph.step(chain_group[0][0]).get_task_queue())
+                        **expansion_kwargs,
+                    ).set(
+                        queue=egraph.step(chain_group[0][0]).get_task_queue(),
+                        ignore_result="completion_key" in expansion_kwargs,
+                    )
                     for gchain in chain_group
                 ]
             ),
@@ -238,6 +238,39 @@ def _sort_valid_broker(broker, config_path, include_password):
     return get_redis_connection(config_path, include_password, ssl=True)
 
 
+def get_management_api_config() -> Optional[Dict[str, str]]:
+    """
+    Return the settings needed to query the RabbitMQ management HTTP API, based
+    on the optional `management_url` entry in the broker section of the
+    `app.yaml` config file.
+
+    :return: None if no management url is configured, otherwise a dict with
+        the url, vhost, username and password
+    :rtype: Optional[Dict[str, str]]
+    """
+    try:
+        url: str = CONFIG.broker.management_url
+    except AttributeError:
+        return None
+    if not url:
+        return None
+
+    password: str = ""
+    try:
+        password_filepath: str = os.path.abspath(expanduser(CONFIG.broker.password))
+        with open(password_filepath, "r") as f:
+            password = f.readline().strip()
+    except (AttributeError, IOError):
+        LOG.debug("Broker: no password file available for the management api")
+
+    return {
+        "url": url.rstrip("/"),
+        "vhost": CONFIG.broker.vhost,
+        "username": CONFIG.broker.username,
+        "password": password,
+    }
+
+
 def get_ssl_config() -> Union[bool, Dict[str, Union[str, ssl.VerifyMode]]]:
     """
     Return the ssl config based on the configuration specified in the
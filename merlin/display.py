@@ -45,29 +45,114 @@ from merlin.config import broker, results_backend
 from merlin.config.configfile import default_config_info
 
 
+# Default time (in seconds) to wait for a server connection.
+CONNECT_TIMEOUT = 60
+
+# How often (in seconds) to poll the connection processes.
+POLL_INTERVAL = 0.1
+
+
 class ConnProcess(Process):
+    """
+    A process that runs a connection target and reports back, through a pipe,
+    either the exception it raised or how long the target took to complete
+    along with what it returned.
+    """
+
     def __init__(self, *args, **kwargs):
         Process.__init__(self, *args, **kwargs)
         self._pconn, self._cconn = Pipe()
         self._exception = None
+        self._elapsed = None
+        self._result = None
 
     def run(self):
         try:
-            Process.run(self)
-            self._cconn.send(None)
+            start = time.perf_counter()
+            result = self._target(*self._args, **self._kwargs) if self._target else None
+            self._cconn.send((None, time.perf_counter() - start, result))
         except Exception as e:
             tb = traceback.format_exc()
-            self._cconn.send((e, tb))
+            self._cconn.send(((e, tb), None, None))
             # raise e  # You can still rise this exception if you need to
 
+    def poll(self, timeout=0):
+        """
+        Wait up to timeout seconds for the target to report back.
+
+        :param `timeout`: The time (in seconds) to wait for a report
+        :return: True if the target has reported back
+        """
+        if self._pconn.poll(timeout):
+            self._exception, self._elapsed, self._result = self._pconn.recv()
+            return True
+        return False
+
     @property
     def exception(self):
-        if self._pconn.poll():
-            self._exception = self._pconn.recv()
+        self.poll()
         return self._exception
 
+    @property
+    def elapsed(self):
+        """The time (in seconds) the target took to run, if it succeeded."""
+        self.poll()
+        return self._elapsed
+
+    @property
+    def result(self):
+        """What the target returned, if it succeeded."""
+        self.poll()
+        return self._result
+
+
+def round_trip(conn):
+    """
+    Time one request and reply on an established connection: a PING on
+    redis, or a basic.qos on amqp, which the server confirms without side
+    effects.
+
+    :param `conn`: A connected kombu Connection
+    :return: The round trip time (in seconds), or None for transports without
+        a server to ask
+    """
+    driver = conn.transport.driver_type
+    channel = conn.default_channel
+    start = time.perf_counter()
+    if driver == "redis":
+        channel.client.ping()
+    elif driver == "amqp":
+        channel.basic_qos(prefetch_size=0, prefetch_count=0, a_global=False)
+    else:
+        return None
+    return time.perf_counter() - start
+
+
+def check_connection(url):
+    """
+    Connect to the server at url and time a round trip on the connection.
 
-def check_server_access(sconf):
+    :param `url`: The server's connection string
+    :return: (connect time, round trip time) in seconds; see round_trip
+    """
+    conn = Connection(url)
+    try:
+        start = time.perf_counter()
+        conn.connect()
+        connect_time = time.perf_counter() - start
+        return connect_time, round_trip(conn)
+    finally:
+        conn.release()
+
+
+def check_server_access(sconf, timeout=CONNECT_TIMEOUT):
+    """
+    Check the connections to the servers in sconf concurrently, reporting
+    the time to connect to each one and the round trip time once connected.
+
+    :param `sconf`: A dictionary of server names to connection strings
+    :param `timeout`: The time (in seconds) to wait for each server
+    """
     servers = ["broker server", "results server"]
 
     if sconf.keys():
@@ -75,9 +160,15 @@ def check_server_access(sconf):
         print("-" * 28)
 
     excpts = {}
+    checks = {}
     for s in servers:
         if s in sconf:
-            _examine_connection(s, sconf, excpts)
+            checks[s] = _start_connection_check(s, sconf, excpts)
+
+    _wait_for_connection_checks(checks, timeout, excpts)
+
+    for s in checks:
+        _examine_connection(s, checks[s], excpts)
 
     if excpts:
         print("\nExceptions:")
@@ -85,33 +176,63 @@ def check_server_access(sconf):
             print(f"{k}: {v}")
 
 
-def _examine_connection(s, sconf, excpts):
-    connect_timeout = 60
+def _start_connection_check(s, sconf, excpts):
+    """Start a process that connects to server s, or return None on error."""
     try:
-        conn = Connection(sconf[s])
-        conn_check = ConnProcess(target=conn.connect)
+        # Fail early on connection strings that do not parse.
+        Connection(sconf[s]).release()
+        conn_check = ConnProcess(target=check_connection, args=(sconf[s],))
         conn_check.start()
-        counter = 0
-        while conn_check.is_alive():
-            time.sleep(1)
-            counter += 1
-            if counter > connect_timeout:
+        return conn_check
+    except Exception as e:
+        excpts[s] = e
+        return None
+
+
+def _wait_for_connection_checks(checks, timeout, excpts):
+    """Poll all running connection checks until they report back or time out."""
+    pending = {s: check for s, check in checks.items() if check is not None}
+    deadline = time.perf_counter() + timeout
+    while pending:
+        for s, conn_check in list(pending.items()):
+            if conn_check.poll(POLL_INTERVAL / len(pending)) or not conn_check.is_alive():
+                del pending[s]
+        if pending and time.perf_counter() > deadline:
+            for s, conn_check in pending.items():
                 conn_check.kill()
-                raise Exception(f"Connection was killed due to timeout ({connect_timeout}s)")
-        conn.release()
+                excpts[s] = Exception(f"Connection was killed due to timeout ({timeout}s)")
+            pending = {}
+    for conn_check in checks.values():
+        if conn_check is not None:
+            conn_check.join()
+
+
+def _examine_connection(s, conn_check, excpts):
+    """Print the outcome of the connection check for server s."""
+    try:
+        if s in excpts:
+            raise excpts[s]
         if conn_check.exception:
-            error, traceback = conn_check.exception
+            error, _ = conn_check.exception
             raise error
+        if conn_check.result is None:
+            raise Exception("Connection check exited without reporting a result")
     except Exception as e:
         print(f"{s} connection: Error")
         excpts[s] = e
     else:
-        print(f"{s} connection: OK")
+        connect_time, rtt = conn_check.result
+        timing = f"connect time: {connect_time * 1000:.1f} ms"
+        if rtt is not None:
+            timing += f", round trip: {rtt * 1000:.1f} ms"
+        print(f"{s} connection: OK ({timing})")
 
 
-def display_config_info():
+def display_config_info(timeout=CONNECT_TIMEOUT):
     """
     Prints useful configuration information to the console.
+
+    :param `timeout`: The time (in seconds) to wait for each server connection
     """
     print("Merlin Configuration")
     print("-" * 25)
@@ -143,7 +264,7 @@ def display_config_info():
         for k, v in excpts.items():
             print(f"{k}: {v}")
 
-    check_server_access(sconf)
+    check_server_access(sconf, timeout=timeout)
 
 
 def display_multiple_configs(files, configs):
@@ -174,7 +295,7 @@ def print_info(args):
     :param `args`: parsed CLI arguments
     """
     print(banner_small)
-    display_config_info()
+    display_config_info(timeout=args.timeout)
 
     print("")
     print("Python Configuration")
@@ -226,6 +226,8 @@ def launch_workers(args):
         print(status)
     else:
         LOG.debug(f"celery command: {status}")
+        if args.autoscale:
+            router.autoscale_workers(spec, args.worker_steps, args.autoscale_interval)
 
 
 def purge_tasks(args):
@@ -254,9 +256,18 @@ def query_status(args):
     """
     print(banner_small)
     spec, _ = get_merlin_spec_with_override(args)
+    if args.summary is not None:
+        print(router.summarize_status(spec, args.steps, args.summary))
+        return
+    if args.watch is not None:
+        router.watch_status(args.task_server, spec, args.steps, args.watch, args.interval, args.csv)
+        return
     ret = router.query_status(args.task_server, spec, args.steps)
     for name, jobs, consumers in ret:
         print(f"{name:30} - Workers: {consumers:10} - Queued Tasks: {jobs:10}")
+    if not spec.merlin["resources"]["task_results"]:
+        for name, count in (router.query_completion(args.task_server, spec) or {}).items():
+            print(f"{name:30} - Completed Tasks: {count:10}")
     if args.csv is not None:
         router.dump_status(ret, args.csv)
 
@@ -336,9 +347,13 @@ def process_monitor(args):
     """
     LOG.info("Monitor: checking queues ...")
     spec, _ = get_merlin_spec_with_override(args)
-    while router.check_merlin_status(args, spec):
-        LOG.info("Monitor: found tasks in queues")
-        time.sleep(args.sleep)
+    with router.get_stats_client(args.task_server) as stats_client:
+        if args.events:
+            router.monitor_events(args, spec, stats_client)
+        else:
+            while router.check_merlin_status(args, spec, stats_client=stats_client):
+                LOG.info("Monitor: found tasks in queues")
+                time.sleep(args.sleep)
     LOG.info("Monitor: ... stop condition met")
 
 
@@ -592,6 +607,20 @@ def generate_worker_touching_parsers(subparsers: ArgumentParser) -> None:
         dest="worker_echo_only",
         help="Just echo the command; do not actually run it",
     )
+    run_workers.add_argument(
+        "--autoscale",
+        action="store_true",
+        default=False,
+        help="After launching the workers, keep running and scale the concurrency of the workers with "
+        "autoscale bounds in the spec with the backlog of their queues",
+    )
+    run_workers.add_argument(
+        "--interval",
+        type=int,
+        dest="autoscale_interval",
+        default=30,
+        help="Time (in seconds) between queue polls when autoscaling",
+    )
     run_workers.add_argument(
         "--vars",
         action="store",
@@ -677,6 +706,13 @@ def generate_worker_touching_parsers(subparsers: ArgumentParser) -> None:
         help="Sleep duration between checking for workers.\
                                     Default: %(default)s",
     )
+    monitor.add_argument(
+        "--events",
+        action="store_true",
+        default=False,
+        help="Follow worker heartbeats and task events instead of sleeping between checks, "
+        "exiting as soon as the work is done. Enables task events on the workers.",
+    )
     monitor.set_defaults(func=process_monitor)
 
 
@@ -720,6 +756,24 @@ def generate_diagnostic_parsers(subparsers: ArgumentParser) -> None:
         "Example: '--vars LEARN=path/to/new_learn.py EPOCHS=3'",
     )
     status.add_argument("--csv", type=str, help="csv file to dump status report to", default=None)
+    status.add_argument(
+        "--watch",
+        type=str,
+        default=None,
+        help="Sample the queue status every --interval seconds into this status log file until interrupted",
+    )
+    status.add_argument(
+        "--interval",
+        type=float,
+        default=60,
+        help="Time in seconds between samples when using --watch. Default: %(default)s",
+    )
+    status.add_argument(
+        "--summary",
+        type=str,
+        default=None,
+        help="Summarize the drain rates and ETAs of the queues recorded in this status log file",
+    )
 
     # merlin info
     info: ArgumentParser = subparsers.add_parser(
@@ -727,6 +781,12 @@ def generate_diagnostic_parsers(subparsers: ArgumentParser) -> None:
         help="display info about the merlin configuration and the python configuration. Useful for debugging.",
     )
     info.set_defaults(func=print_info)
+    info.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Time (in seconds) to wait for each server connection check. [Default: %(default)s]",
+    )
 
 
 def main():
@@ -40,16 +40,21 @@ import os
 import time
 from datetime import datetime
 
+from merlin.study.autoscaler import Autoscaler, get_worker_groups
 from merlin.study.celeryadapter import (
     create_celery_config,
     get_workers_from_app,
+    monitor_celery_events,
     purge_celery_tasks,
+    query_celery_completion,
     query_celery_queues,
     query_celery_workers,
     run_celery,
     start_celery_workers,
     stop_celery_workers,
 )
+from merlin.study.queue_stats import QueueStatsClient
+from merlin.study.status_log import StatusLog, format_summary, summarize
 
 
 try:
@@ -91,6 +96,25 @@ def launch_workers(spec, steps, worker_args="", just_return_command=False):
         LOG.error("Celery is not specified as the task server!")
 
 
+def autoscale_workers(spec, steps, interval):
+    """
+    Scales the concurrency of the workers with autoscale bounds in the spec
+    with the backlog of their queues, until interrupted.
+
+    :param `spec`: A MerlinSpec object
+    :param `steps`: The steps in the spec the workers were launched for
+    :param `interval`: The time (in seconds) between polls of the task server
+    """
+    if spec.merlin["resources"]["task_server"] == "celery":
+        groups = get_worker_groups(spec, steps)
+        if not groups:
+            LOG.warning("No workers in the spec have autoscale bounds; nothing to scale.")
+            return
+        Autoscaler(groups, interval=interval).run()
+    else:
+        LOG.error("Celery is not specified as the task server!")
+
+
 def purge_tasks(task_server, spec, force, steps):
     """
     Purges all tasks.
@@ -111,13 +135,14 @@ def purge_tasks(task_server, spec, force, steps):
         LOG.error("Celery is not specified as the task server!")
 
 
-def query_status(task_server, spec, steps, verbose=True):
+def query_status(task_server, spec, steps, verbose=True, stats_client=None):
     """
     Queries status of queues in spec file from server.
 
     :param `task_server`: The task server from which to purge tasks.
     :param `spec`: A MerlinSpec object
     :param `steps`: Spaced-separated list of stepnames to query. Default is all
+    :param `stats_client`: An open client from get_stats_client to reuse
     """
     if verbose:
         LOG.info(f"Querying queues for steps = {steps}")
@@ -125,32 +150,154 @@ def query_status(task_server, spec, steps, verbose=True):
     if task_server == "celery":
         queues = spec.get_queue_list(steps)
         # Query the queues
-        return query_celery_queues(queues)
+        return query_celery_queues(queues, stats_client=stats_client)
     else:
         LOG.error("Celery is not specified as the task server!")
 
 
-def dump_status(query_return, csv_file):
+def query_completion(task_server, spec):
+    """
+    Queries the completion counts of the step tasks of a study that runs
+    without task results.
+
+    :param `task_server`: The task server to query.
+    :param `spec`: A MerlinSpec object
+    :return: dict of '<step name>:<return code>' to the number of step tasks
+    """
+    if task_server == "celery":
+        return query_celery_completion(spec.name)
+    else:
+        LOG.error("Celery is not specified as the task server!")
+
+
+def get_stats_client(task_server):
+    """
+    Opens a client that keeps one connection to the task server for
+    repeated queue status queries. Use it as a context manager.
+
+    :param `task_server`: The task server to query.
+    """
+    if task_server == "celery":
+        return QueueStatsClient()
+    else:
+        LOG.error("Celery is not specified as the task server!")
+
+
+def dump_status(query_return, csv_file, last_header=None):
     """
     Dump the results of a query_status to a csv file.
 
+    A header line is written when the file is new, and again whenever the
+    queues differ from the ones named in the file's latest header.
+
     :param `query_return`: The output of query_status
     :param `csv_file`: The csv file to append
+    :param `last_header`: The file's latest header, as returned by the
+        previous call. If None, it is read from the file.
+    :return: The file's latest header after this dump
     """
-    if os.path.exists(csv_file):
-        fmode = "a"
-    else:
-        fmode = "w"
-    with open(csv_file, mode=fmode) as f:
-        if f.mode == "w":  # add the header
-            f.write("# time")
-            for name, job, consumer in query_return:
-                f.write(f",{name}:tasks,{name}:consumers")
-            f.write("\n")
+    header = "# time"
+    for name, job, consumer in query_return:
+        header += f",{name}:tasks,{name}:consumers"
+
+    if last_header is None and os.path.exists(csv_file):
+        with open(csv_file, mode="r") as f:
+            for line in f:
+                if line.startswith("# time"):
+                    last_header = line.rstrip("\n")
+
+    with open(csv_file, mode="a") as f:
+        if header != last_header:
+            f.write(header + "\n")
         f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         for name, job, consumer in query_return:
             f.write(f",{job},{consumer}")
         f.write("\n")
+    return header
+
+
+def with_empty_queues(query_return, queues):
+    """
+    Add the queues missing from a query_status result as empty, with no
+    tasks and no consumers; redis drops a queue's key once it is empty.
+
+    :param `query_return`: The output of query_status
+    :param `queues`: The names of all the queues queried
+    :return: The (name, jobs, consumers) of every queue, sorted by name
+    """
+    found = {name for name, _, _ in query_return}
+    return sorted(list(query_return) + [(queue, 0, 0) for queue in queues if queue not in found])
+
+
+def completed_by_queue(spec, counts):
+    """
+    Total the completion counts of a study's steps by the queues the steps run in.
+
+    :param `spec`: A MerlinSpec object
+    :param `counts`: The output of query_completion, counts by '<step name>:<return code>'
+    :return: dict of queue name to the number of its step tasks completed
+    """
+    step_queues = spec.get_task_queues()
+    completed = {queue: 0 for queue in step_queues.values()}
+    for field, count in counts.items():
+        step_name = field.rsplit(":", 1)[0]
+        # Parameterized steps are counted under their expanded names, '<step>_<parameter labels>'.
+        matches = [name for name in step_queues if step_name == name or step_name.startswith(f"{name}_")]
+        if matches:
+            completed[step_queues[max(matches, key=len)]] += count
+    return completed
+
+
+def watch_status(task_server, spec, steps, status_file, interval, csv_file=None):
+    """
+    Sample the status of the queues in the spec every interval seconds into
+    a status log file, until interrupted. Studies run without task results
+    also sample the completed tasks of each queue.
+
+    :param `task_server`: The task server to query.
+    :param `spec`: A MerlinSpec object
+    :param `steps`: Spaced-separated list of stepnames to query. Default is all
+    :param `status_file`: The status log file to append to
+    :param `interval`: The time (in seconds) between samples
+    :param `csv_file`: An optional csv file to also append each sample to
+    """
+    LOG.info(f"Recording the status of queues for steps = {steps} to '{status_file}' every {interval}s")
+    queues = spec.get_queue_list(steps)
+    count_completed = not spec.merlin["resources"]["task_results"]
+    last_header = None
+    with get_stats_client(task_server) as stats_client, StatusLog(status_file) as status_log:
+        try:
+            while True:
+                sample_time = time.time()
+                query_return = query_status(task_server, spec, steps, verbose=False, stats_client=stats_client)
+                query_return = with_empty_queues(query_return, queues)
+                completed = None
+                if count_completed:
+                    completed = completed_by_queue(spec, query_completion(task_server, spec) or {})
+                status_log.append(sample_time, query_return, completed)
+                if csv_file is not None:
+                    last_header = dump_status(query_return, csv_file, last_header)
+                total_jobs = sum(jobs for _, jobs, _ in query_return)
+                LOG.info(f"Status: {total_jobs} queued tasks in {len(query_return)} queues")
+                time.sleep(max(0, interval - (time.time() - sample_time)))
+        except KeyboardInterrupt:
+            LOG.info("Status: stopped recording")
+
+
+def summarize_status(spec, steps, status_file):
+    """
+    Summarize the queue status samples recorded by watch_status.
+
+    :param `spec`: A MerlinSpec object
+    :param `steps`: Spaced-separated list of stepnames to summarize. Default is all
+    :param `status_file`: The status log file to read
+    :return: The summary table as a string
+    """
+    if not os.path.exists(status_file):
+        raise ValueError(f"Status file '{status_file}' does not exist")
+    with StatusLog(status_file) as status_log:
+        samples = status_log.read(spec.get_queue_list(steps))
+    return format_summary(summarize(samples))
 
 
 def query_workers(task_server):
@@ -237,15 +384,16 @@ def create_config(task_server: str, config_dir: str, broker: str, test: str) ->
         LOG.error("Only celery can be configured currently.")
 
 
-def check_merlin_status(args, spec):
+def check_merlin_status(args, spec, stats_client=None):
     """
     Function to check merlin workers and queues to keep
     the allocation alive
 
     :param `args`: parsed CLI arguments
     :param `spec`: the parsed spec.yaml
+    :param `stats_client`: An open client from get_stats_client to reuse
     """
-    queue_status = query_status(args.task_server, spec, args.steps, verbose=False)
+    queue_status = query_status(args.task_server, spec, args.steps, verbose=False, stats_client=stats_client)
 
     total_jobs = 0
     total_consumers = 0
@@ -277,3 +425,19 @@ def check_merlin_status(args, spec):
             total_jobs = 0
 
     return total_jobs
+
+
+def monitor_events(args, spec, stats_client):
+    """
+    Function to block until the merlin queues are drained and their
+    tasks are done, driven by task server events rather than polling.
+
+    :param `args`: parsed CLI arguments
+    :param `spec`: the parsed spec.yaml
+    :param `stats_client`: An open client from get_stats_client to reuse
+    """
+    if args.task_server == "celery":
+        queues = spec.get_queue_list(args.steps)
+        monitor_celery_events(queues, spec.get_worker_names(), stats_client, args.sleep)
+    else:
+        LOG.error("Celery is not specified as the task server!")
@@ -56,6 +56,8 @@ STUDY_STEP_RUN = {
     "task_queue",
     "shell",
     "max_retries",
+    "retry_delay",
+    "max_retry_delay",
     "depends",
     "nodes",
     "procs",
@@ -74,10 +76,10 @@ STUDY_STEP_RUN = {
 
 PARAMETER = {"values", "label"}
 
-MERLIN_RESOURCES = {"task_server", "overlap", "workers"}
+MERLIN_RESOURCES = {"task_server", "overlap", "task_results", "max_queued_tasks", "workers"}
 
 MERLIN = {"resources", "samples"}
 
-WORKER = {"steps", "nodes", "batch", "args", "machines"}
+WORKER = {"steps", "nodes", "batch", "args", "machines", "autoscale", "cores"}
 
-SAMPLES = {"generate", "level_max_dirs", "file", "column_labels"}
+SAMPLES = {"generate", "level_max_dirs", "file", "column_labels", "paths_all_file", "index_file"}
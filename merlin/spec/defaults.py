@@ -40,7 +40,13 @@ PARAMETER = {"global.parameters": {}}
 
 MERLIN = {
     "merlin": {
-        "resources": {"task_server": "celery", "overlap": False, "workers": None},
+        "resources": {
+            "task_server": "celery",
+            "overlap": False,
+            "task_results": True,
+            "max_queued_tasks": None,
+            "workers": None,
+        },
         "samples": None,
     }
 }
@@ -50,4 +56,6 @@ WORKER = {"steps": ["all"], "nodes": None, "batch": None}
 SAMPLES = {
     "generate": {"cmd": "echo 'Insert sample-generating command here'"},
     "level_max_dirs": 25,
+    "paths_all_file": False,
+    "index_file": False,
 }
@@ -196,17 +196,19 @@ def parameter_substitutions_for_sample(sample, labels, sample_id, relative_path_
     return substitutions
 
 
-def parameter_substitutions_for_cmd(glob_path, sample_paths):
+def parameter_substitutions_for_cmd(glob_path, sample_paths=None):
     """
     :param glob_path: a glob that should yield the paths to all merlin samples
-    :param sample_paths: a delimited list of all of the samples
+    :param sample_paths: a delimited list of all of the samples, or the path
+        to a file listing them. $(MERLIN_PATHS_ALL) is left as is if None.
 
     :return : list of pairs indicating what needs to be substituted for a
         merlin cmd
     """
     substitutions = []
     substitutions.append(("$(MERLIN_GLOB_PATH)", glob_path))
-    substitutions.append(("$(MERLIN_PATHS_ALL)", sample_paths))
+    if sample_paths is not None:
+        substitutions.append(("$(MERLIN_PATHS_ALL)", sample_paths))
     # Return codes
     substitutions.append(("$(MERLIN_SUCCESS)", str(int(ReturnCode.OK))))
     substitutions.append(("$(MERLIN_RESTART)", str(int(ReturnCode.RESTART))))
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Scale the concurrency of running celery workers with the backlog of their queues.
+
+Worker entries in the merlin resources section of a spec can give bounds on
+the number of processes of each of their workers:
+
+    merlin:
+      resources:
+        workers:
+          simworkers:
+            steps: [run]
+            autoscale: {min: 2, max: 32}
+          postworkers:
+            steps: [post]
+            autoscale: {min: 1, max: 8}
+
+'merlin run-workers --autoscale' launches these workers with their minimum
+concurrency and then polls the broker. Workers whose queues hold a backlog
+that is not draining fast enough grow their pools with the pool_grow control
+command, and workers whose queues stay empty shrink back towards their
+minimum with pool_shrink, so that the cores of an allocation follow the work
+between e.g. simulation and post-processing queues.
+"""
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from merlin.study.celeryadapter import get_queues
+from merlin.study.queue_stats import QueueStatsClient
+from merlin.utils import get_yaml_var
+
+
+LOG = logging.getLogger(__name__)
+
+# Default time (in seconds) between polls of the broker.
+DEFAULT_INTERVAL = 30
+
+# Number of consecutive polls a worker's queues must be empty before its
+# pool shrinks, so that short gaps between task groups do not cause churn.
+IDLE_POLLS = 2
+
+
+def get_autoscale_bounds(worker_val) -> Optional[Tuple[int, int]]:
+    """
+    Return the (min, max) concurrency of a worker entry of a spec, or None if
+    it does not autoscale.
+
+    :param `worker_val`: The entry of the worker in merlin.resources.workers
+    """
+    bounds = get_yaml_var(worker_val, "autoscale", None)
+    if not bounds:
+        return None
+    min_concurrency = int(bounds.get("min", 1))
+    max_concurrency = int(bounds["max"])
+    if not 1 <= min_concurrency <= max_concurrency:
+        raise ValueError(f"Invalid autoscale bounds {bounds}, expected 1 <= min <= max")
+    return min_concurrency, max_concurrency
+
+
+def plan_concurrency(current, backlog, previous_backlog, idle_polls, bounds, n_workers=1) -> int:
+    """
+    Return the number of processes a worker should run.
+
+    A backlog is spread over the workers of the entry, unless the previous
+    poll shows the queues emptying before the next one at the current rate.
+    Once the queues have been empty for IDLE_POLLS polls, half of the
+    processes above the minimum are released.
+
+    :param `current`: The worker's current number of processes
+    :param `backlog`: The number of messages ready in the worker's queues
+    :param `previous_backlog`: The backlog at the previous poll, if any
+    :param `idle_polls`: The number of consecutive polls with an empty backlog
+    :param `bounds`: The (min, max) concurrency of the worker
+    :param `n_workers`: The number of workers sharing the backlog
+    """
+    min_concurrency, max_concurrency = bounds
+    target = current
+    if backlog > 0:
+        draining = previous_backlog is not None and previous_backlog - backlog >= backlog
+        if not draining:
+            target = current + math.ceil(backlog / max(n_workers, 1))
+    elif idle_polls >= IDLE_POLLS:
+        target = current - max(1, (current - min_concurrency) // 2)
+    return min(max_concurrency, max(min_concurrency, target))
+
+
+class WorkerGroup:
+    """The workers started from one worker entry of a spec, and their bounds."""
+
+    def __init__(self, name: str, queues: List[str], bounds: Tuple[int, int]):
+        self.name = name
+        self.queues = queues
+        self.bounds = bounds
+        self.previous_backlog: Optional[int] = None
+        self.idle_polls = 0
+
+    def nodes(self, active_queues: Dict[str, List[str]]) -> List[str]:
+        """Return the celery nodes consuming this group's queues, preferring those named after it."""
+        nodes = sorted({node for queue in self.queues for node in active_queues.get(queue, [])})
+        named = [node for node in nodes if self.name in node]
+        return named or nodes
+
+    def observe(self, backlog: int):
+        """Record the backlog of a poll, after the group has been scaled for it."""
+        self.previous_backlog = backlog
+        self.idle_polls = 0 if backlog else self.idle_polls + 1
+
+
+def get_worker_groups(spec, steps) -> List[WorkerGroup]:
+    """
+    Return the worker entries of a spec that have autoscale bounds.
+
+    :param `spec`: A MerlinSpec object
+    :param `steps`: The steps the workers were launched for
+    """
+    groups = []
+    for worker_name, worker_val in spec.merlin["resources"]["workers"].items():
+        bounds = get_autoscale_bounds(worker_val)
+        if bounds is None:
+            continue
+        wsteps = get_yaml_var(worker_val, "steps", steps)
+        groups.append(WorkerGroup(worker_name, spec.make_queue_string(wsteps).split(","), bounds))
+    return groups
+
+
+class Autoscaler:
+    """
+    Poll the broker and resize the pools of the workers of each group.
+
+    :example:
+
+    >>> Autoscaler(get_worker_groups(spec, ["all"])).run()
+    """
+
+    def __init__(self, groups: List[WorkerGroup], app=None, stats_client=None, interval: float = DEFAULT_INTERVAL):
+        if app is None:
+            from merlin.celery import get_app  # pylint: disable=import-outside-toplevel
+
+            app = get_app()
+        self.groups = groups
+        self.app = app
+        self.stats_client = stats_client if stats_client is not None else QueueStatsClient(app=app)
+        self.interval = interval
+
+    def concurrency(self, nodes: List[str]) -> Dict[str, int]:
+        """
+        Return the current pool size of each of the nodes that reported it.
+
+        The pool's 'max-concurrency' stays at its launch value after a
+        pool_grow or pool_shrink, so the size is the number of its processes.
+        """
+        stats = self.app.control.inspect(destination=nodes).stats() or {}
+        sizes = {}
+        for node, node_stats in stats.items():
+            processes = node_stats.get("pool", {}).get("processes")
+            if isinstance(processes, list):
+                sizes[node] = len(processes)
+        return sizes
+
+    def resize(self, node: str, current: int, target: int):
+        """Grow or shrink the pool of a node from current to target processes."""
+        if target > current:
+            replies = self.app.control.pool_grow(target - current, destination=[node], reply=True)
+        else:
+            replies = self.app.control.pool_shrink(current - target, destination=[node], reply=True)
+        for reply in replies or []:
+            for name, answer in reply.items():
+                if "error" in answer:
+                    LOG.warning(f"Could not resize the pool of {name} to {target}: {answer['error']}")
+                    return
+        LOG.info(f"Resized the pool of {node} from {current} to {target} processes.")
+
+    def poll(self):
+        """Scale every group once for the current backlog of its queues."""
+        active_queues, _ = get_queues(self.app)
+        queues = sorted({queue for group in self.groups for queue in group.queues})
+        jobs = {name: count for name, count, _ in self.stats_client.query(queues)}
+        for group in self.groups:
+            backlog = sum(jobs.get(queue, 0) for queue in group.queues)
+            nodes = group.nodes(active_queues)
+            if not nodes:
+                LOG.debug(f"No workers of {group.name} are running yet.")
+                continue
+            for node, current in self.concurrency(nodes).items():
+                target = plan_concurrency(
+                    current, backlog, group.previous_backlog, group.idle_polls, group.bounds, len(nodes)
+                )
+                if target != current:
+                    self.resize(node, current, target)
+            group.observe(backlog)
+
+    def run(self):
+        """Poll every interval seconds until interrupted."""
+        LOG.info(f"Autoscaling {', '.join(group.name for group in self.groups)} every {self.interval} seconds.")
+        try:
+            while True:
+                try:
+                    self.poll()
+                except Exception as e:  # pylint: disable=broad-except
+                    LOG.warning(f"Autoscaling poll failed: {e}")
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            LOG.info("Stopped autoscaling; the workers keep their current pool sizes.")
+        finally:
+            self.stats_client.close()
@@ -33,13 +33,19 @@ This module provides an adapter to the Celery Distributed Task Queue.
 """
 import logging
 import os
+import re
+import shlex
 import socket
 import subprocess
 import time
 from contextlib import suppress
 
+from merlin.common.resource_pool import CORES_ENV
 from merlin.study.batch import batch_check_parallel, batch_worker_launch
-from merlin.utils import check_machines, get_procs, get_yaml_var, is_running, regex_list_filter
+from merlin.study.event_monitor import EventMonitor
+from merlin.study.queue_stats import QueueStatsClient
+from merlin.study.worker_registry import WorkerRegistry
+from merlin.utils import check_machines, get_yaml_var, regex_list_filter
 
 
 LOG = logging.getLogger(__name__)
@@ -51,9 +57,11 @@ def run_celery(study, run_mode=None):
     configure Celery to run locally (without workers).
     """
     # Only import celery stuff if we want celery in charge
-    from merlin.celery import app
+    from merlin.celery import get_app
     from merlin.common.tasks import queue_merlin_study
 
+    app = get_app()
+
     adapter_config = study.get_adapter_config(override_type="local")
 
     if run_mode == "local":
@@ -67,28 +75,19 @@ def run_celery(study, run_mode=None):
     queue_merlin_study(study, adapter_config)
 
 
-def get_running_queues():
+def get_running_queues(registry=None):
     """
-    Check for running celery workers with -Q queues
-    and return a unique list of the queues
+    Check for running celery workers launched by merlin
+    and return a unique list of their queues
 
     Must be run on the allocation where the workers are running
-    """
-    running_queues = []
-
-    if not is_running("celery worker"):
-        return running_queues
-
-    procs = get_procs("celery")
-    for _, lcmd in procs:
-        lcmd = list(filter(None, lcmd))
-        cmdline = " ".join(lcmd)
-        if "-Q" in cmdline:
-            running_queues.extend(lcmd[lcmd.index("-Q") + 1].split(","))
-
-    running_queues = list(set(running_queues))
 
-    return running_queues
+    :param WorkerRegistry registry: The registry to read, e.g. one kept for
+        a whole 'run-workers' invocation. If None, this host's registry is read.
+    """
+    if registry is None:
+        registry = WorkerRegistry()
+    return registry.running_queues()
 
 
 def get_queues(app):
@@ -105,8 +104,8 @@ def get_queues(app):
 
     :example:
 
-    >>> from merlin.celery import app
-    >>> queues, workers = get_queues(app)
+    >>> from merlin.celery import get_app
+    >>> queues, workers = get_queues(get_app())
     >>> queue_names = [*queues]
     >>> workers_on_q0 = queues[queue_names[0]]
     >>> workers_not_on_q0 = [worker for worker in workers
@@ -140,26 +139,46 @@ def query_celery_workers():
         LOG.warning("No workers found!")
 
 
-def query_celery_queues(queues):
+def query_celery_queues(queues, stats_client=None):
     """Return stats for queues specified.
 
     Send results to the log.
+
+    :param list queues: The names of the queues to query
+    :param QueueStatsClient stats_client: An open client to reuse across
+        queries. If None, a client is opened and closed for this query.
+    :return: A list of (name, jobs, consumers) for each queue found
     """
-    from merlin.celery import app
+    if stats_client is not None:
+        return stats_client.query(queues)
 
-    connection = app.connection()
-    found_queues = []
-    try:
-        channel = connection.channel()
-        for queue in queues:
-            try:
-                name, jobs, consumers = channel.queue_declare(queue=queue, passive=True)
-                found_queues.append((name, jobs, consumers))
-            except Exception as e:
-                LOG.warning(f"Cannot find queue {queue} on server.{e}")
-    finally:
-        connection.close()
-    return found_queues
+    with QueueStatsClient() as client:
+        return client.query(queues)
+
+
+def query_celery_completion(study_name):
+    """Return the completion counts of a study run without task results.
+
+    :param str study_name: The name of the study
+    :return: dict of '<step name>:<return code>' to the number of step tasks
+    """
+    from merlin.celery import get_app
+    from merlin.common.completion import completion_key, get_completion_counts
+
+    return get_completion_counts(get_app().backend, completion_key(study_name))
+
+
+def monitor_celery_events(queues, worker_names, stats_client, sleep):
+    """Block until the queues are drained, driven by celery worker and task events.
+
+    :param list queues: The names of the queues to monitor
+    :param list worker_names: The names of the workers consuming the queues
+    :param QueueStatsClient stats_client: An open client for queue queries
+    :param int sleep: The longest time between queue queries without events
+    """
+    from merlin.celery import get_app
+
+    EventMonitor(get_app(), queues, worker_names, stats_client, sleep=sleep).run()
 
 
 def get_workers_from_app():
@@ -169,9 +188,9 @@ def get_workers_from_app():
     :return: A list of all connected workers
     :rtype: list
     """
-    from merlin.celery import app
+    from merlin.celery import get_app
 
-    i = app.control.inspect()
+    i = get_app().control.inspect()
     workers = i.ping()
     if workers is None:
         return []
@@ -196,6 +215,8 @@ def start_celery_workers(spec, steps, celery_args, just_return_command):
                 steps: [run, data]
                 nodes: 1
                 machine: [hostA, hostB]
+                autoscale: {min: 1, max: 8}
+                cores: 36
     """
     if not just_return_command:
         LOG.info("Starting workers")
@@ -215,16 +236,15 @@ def start_celery_workers(spec, steps, celery_args, just_return_command):
 
     worker_list = []
     local_queues = []
+    # Read the registered workers of this host once for all the worker entries.
+    registry = WorkerRegistry()
 
     for worker_name, worker_val in workers.items():
         skip_loop_step: bool = examine_and_log_machines(worker_val, yenv)
         if skip_loop_step:
             continue
 
-        worker_args = get_yaml_var(worker_val, "args", celery_args)
-        with suppress(KeyError):
-            if worker_val["args"] is None:
-                worker_args = ""
+        worker_args = get_worker_args(worker_val, celery_args)
 
         worker_nodes = get_yaml_var(worker_val, "nodes", None)
 
@@ -248,7 +268,7 @@ def start_celery_workers(spec, steps, celery_args, just_return_command):
 
         worker_cmd = batch_worker_launch(spec, celery_cmd, nodes=worker_nodes, batch=worker_batch)
 
-        worker_cmd = os.path.expandvars(worker_cmd)
+        worker_cmd = with_core_budget(worker_val, os.path.expandvars(worker_cmd))
 
         try:
             kwargs = {"env": spenv, "shell": True, "universal_newlines": True}
@@ -269,7 +289,7 @@ def start_celery_workers(spec, steps, celery_args, just_return_command):
 
             running_queues.extend(local_queues)
             if not overlap:
-                running_queues.extend(get_running_queues())
+                running_queues.extend(get_running_queues(registry))
                 # Cache the queues from this worker to use to test
                 # for existing queues in any subsequent workers.
                 # If overlap is True, then do not check the local queues.
@@ -287,7 +307,8 @@ def start_celery_workers(spec, steps, celery_args, just_return_command):
                 )
                 continue
 
-            _ = subprocess.Popen(worker_cmd, **kwargs)
+            proc = subprocess.Popen(worker_cmd, **kwargs)
+            registry.register(proc.pid, worker_name, queues, worker_cmd)
 
             worker_list.append(worker_cmd)
 
@@ -299,6 +320,40 @@ def start_celery_workers(spec, steps, celery_args, just_return_command):
     return str(worker_list)
 
 
+def has_concurrency_arg(worker_args):
+    """Return whether celery worker args set the concurrency, with -c or --concurrency."""
+    return re.search(r"(^|\s)(-c|--concurrency)(\s|=|\d|$)", worker_args) is not None
+
+
+def get_worker_args(worker_val, celery_args):
+    """
+    Return the celery arguments of a worker entry, defaulting to celery_args.
+    Workers with autoscale bounds start at their minimum concurrency.
+    """
+    from merlin.study.autoscaler import get_autoscale_bounds
+
+    worker_args = get_yaml_var(worker_val, "args", celery_args)
+    with suppress(KeyError):
+        if worker_val["args"] is None:
+            worker_args = ""
+
+    autoscale = get_autoscale_bounds(worker_val)
+    if autoscale is not None and not has_concurrency_arg(worker_args):
+        worker_args += f" --concurrency {autoscale[0]}"
+    return worker_args
+
+
+def with_core_budget(worker_val, worker_cmd):
+    """
+    Return the launch command of a worker entry, setting MERLIN_WORKER_CORES
+    for the worker when the entry has a 'cores' budget (a number or 'auto').
+    """
+    cores = get_yaml_var(worker_val, "cores", None)
+    if cores is None:
+        return worker_cmd
+    return f"{CORES_ENV}={shlex.quote(str(cores))} {worker_cmd}"
+
+
 def examine_and_log_machines(worker_val, yenv) -> bool:
     """
     Examines whether a worker should be skipped in a step of start_celery_workers(), logs errors in output path for a celery
@@ -326,7 +381,7 @@ def verify_args(spec, worker_args, worker_name, overlap):
     """Examines the args passed to a worker for completeness."""
     parallel = batch_check_parallel(spec)
     if parallel:
-        if "--concurrency" not in worker_args:
+        if not has_concurrency_arg(worker_args):
             LOG.warning("The worker arg --concurrency [1-4] is recommended when running parallel tasks")
         if "--prefetch-multiplier" not in worker_args:
             LOG.warning("The worker arg --prefetch-multiplier 1 is recommended when running parallel tasks")
@@ -363,22 +418,49 @@ def launch_celery_workers(spec, steps=None, worker_args="", just_return_command=
         pass
 
 
-def purge_celery_tasks(queues, force):
+def purge_celery_tasks(queues, force, app=None):
     """
     Purge celery tasks for the specified spec file.
 
-    queues              Which queues to purge
+    The queues are purged in this process over a connection from the app's
+    pool, rather than by running 'celery purge' in a subprocess. Step retries
+    waiting in the results backend for the queues are dropped as well.
+
+    queues              Which queues to purge, comma separated
     force               Purge without asking for confirmation
+    app                 The celery application, defaults to merlin's app
+    :return: 0 if the queues were purged, 1 if the purge was cancelled
     """
-    # This version will purge all queues.
-    # from merlin.celery import app
-    # app.control.purge()
-    force_com = ""
-    if force:
-        force_com = " -f "
-    purge_command = " ".join(["celery -A merlin purge", force_com, "-Q", queues])
-    LOG.debug(purge_command)
-    return subprocess.run(purge_command, shell=True).returncode
+    from merlin.common.retry_queue import clear_retries
+
+    if app is None:
+        from merlin.celery import get_app
+
+        app = get_app()
+    names = [queue for queue in queues.split(",") if queue]
+    if not force:
+        answer = input(f"Purge all messages from the queues {', '.join(names)}? [y/N]: ")
+        if answer.strip().lower() not in ("y", "yes"):
+            LOG.info("Purge cancelled.")
+            return 1
+
+    purged = 0
+    with app.connection_for_write() as conn:
+        channel = conn.default_channel
+        for queue in names:
+            try:
+                count = channel.queue_purge(queue) or 0
+            except conn.channel_errors as e:
+                # amqp brokers close the channel when a queue does not exist.
+                LOG.debug(f"Could not purge queue {queue}. {e}")
+                channel = conn.channel()
+                continue
+            LOG.debug(f"Purged {count} messages from {queue}.")
+            purged += count
+    if clear_retries(app.backend, names):
+        LOG.debug(f"Dropped the waiting retries of {len(names)} queues.")
+    LOG.info(f"Purged {purged} messages from {len(names)} queues.")
+    return 0
 
 
 def stop_celery_workers(queues=None, spec_worker_names=None, worker_regex=None):
@@ -400,9 +482,16 @@ def stop_celery_workers(queues=None, spec_worker_names=None, worker_regex=None):
     >>> stop_celery_workers()
 
     """
-    from merlin.celery import app
+    from merlin.celery import get_app
 
+    app = get_app()
     LOG.debug(f"Sending stop to queues: {queues}, worker_regex: {worker_regex}, spec_worker_names: {spec_worker_names}")
+    if queues is None and not spec_worker_names and worker_regex is None:
+        # Nothing to select workers by: one broadcast reaches them all,
+        # without inspecting their queues first.
+        LOG.info("Sending stop to all workers")
+        return app.control.broadcast("shutdown")
+
     active_queues, _ = get_queues(app)
 
     # If not specified, get all the queues
@@ -422,21 +511,19 @@ def stop_celery_workers(queues=None, spec_worker_names=None, worker_regex=None):
 
     LOG.debug(f"Pre-filter worker stop list: {all_workers}")
 
-    print(f"all_workers: {all_workers}")
-    print(f"spec_worker_names: {spec_worker_names}")
     if (spec_worker_names is None or len(spec_worker_names) == 0) and worker_regex is None:
         workers_to_stop = list(all_workers)
     else:
         workers_to_stop = []
         if (spec_worker_names is not None) and len(spec_worker_names) > 0:
             for worker_name in spec_worker_names:
-                print(f"Result of regex_list_filter: {regex_list_filter(worker_name, all_workers)}")
                 workers_to_stop += regex_list_filter(worker_name, all_workers, match=False)
         if worker_regex is not None:
             workers_to_stop += regex_list_filter(worker_regex, workers_to_stop)
 
-    print(f"workers_to_stop: {workers_to_stop}")
     if workers_to_stop:
+        # One broadcast for all the selected workers.
+        workers_to_stop = sorted(set(workers_to_stop))
         LOG.info(f"Sending stop to these workers: {workers_to_stop}")
         return app.control.broadcast("shutdown", destination=workers_to_stop)
     else:
@@ -0,0 +1,227 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Event-driven monitoring of a study's queues and workers.
+
+Instead of sleeping between queue queries, the EventMonitor subscribes to the
+celery event stream. Worker heartbeats tell it which workers are alive and
+task completion events tell it when to look at the queues again, so it can
+stop as soon as the work is done.
+"""
+import logging
+import time
+from typing import List, Optional
+
+from celery import states
+
+
+LOG = logging.getLogger(__name__)
+
+# Minimum time (in seconds) between queue queries triggered by task events.
+MIN_CHECK_INTERVAL = 1.0
+
+# Number of sleep periods to wait for a worker before giving up, matching
+# the polling monitor.
+WORKER_WAIT_PERIODS = 10
+
+# Task events that mean a task has left a worker, so the queues may be empty.
+TASK_DONE_EVENTS = ("task-succeeded", "task-failed", "task-rejected", "task-revoked", "task-retried")
+
+
+class EventMonitor:
+    """
+    Keep watch over a study's queues by listening to celery events.
+
+    :example:
+
+    >>> with QueueStatsClient() as stats_client:
+    ...     EventMonitor(app, queues, worker_names, stats_client, sleep=60).run()
+    """
+
+    def __init__(self, app, queues: List[str], worker_names: List[str], stats_client, sleep: float = 60):
+        """
+        :param `app`: The celery application
+        :param `queues`: The names of the queues to watch
+        :param `worker_names`: The names of the spec workers that consume the queues
+        :param `stats_client`: An open QueueStatsClient
+        :param `sleep`: The longest time (in seconds) between queue queries when
+            there are no events
+        """
+        self.app = app
+        self.queues = queues
+        self.worker_names = worker_names
+        self.stats_client = stats_client
+        self.sleep = sleep
+        self.state = app.events.State()
+        self.total_jobs: Optional[int] = None
+        self.total_consumers: int = 0
+        self.finished: bool = False
+        self._check_needed: bool = True
+        self._last_check: float = 0.0
+        self._waiting_since: Optional[float] = None
+
+    @property
+    def active_tasks(self) -> int:
+        """
+        The number of tasks received or started by the spec workers that are
+        alive; the tasks of a worker whose heartbeats stopped are not counted.
+        """
+        return sum(
+            1
+            for task in self.state.tasks.values()
+            if task.state in (states.RECEIVED, states.STARTED)
+            and task.worker is not None
+            and task.worker.alive
+            and self._is_spec_worker(task.worker)
+        )
+
+    def _is_spec_worker(self, worker) -> bool:
+        return any(name in worker.hostname for name in self.worker_names)
+
+    def workers_alive(self) -> bool:
+        """Whether any of the spec workers has a current heartbeat."""
+        return any(self._is_spec_worker(worker) for worker in self.state.alive_workers())
+
+    def handle_event(self, event):
+        """
+        Update the live worker and task state from a celery event.
+
+        :param `event`: The event dictionary
+        """
+        self.state.event(event)
+        if event["type"] in TASK_DONE_EVENTS:
+            self._check_needed = True
+
+    def seed_tasks(self):
+        """
+        Add the tasks the spec workers hold from before the monitor listened
+        to their events, prefetched or running, to the task state.
+        """
+        inspect = self.app.control.inspect()
+        now = time.time()
+        for held, event_type in ((inspect.reserved, "task-received"), (inspect.active, "task-started")):
+            for hostname, tasks in (held() or {}).items():
+                if not any(name in hostname for name in self.worker_names):
+                    continue
+                for task in tasks:
+                    # The event also counts as a heartbeat of the worker that replied.
+                    self.state.event(
+                        {
+                            "type": event_type,
+                            "uuid": task["id"],
+                            "hostname": hostname,
+                            "timestamp": now,
+                            "local_received": now,
+                            "clock": 0,
+                        }
+                    )
+        LOG.debug(f"Monitor: {self.active_tasks} tasks held by the workers")
+
+    def query_queues(self):
+        """Refresh the job and consumer totals from the broker."""
+        self.total_jobs = 0
+        self.total_consumers = 0
+        for _, jobs, consumers in self.stats_client.query(self.queues):
+            self.total_jobs += jobs
+            self.total_consumers += consumers
+        self._last_check = time.monotonic()
+        self._check_needed = False
+        LOG.debug(
+            f"Monitor: {self.total_jobs} queued tasks, {self.total_consumers} consumers, {self.active_tasks} active tasks"
+        )
+
+    def check(self) -> bool:
+        """
+        Re-examine the queues when a task has finished or when the sleep
+        period has passed, and decide whether monitoring is done.
+
+        :return: True once there is no work left (or no workers to do it)
+        """
+        since_check = time.monotonic() - self._last_check
+        if (self._check_needed and since_check >= MIN_CHECK_INTERVAL) or since_check >= self.sleep:
+            self.query_queues()
+
+        if self.total_jobs == 0 and self.active_tasks == 0:
+            self.finished = True
+        elif self.total_jobs > 0 and self.total_consumers == 0 and not self.workers_alive():
+            # Wait for the workers to show up (e.g. a batch allocation starting).
+            if self._waiting_since is None:
+                LOG.info("Monitor: waiting for workers to connect ...")
+                self._waiting_since = time.monotonic()
+            elif time.monotonic() - self._waiting_since > WORKER_WAIT_PERIODS * self.sleep:
+                LOG.error("Monitor: no workers available to process the non-empty queue")
+                self.finished = True
+        else:
+            self._waiting_since = None
+        return self.finished
+
+    def enable_task_events(self) -> List[str]:
+        """
+        Have the workers send task events, they may not have been started with -E.
+
+        :return: The names of the workers that were not sending task events
+        """
+        replies = self.app.control.enable_events(reply=True) or []
+        return [
+            name
+            for reply in replies
+            for name, answer in reply.items()
+            if answer.get("ok") == "task events enabled"
+        ]
+
+    def run(self):
+        """Block until the study's queues are drained and its tasks are done."""
+        self.seed_tasks()
+        self.query_queues()
+        if self.check():
+            return
+
+        enabled = self.enable_task_events()
+        try:
+            with self.app.connection() as connection:
+
+                def on_event(event):
+                    self.handle_event(event)
+                    stop_when_finished()
+
+                def stop_when_finished():
+                    if self.check():
+                        receiver.should_stop = True
+
+                receiver = self.app.events.Receiver(connection, handlers={"*": on_event})
+                # Also check once a second when there are no events.
+                receiver.on_iteration = stop_when_finished
+                # wakeup asks the workers for a heartbeat right away.
+                receiver.capture(limit=None, timeout=None, wakeup=True)
+        finally:
+            # Leave the workers as they were started.
+            if enabled:
+                self.app.control.disable_events(destination=enabled)
@@ -0,0 +1,225 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Batched queue statistics queries against the task server's broker.
+
+A QueueStatsClient holds a single broker connection open so that repeated
+queries (e.g. from 'merlin monitor') do not reconnect on every poll, and
+gathers the stats for all requested queues in as few round trips as the
+broker allows:
+
+  - RabbitMQ with a configured management api: one HTTP request.
+  - Redis: one pipelined request. Redis keeps no consumer counts, which are
+    reported as 0.
+  - Anything else: passive queue declares on one reused channel.
+"""
+import base64
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+
+LOG = logging.getLogger(__name__)
+
+# Timeout (in seconds) for management api requests.
+MANAGEMENT_API_TIMEOUT = 10
+
+
+def fetch_management_queue_stats(api_config: Dict[str, str], timeout: float = MANAGEMENT_API_TIMEOUT) -> Dict[str, Tuple]:
+    """
+    Get the ready message and consumer counts of every queue in a vhost with
+    a single request to the RabbitMQ management HTTP api.
+
+    Note that the management api serves sampled statistics, so its counts can
+    lag the broker by a few seconds.
+
+    :param `api_config`: dict with the url, vhost, username and password of the api
+    :param `timeout`: The time (in seconds) to wait for the api
+    :return: dict of queue name to (name, jobs, consumers)
+    :rtype: Dict[str, Tuple]
+    """
+    url = f"{api_config['url']}/api/queues/{quote(api_config['vhost'], safe='')}?columns=name,messages_ready,consumers"
+    request = Request(url)
+    credentials = f"{api_config['username']}:{api_config['password']}".encode()
+    request.add_header("Authorization", f"Basic {base64.b64encode(credentials).decode()}")
+    with urlopen(request, timeout=timeout) as response:  # nosec - url comes from the user's app.yaml
+        queues = json.loads(response.read().decode())
+    return {q["name"]: (q["name"], q.get("messages_ready", 0), q.get("consumers", 0)) for q in queues}
+
+
+class QueueStatsClient:
+    """
+    Query queue statistics over a single, persistent broker connection.
+
+    :example:
+
+    >>> with QueueStatsClient() as client:
+    ...     while True:
+    ...         stats = client.query(["[merlin]_queue1", "[merlin]_queue2"])
+    """
+
+    def __init__(self, app=None, management_api: Optional[Dict[str, str]] = None):
+        """
+        :param `app`: The celery application, defaults to merlin's app
+        :param `management_api`: RabbitMQ management api settings, defaults
+            to the settings in app.yaml if any
+        """
+        if app is None:
+            from merlin.celery import get_app  # pylint: disable=import-outside-toplevel
+
+            app = get_app()
+        if management_api is None:
+            from merlin.config.broker import get_management_api_config  # pylint: disable=import-outside-toplevel
+
+            management_api = get_management_api_config()
+        self.app = app
+        self.management_api = management_api
+        self._connection = None
+        self._channel = None
+
+    @property
+    def connection(self):
+        """The broker connection, (re)established as needed."""
+        if self._connection is None:
+            self._connection = self.app.connection()
+        self._connection.ensure_connection(max_retries=1)
+        return self._connection
+
+    @property
+    def channel(self):
+        """The channel used for queue declares, reopened if it was closed."""
+        if self._channel is None:
+            self._channel = self.connection.channel()
+        return self._channel
+
+    def _reset_channel(self):
+        """Drop the current channel, e.g. after a failed declare closed it."""
+        if self._channel is not None:
+            try:
+                self._channel.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        self._channel = None
+
+    def query(self, queues: List[str]) -> List[Tuple]:
+        """
+        Return stats for the queues specified.
+
+        :param `queues`: The names of the queues to query
+        :return: A list of (name, jobs, consumers) for each queue found
+        :rtype: List[Tuple]
+        """
+        driver = self.connection.transport.driver_type
+        stats = None
+        if self.management_api is not None and driver == "amqp":
+            stats = self._query_management_api(queues)
+        if stats is None and driver == "redis":
+            stats = self._query_redis(queues)
+        if stats is None:
+            stats = self._query_declares(queues)
+
+        found_queues = []
+        for queue in queues:
+            if queue in stats:
+                found_queues.append(stats[queue])
+            else:
+                LOG.warning(f"Cannot find queue {queue} on server.")
+        return found_queues
+
+    def _query_management_api(self, queues: List[str]) -> Optional[Dict[str, Tuple]]:
+        """Query all queues with one management api request, None on failure."""
+        try:
+            return fetch_management_queue_stats(self.management_api)
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.debug(f"Management api query failed, falling back to queue declares. {e}")
+            return None
+
+    def _query_redis(self, queues: List[str]) -> Optional[Dict[str, Tuple]]:
+        """
+        Query the length of all queues (and their priority lists) in one
+        pipeline, None on failure.
+
+        Redis drops a queue's lists once they are empty, so an empty queue is
+        only found through the binding kombu keeps for it (the exchange named
+        after the queue, as celery declares them). Redis has no notion of
+        consumers, so they are reported as 0.
+        """
+        channel = self.channel
+        try:
+            steps = channel.priority_steps
+            with channel.conn_or_acquire() as client:
+                with client.pipeline() as pipe:
+                    for queue in queues:
+                        for pri in steps:
+                            pipe.llen(channel._q_for_pri(queue, pri))  # pylint: disable=protected-access
+                        pipe.exists(channel.keyprefix_queue % queue)
+                    replies = pipe.execute()
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.debug(f"Pipelined redis query failed, falling back to queue declares. {e}")
+            self._reset_channel()
+            return None
+
+        stats = {}
+        width = len(steps) + 1
+        for i, queue in enumerate(queues):
+            sizes, bound = replies[i * width : i * width + len(steps)], replies[i * width + len(steps)]
+            jobs = sum(sizes)
+            if jobs > 0 or bound:
+                stats[queue] = (queue, jobs, 0)
+        return stats
+
+    def _query_declares(self, queues: List[str]) -> Dict[str, Tuple]:
+        """Query each queue with a passive declare on the shared channel."""
+        stats = {}
+        for queue in queues:
+            try:
+                name, jobs, consumers = self.channel.queue_declare(queue=queue, passive=True)
+                stats[queue] = (name, jobs, consumers)
+            except Exception as e:  # pylint: disable=broad-except
+                LOG.debug(f"Passive declare of queue {queue} failed. {e}")
+                # A failed passive declare closes the channel on amqp brokers.
+                self._reset_channel()
+        return stats
+
+    def close(self):
+        """Close the channel and release the broker connection."""
+        self._reset_channel()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tback):
+        self.close()
@@ -0,0 +1,244 @@
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+Append-only history of queue status samples, and summaries of it.
+
+Samples from 'merlin status --watch' are stored in a SQLite file, one row per
+queue per sample, so queues can come and go between samples. For studies run
+without task results, each row also holds the number of step tasks of the
+queue completed so far, from the study's completion counters. The summary
+fits the backlog and the completed tasks of each queue over time to report
+how fast tasks complete and arrive, how fast the backlog drains and when it
+is expected to be empty.
+"""
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from tabulate import tabulate
+
+
+LOG = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_status (
+    time REAL NOT NULL,
+    queue TEXT NOT NULL,
+    jobs INTEGER NOT NULL,
+    consumers INTEGER NOT NULL,
+    completed INTEGER
+);
+CREATE INDEX IF NOT EXISTS queue_status_queue_time ON queue_status (queue, time);
+"""
+
+
+class StatusLog:
+    """
+    An append-only SQLite log of (time, queue, jobs, consumers, completed) samples.
+
+    :example:
+
+    >>> with StatusLog("status.db") as log:
+    ...     log.append(time.time(), router.query_status(...))
+    ...     summary = summarize(log.read())
+    """
+
+    def __init__(self, path: str):
+        """
+        :param `path`: The file to log to, created if it does not exist
+        """
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def append(self, timestamp: float, query_return: List[Tuple], completed: Optional[Dict[str, int]] = None):
+        """
+        Add one sample for every queue in a query_status result.
+
+        :param `timestamp`: The time of the sample, in seconds since the epoch
+        :param `query_return`: The (name, jobs, consumers) output of query_status
+        :param `completed`: The number of tasks of each queue completed so far,
+            if the study counts them
+        """
+        completed = completed or {}
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO queue_status VALUES (?, ?, ?, ?, ?)",
+                [(timestamp, name, jobs, consumers, completed.get(name)) for name, jobs, consumers in query_return],
+            )
+
+    def read(self, queues: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Read the samples back, one (n, 4) array of time, jobs, consumers and
+        completed tasks (nan where not counted) per queue, in time order.
+
+        :param `queues`: Only read these queues. Default is all of them.
+        :return: A dict of queue name to samples
+        """
+        rows = self._db.execute(
+            "SELECT queue, time, jobs, consumers, completed FROM queue_status ORDER BY queue, time"
+        ).fetchall()
+        samples: Dict[str, List[Tuple]] = {}
+        for queue, timestamp, jobs, consumers, completed in rows:
+            if queues is None or queue in queues:
+                samples.setdefault(queue, []).append((timestamp, jobs, consumers, completed))
+        # None (not counted) becomes nan.
+        return {queue: np.asarray(values, dtype=float) for queue, values in samples.items()}
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tback):
+        self.close()
+
+
+def summarize(samples: Dict[str, np.ndarray]) -> Dict[str, Dict[str, float]]:
+    """
+    Summarize the status samples of each queue.
+
+    The drain rate is the least-squares slope of the backlog over the sampled
+    time span, positive when the queue is shrinking. The ETA divides the last
+    backlog by that rate and is None for a queue that is not draining.
+
+    Where completed tasks were counted, the completion rate is the slope of
+    the completed tasks, and the enqueue rate, at which tasks arrive in the
+    queue, is the completion rate less the drain rate. Both are None for
+    queues without counts.
+
+    :param `samples`: The output of StatusLog.read
+    :return: A dict of queue name to its summary
+    """
+    summary = {}
+    for queue, values in samples.items():
+        times, jobs, consumers, completed = values[:, 0], values[:, 1], values[:, 2], values[:, 3]
+        span = times[-1] - times[0]
+        rate = 0.0
+        if len(times) > 1 and span > 0:
+            rate = -np.polyfit(times - times[0], jobs, 1)[0]
+        counted = ~np.isnan(completed)
+        completion_rate = None
+        if counted.sum() > 1 and np.ptp(times[counted]) > 0:
+            completion_rate = np.polyfit(times[counted] - times[0], completed[counted], 1)[0]
+        eta = None
+        if jobs[-1] == 0:
+            eta = 0.0
+        elif rate > 0:
+            eta = jobs[-1] / rate
+        summary[queue] = {
+            "samples": len(times),
+            "span": span,
+            "jobs": jobs[-1],
+            "peak_jobs": jobs.max(),
+            "mean_consumers": consumers.mean(),
+            "rate": rate,
+            "eta": eta,
+            "completed": completed[counted][-1] if counted.any() else None,
+            "completion_rate": completion_rate,
+            "enqueue_rate": None if completion_rate is None else completion_rate - rate,
+        }
+    return summary
+
+
+def _format_optional(value: Optional[float], fmt: str) -> str:
+    """Format a summary value that may not have been measured."""
+    return "-" if value is None else format(value, fmt)
+
+
+def _total(summary: Dict[str, Dict[str, float]], key: str) -> Optional[float]:
+    """Sum a summary value over the queues that measured it, or None if none did."""
+    values = [stats[key] for stats in summary.values() if stats[key] is not None]
+    return sum(values) if values else None
+
+
+def format_summary(summary: Dict[str, Dict[str, float]]) -> str:
+    """
+    Format a status summary as a table, with a line for the total.
+
+    :param `summary`: The output of summarize
+    :return: The table as a string
+    """
+    headers = [
+        "queue",
+        "samples",
+        "span (s)",
+        "queued",
+        "peak",
+        "consumers",
+        "drain rate (tasks/s)",
+        "ETA (s)",
+        "completed",
+        "completion rate (tasks/s)",
+        "enqueue rate (tasks/s)",
+    ]
+    rows = []
+    for queue, stats in sorted(summary.items()):
+        rows.append(
+            [
+                queue,
+                stats["samples"],
+                f"{stats['span']:.0f}",
+                int(stats["jobs"]),
+                int(stats["peak_jobs"]),
+                f"{stats['mean_consumers']:.1f}",
+                f"{stats['rate']:.3f}",
+                _format_optional(stats["eta"], ".0f"),
+                _format_optional(stats["completed"], ".0f"),
+                _format_optional(stats["completion_rate"], ".3f"),
+                _format_optional(stats["enqueue_rate"], ".3f"),
+            ]
+        )
+    total_jobs = sum(stats["jobs"] for stats in summary.values())
+    total_rate = sum(stats["rate"] for stats in summary.values())
+    total_eta = None
+    if total_jobs == 0:
+        total_eta = 0
+    elif total_rate > 0:
+        total_eta = total_jobs / total_rate
+    rows.append(
+        [
+            "total",
+            "",
+            "",
+            int(total_jobs),
+            "",
+            "",
+            f"{total_rate:.3f}",
+            _format_optional(total_eta, ".0f"),
+            _format_optional(_total(summary, "completed"), ".0f"),
+            _format_optional(_total(summary, "completion_rate"), ".3f"),
+            _format_optional(_total(summary, "enqueue_rate"), ".3f"),
+        ]
+    )
+    return tabulate(rows, headers=headers)
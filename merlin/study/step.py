@@ -29,6 +29,7 @@
 ###############################################################################
 
 import logging
+import math
 import re
 from contextlib import suppress
 from copy import deepcopy
@@ -39,6 +40,7 @@ from maestrowf.datastructures.core.executiongraph import _StepRecord
 from maestrowf.datastructures.core.study import StudyStep
 
 from merlin.common.abstracts.enums import ReturnCode
+from merlin.common.task_timing import TaskTimer
 from merlin.study.script_adapter import MerlinScriptAdapter
 
 
@@ -156,6 +158,32 @@ class Step:
         default_retry_delay = 1
         return self.mstep.step.__dict__["run"].get("retry_delay", default_retry_delay)
 
+    @property
+    def max_retry_delay(self):
+        """
+        Returns the cap on the delay of the step's retries, which back off
+        exponentially from retry_delay. Defaults to 600 seconds, or the
+        retry_delay if it is longer.
+        """
+        default_max_retry_delay = 600
+        return self.mstep.step.__dict__["run"].get("max_retry_delay", max(default_max_retry_delay, self.retry_delay))
+
+    @property
+    def cores(self):
+        """
+        Returns the number of cores the step uses on one node: its procs
+        spread over its nodes, times its cores per task. Defaults to 1.
+        """
+        run = self.mstep.step.__dict__["run"]
+
+        def as_count(key):
+            try:
+                return max(int(run.get(key) or 1), 1)
+            except (TypeError, ValueError):
+                return 1
+
+        return math.ceil(as_count("procs") / as_count("nodes")) * as_count("cores per task")
+
     @property
     def max_retries(self):
         """
@@ -208,6 +236,18 @@ class Step:
 
         return needs_expansion
 
+    def references(self, variable):
+        """
+        :param variable : The name of a variable, e.g. MERLIN_PATHS_ALL.
+
+        :return : True if the cmd or restart cmd reference $(variable).
+            Variable names are matched case-insensitively, as in their
+            substitution.
+        """
+        token = f"$({variable})".lower()
+        restart_cmd = self.get_restart_cmd()
+        return token in self.get_cmd().lower() or bool(restart_cmd and token in restart_cmd.lower())
+
     def get_workspace(self):
         """
         :return : The workspace this step is to be executed in.
@@ -220,14 +260,19 @@ class Step:
         """
         return self.mstep.step.__dict__["name"]
 
-    def execute(self, adapter_config):
+    def execute(self, adapter_config, timer=None):
         """
         Execute the step.
 
         :param adapter_config : A dictionary containing configuration for
             the maestro script adapter, as well as which sort of adapter
             to use.
+        :param timer : (Optional) a TaskTimer to record the time spent in
+            setting up the workspace, generating and running the script.
         """
+        if timer is None:
+            timer = TaskTimer()
+
         # Update shell if the task overrides the default value from the batch section
         default_shell = adapter_config.get("shell")
         shell = self.mstep.step.run.get("shell", default_shell)
@@ -251,8 +296,10 @@ class Step:
         # Preserve the default batch type if the step batch type is different
         adapter_config.update({"batch_type": default_batch_type})
 
-        self.mstep.setup_workspace()
-        self.mstep.generate_script(adapter)
+        with timer.phase("setup_workspace"):
+            self.mstep.setup_workspace()
+        with timer.phase("generate_script"):
+            self.mstep.generate_script(adapter)
         step_name = self.name()
         step_dir = self.get_workspace()
 
@@ -271,7 +318,9 @@ class Step:
         # above
         # If the above is done, then merlin_step in tasks.py can be changed to
         # calls to the step execute and restart functions.
-        if self.restart and self.get_restart_cmd():
-            return ReturnCode(self.mstep.restart(adapter))
-        else:
-            return ReturnCode(self.mstep.execute(adapter))
+        with timer.phase("run", children=True):
+            if self.restart and self.get_restart_cmd():
+                return_code = self.mstep.restart(adapter)
+            else:
+                return_code = self.mstep.execute(adapter)
+        return ReturnCode(return_code)
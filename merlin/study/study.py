@@ -258,6 +258,46 @@ class MerlinStudy:
             return self.expanded_spec.merlin["samples"]["level_max_dirs"]
         return defaults.SAMPLES["level_max_dirs"]
 
+    @property
+    def paths_all_file(self):
+        """
+        Returns whether $(MERLIN_PATHS_ALL) should be the path to a file
+        listing the sample paths rather than the paths themselves.
+        """
+        with suppress(TypeError, KeyError):
+            return bool(self.expanded_spec.merlin["samples"]["paths_all_file"])
+        return defaults.SAMPLES["paths_all_file"]
+
+    @property
+    def sample_index_file(self):
+        """
+        Returns whether to write a binary index of the sample directories to
+        merlin_info.
+        """
+        with suppress(TypeError, KeyError):
+            return bool(self.expanded_spec.merlin["samples"]["index_file"])
+        return defaults.SAMPLES["index_file"]
+
+    @property
+    def task_results(self):
+        """
+        Returns whether step tasks store their results in the results backend.
+        """
+        with suppress(TypeError, KeyError):
+            return bool(self.expanded_spec.merlin["resources"]["task_results"])
+        return defaults.MERLIN["merlin"]["resources"]["task_results"]
+
+    @property
+    def max_queued_tasks(self):
+        """
+        Returns the number of step tasks to keep queued for each group of
+        sample-expanded steps, or None to queue all of their samples at once.
+        """
+        with suppress(TypeError, KeyError, ValueError):
+            max_queued_tasks = self.expanded_spec.merlin["resources"]["max_queued_tasks"]
+            return int(max_queued_tasks) if max_queued_tasks else None
+        return defaults.MERLIN["merlin"]["resources"]["max_queued_tasks"]
+
     @cached_property
     def output_path(self):
         """
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright (c) 2022, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory
+# Written by the Merlin dev team, listed in the CONTRIBUTORS file.
+# <merlin@llnl.gov>
+#
+# LLNL-CODE-797170
+# All rights reserved.
+# This file is part of Merlin, Version: 1.8.5.
+#
+# For details, see https://github.com/LLNL/merlin.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+###############################################################################
+
+"""
+A registry of the workers launched by merlin on this host.
+
+Every worker that 'merlin run-workers' starts is recorded in a small json
+file, <registry>/<hostname>/<pid>.json, holding its name, queues, launch
+command and the start time of its process. Checking which queues already
+have workers then reads the few entries of this host and looks up each
+recorded pid, instead of scanning the whole process table. Entries whose
+process has exited (or whose pid now belongs to another process) are
+removed when the registry is read.
+
+The registry lives in ~/.merlin/workers unless the MERLIN_WORKER_REGISTRY
+environment variable names another directory. Only workers launched by
+merlin are registered.
+"""
+import json
+import logging
+import os
+import socket
+import time
+from typing import Dict, List, Optional
+
+import psutil
+
+
+LOG = logging.getLogger(__name__)
+
+REGISTRY_ENV = "MERLIN_WORKER_REGISTRY"
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".merlin", "workers")
+
+
+def _create_time(pid: int) -> Optional[float]:
+    """Return the start time of process pid, or None if it does not exist."""
+    try:
+        return psutil.Process(pid).create_time()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return None
+
+
+class WorkerRegistry:
+    """
+    The registered workers of one host, read once and then kept up to date
+    by register, so one 'run-workers' invocation reads the directory once.
+
+    :example:
+
+    >>> registry = WorkerRegistry()
+    >>> if "[merlin]_sim" not in registry.running_queues():
+    ...     proc = subprocess.Popen(cmd, shell=True)
+    ...     registry.register(proc.pid, "simworkers", ["[merlin]_sim"], cmd)
+    """
+
+    def __init__(self, directory: Optional[str] = None, hostname: Optional[str] = None):
+        """
+        :param `directory`: The registry directory, defaults to
+            $MERLIN_WORKER_REGISTRY or ~/.merlin/workers
+        :param `hostname`: The host whose workers to track, defaults to this host
+        """
+        directory = directory or os.environ.get(REGISTRY_ENV) or DEFAULT_DIRECTORY
+        self.directory: str = os.path.join(directory, hostname or socket.gethostname())
+        self._entries: Optional[List[Dict]] = None
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def entries(self) -> List[Dict]:
+        """Return the entries of the live registered workers, pruning stale ones."""
+        if self._entries is not None:
+            return self._entries
+        entries = []
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            filenames = []
+        for filename in filenames:
+            if not filename.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                with open(path, "r") as _file:
+                    entry = json.load(_file)
+            except (OSError, ValueError):
+                continue  # Removed or being written by another merlin.
+            create_time = _create_time(entry.get("pid", -1))
+            if create_time is not None and abs(create_time - entry.get("create_time", 0)) < 0.01:
+                entries.append(entry)
+            else:
+                LOG.debug(f"Removing the registry entry of exited worker {entry.get('name')} ({entry.get('pid')}).")
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self._entries = entries
+        return entries
+
+    def running_queues(self) -> List[str]:
+        """Return the queues of the live registered workers."""
+        return sorted({queue for entry in self.entries() for queue in entry["queues"]})
+
+    def register(self, pid: int, name: str, queues: List[str], cmd: str) -> Optional[Dict]:
+        """
+        Record a launched worker process.
+
+        :param `pid`: The pid of the launched process
+        :param `name`: The name of the worker entry in the spec
+        :param `queues`: The queues the worker consumes
+        :param `cmd`: The launch command
+        :return: The entry, or None if the process has already exited
+        """
+        create_time = _create_time(pid)
+        if create_time is None:
+            LOG.warning(f"Worker {name} ({pid}) exited before it could be registered.")
+            return None
+        entry = {
+            "pid": pid,
+            "name": name,
+            "queues": list(queues),
+            "cmd": cmd,
+            "create_time": create_time,
+            "registered": time.time(),
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so readers never see a partial entry.
+        tmp_path = self._path(pid) + ".tmp"
+        with open(tmp_path, "w") as _file:
+            json.dump(entry, _file)
+        os.replace(tmp_path, self._path(pid))
+        self.entries().append(entry)
+        return entry
@@ -0,0 +1,63 @@
+"""
+Tests for the affinity.py module.
+"""
+import pytest
+
+from merlin.common.affinity import affinity_from_env, parse_cpulist, plan_affinity, read_topology
+
+
+@pytest.fixture
+def sysfs(tmpdir):
+    """
+    A two socket machine with one NUMA domain per socket, two cores per socket
+    and two hyperthreads per core, numbered like most x86 nodes: cpus 0-3 are
+    the first threads of the cores, 4-7 their siblings.
+    """
+    for node, cpulist in ((0, "0-1,4-5"), (1, "2-3,6-7")):
+        tmpdir.join("node", f"node{node}", "cpulist").write(cpulist, ensure=True)
+    for cpu in range(8):
+        topology = tmpdir.join("cpu", f"cpu{cpu}", "topology")
+        core = cpu % 4
+        topology.join("physical_package_id").write(str(core // 2), ensure=True)
+        topology.join("core_id").write(str(core % 2))
+        topology.join("thread_siblings_list").write(f"{core},{core + 4}")
+    return str(tmpdir)
+
+
+def test_parse_cpulist():
+    assert parse_cpulist("0-3,8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert parse_cpulist("") == []
+
+
+def test_read_topology(sysfs):
+    topology = {cpu.cpu: cpu for cpu in read_topology(range(8), sysfs)}
+    assert topology[5].node == 0 and topology[5].core == 1 and topology[5].thread == 1
+    assert topology[2].node == 1 and topology[2].package == 1 and topology[2].thread == 0
+    # Without topology files every cpu is a core of domain 0.
+    assert [(cpu.node, cpu.thread) for cpu in read_topology([0, 1], "/nonexistent")] == [(0, 0), (0, 0)]
+
+
+def test_policies(sysfs):
+    topology = read_topology(range(8), sysfs)
+    # compact fills the hyperthreads of a core, then the next core.
+    assert [plan_affinity(topology, child, 2, "compact") for child in range(4)] == [[0, 4], [1, 5], [2, 6], [3, 7]]
+    # scatter alternates domains, using the first thread of each core first.
+    assert [plan_affinity(topology, child, 1, "scatter") for child in range(6)] == [[0], [2], [1], [3], [4], [6]]
+    assert [plan_affinity(topology, child, 1, "numa") for child in range(3)] == [[0, 1, 4, 5], [2, 3, 6, 7], [0, 1, 4, 5]]
+    with pytest.raises(ValueError):
+        plan_affinity(topology, 0, 1, "random")
+
+
+def test_restricted_cpuset(sysfs):
+    topology = read_topology([2, 3, 6], sysfs)
+    plans = [plan_affinity(topology, child, 2, "compact") for child in range(3)]
+    assert all(set(plan) <= {2, 3, 6} for plan in plans)
+    assert plan_affinity(topology, 0, 1, "numa") == [2, 3, 6]
+
+
+def test_affinity_from_env(sysfs):
+    topology = read_topology(range(8), sysfs)
+    assert affinity_from_env(0, {}, topology) is None
+    assert affinity_from_env(0, {"CELERY_AFFINITY": "1"}, topology) is None
+    assert affinity_from_env(1, {"CELERY_AFFINITY": "2"}, topology) == [1, 5]
+    assert affinity_from_env(1, {"CELERY_AFFINITY_POLICY": "numa"}, topology) == [2, 3, 6, 7]
@@ -0,0 +1,57 @@
+"""
+Tests for the completion.py module.
+"""
+from types import SimpleNamespace
+
+from merlin.common.completion import completion_key, count_completion, get_completion_counts, reset_completion
+
+
+class FakeRedis:
+    """Just enough of a redis client for the completion counters."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.expiry = {}
+
+    def hincrby(self, key, field, amount):
+        self.hashes.setdefault(key, {})
+        self.hashes[key][field] = self.hashes[key].get(field, 0) + amount
+
+    def expire(self, key, seconds):
+        self.expiry[key] = seconds
+
+    def hgetall(self, key):
+        return {field.encode(): str(count).encode() for field, count in self.hashes.get(key, {}).items()}
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def test_completion_counts():
+    backend = SimpleNamespace(client=FakeRedis(), expires=3600)
+    key = completion_key("my_study")
+    for result in ("OK", "OK", "SOFT_FAIL"):
+        assert count_completion(backend, key, "hello", result)
+    assert count_completion(backend, key, "world", "OK")
+    assert get_completion_counts(backend, key) == {"hello:OK": 2, "hello:SOFT_FAIL": 1, "world:OK": 1}
+    assert backend.client.expiry[key] == 3600
+    reset_completion(backend, key)
+    assert get_completion_counts(backend, key) == {}
+
+
+def test_no_counts_without_redis():
+    backend = SimpleNamespace()
+    assert not count_completion(backend, completion_key("my_study"), "hello", "OK")
+    assert get_completion_counts(backend, completion_key("my_study")) == {}
@@ -0,0 +1,76 @@
+"""
+Tests for the openfilelist.py module.
+"""
+import io
+
+import pytest
+
+from merlin.common.openfilelist import OpenFileList
+
+
+CONTENTS = ["a1\na2\n", "", "b1\nb2", "\nc1\n"]
+
+
+@pytest.fixture
+def filenames(tmpdir):
+    """Files whose concatenation is CONTENTS joined, including an empty file."""
+    names = []
+    for i, contents in enumerate(CONTENTS):
+        filename = str(tmpdir.join(f"part{i}.txt"))
+        with open(filename, "w") as f:
+            f.write(contents)
+        names.append(filename)
+    return names
+
+
+@pytest.mark.parametrize("mode", ["r", "rb"])
+def test_read_like_one_file(filenames, mode):
+    expected = "".join(CONTENTS)
+    if mode == "rb":
+        expected = expected.encode()
+    reference = io.BytesIO(expected) if mode == "rb" else io.StringIO(expected)
+    with OpenFileList(filenames, mode) as f:
+        assert f.read(4) == reference.read(4)
+        assert f.readline() == reference.readline()
+        assert f.tell() == reference.tell()
+        assert f.readlines() == reference.readlines()
+        assert f.readline() == f.read() == reference.read()
+    with OpenFileList(filenames, mode) as f:
+        assert list(f) == list(io.BytesIO(expected) if mode == "rb" else io.StringIO(expected))
+
+
+def test_seek_and_readinto(filenames):
+    expected = "".join(CONTENTS).encode()
+    with OpenFileList(filenames, "rb") as f:
+        assert f.seek(7) == 7
+        assert f.read(5) == expected[7:12]
+        f.seek(-4, 2)
+        assert f.read() == expected[-4:]
+        f.seek(1)
+        buf = bytearray(10)
+        assert f.readinto(buf) == 10
+        assert bytes(buf) == expected[1:11]
+        assert f.tell() == 11
+    with pytest.raises(ValueError):
+        f.read()
+
+
+def test_views(filenames):
+    expected = "".join(CONTENTS).encode()
+    with OpenFileList(filenames, "rb") as f:
+        assert b"".join(bytes(view) for view in f.views()) == expected
+        assert bytes(f.view(0, 3)) == expected[0:3]
+        assert bytes(f.view(4, 10)) == expected[4:10]
+        assert bytes(f.view()) == expected
+        assert bytes(f.view(len(expected))) == b""
+
+
+def test_views_map_one_file_at_a_time(filenames):
+    with OpenFileList(filenames, "rb") as f:
+        views = f.views()
+        first = next(views)
+        assert not first.closed
+        next(views)
+        # Moving on to the next file unmapped the previous one.
+        assert first.closed
+        views.close()
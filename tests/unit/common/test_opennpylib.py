@@ -0,0 +1,142 @@
+"""
+Tests for the opennpylib.py module.
+"""
+import numpy as np
+import pytest
+
+from merlin.common.opennpylib import OpenNPY, OpenNPYList, get_npy_info
+
+
+@pytest.fixture
+def npy_files(tmpdir):
+    """Three .npy files of 4, 1 and 5 rows, and their concatenation."""
+    arrays = [np.arange(n * 3, dtype=float).reshape(n, 3) + 100 * i for i, n in enumerate((4, 1, 5))]
+    filenames = []
+    for i, array in enumerate(arrays):
+        filename = str(tmpdir.join(f"bundle{i}.npy"))
+        np.save(filename, array)
+        filenames.append(filename)
+    return filenames, np.vstack(arrays)
+
+
+def test_list_slices(npy_files):
+    filenames, expected = npy_files
+    with OpenNPYList(filenames) as npy_list:
+        assert len(npy_list) == 10
+        for k in (slice(0, 10), slice(3, 6), slice(4, 5), slice(None, None, 3), slice(8, 1, -2), slice(-3, None)):
+            np.testing.assert_array_equal(npy_list[k], expected[k])
+        assert npy_list[5:5].shape == (0, 3)
+
+
+def test_list_indexing(npy_files):
+    filenames, expected = npy_files
+    with OpenNPYList(filenames) as npy_list:
+        np.testing.assert_array_equal(npy_list[4], expected[4])
+        np.testing.assert_array_equal(npy_list[-1], expected[-1])
+        np.testing.assert_array_equal(npy_list[[9, 0, 4, -2]], expected[[9, 0, 4, -2]])
+        np.testing.assert_array_equal(npy_list[np.array([[1, 5], [6, 7]])], expected[np.array([[1, 5], [6, 7]])])
+        with pytest.raises(IndexError):
+            npy_list[10]
+        with pytest.raises(IndexError):
+            npy_list[[0, 10]]
+
+
+def test_list_boolean_mask(npy_files):
+    filenames, expected = npy_files
+    mask = np.zeros(10, dtype=bool)
+    mask[[1, 4, 5, 9]] = True
+    with OpenNPYList(filenames) as npy_list:
+        np.testing.assert_array_equal(npy_list[mask], expected[mask])
+        assert npy_list[np.zeros(10, dtype=bool)].shape == (0, 3)
+        with pytest.raises(IndexError):
+            npy_list[mask[:5]]
+
+
+def test_list_gather_closes_files(npy_files, monkeypatch):
+    filenames, expected = npy_files
+    opened = []
+    real_open = open
+
+    def tracking_open(*args, **kwargs):
+        f = real_open(*args, **kwargs)
+        opened.append(f)
+        return f
+
+    monkeypatch.setattr("builtins.open", tracking_open)
+    with OpenNPYList(filenames) as npy_list:
+        np.testing.assert_array_equal(npy_list[::2], expected[::2])
+        np.testing.assert_array_equal(npy_list[[9, 5, 6, 0, 5]], expected[[9, 5, 6, 0, 5]])
+        assert all(npy.memmap is None for npy in npy_list.files)
+    assert opened and all(f.closed for f in opened)
+
+
+@pytest.mark.parametrize("version", [(1, 0), (2, 0)])
+def test_header(tmpdir, version):
+    filename = str(tmpdir.join("array.npy"))
+    with open(filename, "wb") as f:
+        np.lib.format.write_array(f, np.ones((6, 2, 3), dtype=np.int32), version=version)
+    hdr = get_npy_info(filename)
+    assert hdr["shape"] == (6, 2, 3)
+    assert hdr["dtype"] == np.int32
+    assert hdr["rowsize"] == 24
+    assert hdr["items"] == 36
+    assert hdr["offset"] == np.lib.format.open_memmap(filename, mode="r").offset
+
+
+def test_header_cache_follows_file(tmpdir):
+    filename = str(tmpdir.join("array.npy"))
+    np.save(filename, np.zeros((4, 2)))
+    assert get_npy_info(filename)["shape"] == (4, 2)
+    np.save(filename, np.zeros((7, 2)))
+    assert get_npy_info(filename)["shape"] == (7, 2)
+
+
+def test_open_npy(tmpdir):
+    filename = str(tmpdir.join("array.npy"))
+    expected = np.arange(40.0).reshape(10, 4)
+    np.save(filename, expected)
+    with OpenNPY(filename) as npy:
+        assert len(npy) == 10
+        np.testing.assert_array_equal(npy[-2], expected[-2])
+        np.testing.assert_array_equal(npy[2:5], expected[2:5])
+        np.testing.assert_array_equal(npy[::3], expected[::3])
+        np.testing.assert_array_equal(npy[[8, 1, -1]], expected[[8, 1, -1]])
+        view = npy.as_memmap()
+        assert isinstance(view, np.memmap)
+        np.testing.assert_array_equal(view, expected)
+        with pytest.raises(IndexError):
+            npy[10]
+
+
+def test_list_to_array(npy_files, tmpdir):
+    filenames, expected = npy_files
+    with OpenNPYList(filenames, max_workers=2) as npy_list:
+        assert npy_list.shape == expected.shape
+        np.testing.assert_array_equal(npy_list.to_array(), expected)
+        np.testing.assert_array_equal(np.asarray(list(npy_list)), expected)
+    # Mixed dtypes are promoted, as np.vstack would.
+    ints = str(tmpdir.join("ints.npy"))
+    np.save(ints, np.ones((2, 3), dtype=np.int16))
+    with OpenNPYList(filenames + [ints]) as npy_list:
+        assert npy_list.dtype == np.float64
+        np.testing.assert_array_equal(npy_list.to_array(), np.vstack((expected, np.ones((2, 3)))))
+
+
+def test_list_iter_reads_bounded_batches(npy_files, monkeypatch):
+    filenames, expected = npy_files
+    # Room for two rows of 3 float64 per read.
+    monkeypatch.setattr("merlin.common.opennpylib.ITER_BATCH_BYTES", 48)
+    with OpenNPYList(filenames) as npy_list:
+        reads = []
+        read_range = npy_list._read_range
+        monkeypatch.setattr(npy_list, "_read_range", lambda start, stop: reads.append(stop - start) or read_range(start, stop))
+        np.testing.assert_array_equal(np.array(list(npy_list)), expected)
+    assert max(reads) == 2
+
+
+def test_list_iter_batches(npy_files):
+    filenames, expected = npy_files
+    with OpenNPYList(filenames) as npy_list:
+        batches = list(npy_list.iter_batches(3))
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    np.testing.assert_array_equal(np.vstack(batches), expected)
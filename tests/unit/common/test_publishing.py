@@ -0,0 +1,76 @@
+"""
+Tests for the publishing.py module.
+"""
+from types import SimpleNamespace
+
+import pytest
+from celery import Celery
+
+from merlin.common.publishing import batched, publish_to_chord
+
+
+QUEUE = "publishing_test"
+
+
+class CounterBackend:
+    """A results backend with a redis style chord counter."""
+
+    def __init__(self):
+        self.client = self
+        self.counters = {}
+        self.calls = 0
+
+    @staticmethod
+    def get_key_for_group(group_id, suffix=""):
+        return f"{group_id}{suffix}"
+
+    def incrby(self, key, amount):
+        self.calls += 1
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+
+@pytest.fixture
+def app():
+    app = Celery("publishing_test", broker="memory://")
+    yield app
+    with app.connection_for_write() as conn:
+        channel = conn.default_channel
+        channel.queue_purge(QUEUE)
+        channel.queue_delete(QUEUE)
+
+
+def echo(value):
+    return value
+
+
+def make_task(app, **request):
+    fields = dict(is_eager=False, chord="chord-id", group="group-id", group_index=0, root_id="root")
+    fields.update(request)
+    return SimpleNamespace(app=app, backend=CounterBackend(), request=SimpleNamespace(**fields))
+
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert not list(batched([], 2))
+
+
+def test_publish_to_chord(app):
+    task = make_task(app)
+    sigs = [app.task(echo).s(i).set(queue=QUEUE) for i in range(25)]
+
+    assert publish_to_chord(task, sigs, batch_size=10) == 25
+    assert task.backend.counters == {"group-id.t": 25}
+    assert task.backend.calls == 3
+
+    with app.connection_for_read() as conn:
+        queue = conn.SimpleQueue(QUEUE)
+        messages = [queue.get(timeout=1) for _ in range(25)]
+        queue.close()
+    assert [message.payload[0] for message in messages] == [[i] for i in range(25)]
+    assert {message.headers["group"] for message in messages} == {"group-id"}
+    assert [message.headers["id"] for message in messages] == [sig.id for sig in sigs]
+
+
+def test_publish_outside_a_chord(app):
+    with pytest.raises(ValueError):
+        publish_to_chord(make_task(app, chord=None), [app.task(echo).s(1)])
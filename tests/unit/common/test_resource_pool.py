@@ -0,0 +1,90 @@
+"""
+Tests for the resource_pool.py module.
+"""
+import json
+import multiprocessing
+import os
+
+from merlin.common import resource_pool
+from merlin.common.resource_pool import CorePool, get_core_pool, worker_cores
+from merlin.study.celeryadapter import with_core_budget
+
+
+def hold_cores(path, cores, started, done):
+    """Reserve cores in a separate process until told to stop."""
+    pool = CorePool(8, path)
+    with pool.reserve(cores):
+        started.set()
+        done.wait(30)
+
+
+def test_worker_cores():
+    assert worker_cores({}) is None
+    assert worker_cores({"MERLIN_WORKER_CORES": "12"}) == 12
+    assert worker_cores({"MERLIN_WORKER_CORES": "auto"}) == len(os.sched_getaffinity(0))
+
+
+def test_with_core_budget():
+    assert with_core_budget({}, "celery worker") == "celery worker"
+    assert with_core_budget({"cores": 16}, "srun celery worker") == "MERLIN_WORKER_CORES=16 srun celery worker"
+
+
+def test_reservations_across_processes(tmpdir):
+    path = str(tmpdir.join("ledger.json"))
+    started, done = multiprocessing.Event(), multiprocessing.Event()
+    holder = multiprocessing.Process(target=hold_cores, args=(path, 6, started, done))
+    holder.start()
+    try:
+        assert started.wait(30)
+        pool = CorePool(8, path)
+        assert not pool.try_acquire(4)
+        assert pool.try_acquire(2)
+        pool.release()
+    finally:
+        done.set()
+        holder.join()
+    assert json.loads(open(path).read()) == {"held": {}, "waiting": []}
+    assert pool.try_acquire(8)
+    pool.release()
+
+
+def test_dead_reservations_are_dropped(tmpdir):
+    path = str(tmpdir.join("ledger.json"))
+    holder = multiprocessing.Process(target=os.getpid)
+    holder.start()
+    holder.join()
+    with open(path, "w") as ledger:
+        json.dump({"held": {str(holder.pid): 8}, "waiting": [str(holder.pid)]}, ledger)
+    pool = CorePool(8, path)
+    assert pool.try_acquire(8)
+    # A step larger than the budget runs alone.
+    pool.release()
+    assert pool.try_acquire(16)
+    pool.release()
+
+
+def test_waiters_are_served_in_order(tmpdir):
+    path = str(tmpdir.join("ledger.json"))
+    # A live process (the test runner's parent) waits for 8 cores ahead of this one.
+    earlier = str(os.getppid())
+    with open(path, "w") as ledger:
+        json.dump({"held": {}, "waiting": [earlier]}, ledger)
+    pool = CorePool(8, path)
+    assert not pool.try_acquire(2, wait=True)
+    assert json.loads(open(path).read())["waiting"] == [earlier, str(os.getpid())]
+    with open(path, "w") as ledger:
+        json.dump({"held": {earlier: 8}, "waiting": [str(os.getpid())]}, ledger)
+    assert not pool.try_acquire(2, wait=True)
+    with open(path, "w") as ledger:
+        json.dump({"held": {earlier: 6}, "waiting": [str(os.getpid())]}, ledger)
+    assert pool.try_acquire(2, wait=True)
+    assert json.loads(open(path).read()) == {"held": {earlier: 6, str(os.getpid()): 2}, "waiting": []}
+
+
+def test_core_pool_needs_prefork(monkeypatch):
+    monkeypatch.setenv("MERLIN_WORKER_CORES", "4")
+    monkeypatch.setattr(resource_pool, "_POOL", None)
+    monkeypatch.setattr(resource_pool, "_PREFORK_CHILD", False)
+    assert get_core_pool() is None
+    monkeypatch.setattr(resource_pool, "_PREFORK_CHILD", True)
+    assert get_core_pool().cores == 4
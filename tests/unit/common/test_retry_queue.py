@@ -0,0 +1,157 @@
+"""
+Tests for the retry_queue.py module.
+"""
+import pickle
+import random
+from types import SimpleNamespace
+
+import pytest
+from celery import Celery
+from celery.exceptions import MaxRetriesExceededError, Retry
+
+from merlin.common.retry_queue import backoff_delay, clear_retries, release_due, retry_key, schedule_retry
+from merlin.common.tasks import retry_step
+
+
+QUEUE = "retry_queue_test"
+
+
+class SortedSets:
+    """The sorted set commands of a redis client, in memory."""
+
+    def __init__(self):
+        self.sets = {}
+
+    def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update(mapping)
+
+    def zrangebyscore(self, key, low, high, start=0, num=None):  # pylint: disable=unused-argument
+        members = sorted((score, member) for member, score in self.sets.get(key, {}).items() if score <= high)
+        return [member for _, member in members][start : None if num is None else start + num]
+
+    def zrem(self, key, member):
+        return int(self.sets.get(key, {}).pop(member, None) is not None)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.sets.pop(key, None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+
+class Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def zrem(self, key, member):
+        self.results.append(self.client.zrem(key, member))
+
+    def execute(self):
+        return self.results
+
+
+class Backend:
+    """A redis results backend stand-in with pickled payloads."""
+
+    def __init__(self):
+        self.client = SortedSets()
+
+    @staticmethod
+    def encode(data):
+        return pickle.dumps(data)
+
+    @staticmethod
+    def decode(payload):
+        return pickle.loads(payload)
+
+
+def echo(value):
+    return value
+
+
+@pytest.fixture
+def app():
+    app = Celery("retry_queue_test", broker="memory://")
+    yield app
+    with app.connection_for_write() as conn:
+        channel = conn.default_channel
+        channel.queue_purge(QUEUE)
+        channel.queue_delete(QUEUE)
+
+
+def test_backoff_delay():
+    rng = random.Random(4)
+    assert backoff_delay(10, 0, 600, rng) == 10
+    for retries in range(12):
+        assert 10 <= backoff_delay(10, retries, 600, rng) <= min(600, 10 * 2**retries)
+    # A cap below the base delay does not shorten it.
+    assert backoff_delay(10, 3, 5, rng) == 5
+    assert backoff_delay(1, 10000, 60, rng) <= 60
+
+
+def test_release_due(app):
+    backend = Backend()
+    task = app.task(echo)
+    assert schedule_retry(backend, task.s(1).set(queue=QUEUE), 0)
+    assert schedule_retry(backend, task.s(2).set(queue=QUEUE), 3600)
+
+    assert schedule_retry(backend, task.s(3).set(queue="other_queue"), 0)
+
+    assert release_due(app, backend, queues=[QUEUE]) == 1
+    assert release_due(app, backend, queues=[QUEUE]) == 0
+    assert len(backend.client.sets[retry_key(QUEUE)]) == 1
+    # Retries of queues the worker does not consume from are left for their workers.
+    assert len(backend.client.sets[retry_key("other_queue")]) == 1
+    with app.connection_for_read() as conn:
+        queue = conn.SimpleQueue(QUEUE)
+        assert queue.get(timeout=1).payload[0] == [1]
+        queue.close()
+
+
+def test_schedule_retry_needs_redis():
+    assert not schedule_retry(SimpleNamespace(), {}, 1)
+    assert not clear_retries(SimpleNamespace(), [QUEUE])
+
+
+def test_clear_retries(app):
+    backend = Backend()
+    task = app.task(echo)
+    schedule_retry(backend, task.s(1).set(queue=QUEUE), 0)
+    schedule_retry(backend, task.s(2).set(queue="other_queue"), 0)
+
+    assert clear_retries(backend, [QUEUE])
+    assert retry_key(QUEUE) not in backend.client.sets
+    assert release_due(app, backend, queues=[QUEUE, "other_queue"]) == 1
+
+
+def make_step_task(retries, backend):
+    sig = {"task": "merlin_step", "options": {"retries": retries + 1, "queue": QUEUE}}
+    return SimpleNamespace(
+        name="merlin_step",
+        max_retries=3,
+        backend=backend,
+        request=SimpleNamespace(id="id", retries=retries, args=(), is_eager=False),
+        signature_from_request=lambda queue, retries: sig,
+    )
+
+
+def test_retry_step():
+    backend = Backend()
+    step = SimpleNamespace(retry_delay=1, max_retry_delay=10, get_task_queue=lambda: QUEUE)
+    with pytest.raises(Retry):
+        retry_step(make_step_task(2, backend), step)
+    assert list(map(backend.decode, backend.client.sets[retry_key(QUEUE)])) == [
+        {"task": "merlin_step", "options": {"retries": 3, "queue": QUEUE}}
+    ]
+
+    with pytest.raises(MaxRetriesExceededError):
+        retry_step(make_step_task(3, backend), step)
+    assert len(backend.client.sets[retry_key(QUEUE)]) == 1
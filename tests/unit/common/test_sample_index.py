@@ -107,6 +107,34 @@ def test_directory_path():
     assert all_dirs == expected_all_dirs
 
 
+def test_traversal_order():
+    indx = create_hierarchy(4, 1, [2], root="")
+    bottom_up = [path for path, _ in indx.traverse_all()]
+    assert bottom_up == ["0/samples0-1.ext", "0/samples1-2.ext", "0", "1/samples2-3.ext", "1/samples3-4.ext", "1", ""]
+    top_down = [path for path, _ in indx.traverse_all(bottom_up=False)]
+    assert top_down == ["", "0", "0/samples0-1.ext", "0/samples1-2.ext", "1", "1/samples2-3.ext", "1/samples3-4.ext"]
+
+
+def test_height():
+    indx = create_hierarchy(20, 1, [20, 5, 1], root="")
+    assert indx.height == 4
+    assert not indx.is_great_grandparent_of_leaf
+    assert indx.children["0"].is_great_grandparent_of_leaf
+    assert [path for path, _ in indx.traverse_height(4)] == [""]
+    assert [path for path, _ in indx.traverse_height(3)] == ["0"]
+    assert [path for path, _ in indx.traverse_height(2)] == ["0/0", "0/1", "0/2", "0/3"]
+    assert len(list(indx.traverse_height(0))) == 20
+
+
+def test_height_after_insertion():
+    indx = create_hierarchy(2, 1, [1], address="0")
+    assert indx.height == 2
+    indx["0.1"] = create_hierarchy(100, 10, [50], address="0.1")
+    assert indx.height == 3
+    assert indx.leaf_depths == {2, 3}
+    assert indx.is_grandparent_of_leaf and indx.is_great_grandparent_of_leaf
+
+
 @clear
 def test_subhierarchy_insertion():
     indx = create_hierarchy(2, 1, [1], root=TEST_DIR)
@@ -0,0 +1,44 @@
+"""
+Tests for the sample_index_file.py module.
+"""
+import numpy as np
+import pytest
+
+from merlin.common.sample_index_factory import create_hierarchy, read_hierarchy
+from merlin.common.sample_index_file import SampleIndexFile, write_sample_index_file
+
+
+def test_lookup(tmpdir):
+    indx = create_hierarchy(1000, 10, [100], root="")
+    filepath = str(tmpdir.join("sample_index.bin"))
+    assert write_sample_index_file(indx, filepath) == 100
+
+    with SampleIndexFile(filepath) as index_file:
+        assert len(index_file) == 100
+        assert (index_file.min, index_file.max) == (0, 1000)
+        for sample_id in (0, 9, 10, 555, 999):
+            assert index_file.get_path_to_sample(sample_id) == indx.get_path_to_sample(sample_id)
+        assert index_file.get_path_to_sample(555, root="study") == "study/5/samples550-560.ext"
+        assert index_file.find(np.array([0, 19, 20, 999])).tolist() == [0, 1, 2, 99]
+        with pytest.raises(KeyError):
+            index_file.find(1000)
+        with pytest.raises(KeyError):
+            index_file.find(np.array([5, -1]))
+
+
+def test_read_hierarchy(tmpdir):
+    indx = create_hierarchy(20, 1, [20, 5, 1], root="", start_sample_id=3)
+    filepath = str(tmpdir.join("sample_index.bin"))
+    write_sample_index_file(indx, filepath)
+
+    read_indx = read_hierarchy(filepath)
+    assert read_indx.name == str(tmpdir)
+    assert str(read_indx) == str(indx)
+    assert read_indx.get_path_to_sample(17) == str(tmpdir.join(indx.get_path_to_sample(17)))
+
+
+def test_not_an_index(tmpdir):
+    filepath = tmpdir.join("samples.txt")
+    filepath.write("not a sample index" * 10)
+    with pytest.raises(ValueError):
+        SampleIndexFile(str(filepath))
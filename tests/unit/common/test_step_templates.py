@@ -0,0 +1,60 @@
+"""
+Tests for the step_templates.py module.
+"""
+import pickle
+
+from maestrowf.datastructures.core.study import StudyStep
+
+from merlin.common.step_templates import StepReference, load_step_template, write_step_template
+from merlin.common.tasks import merlin_step, step_signature
+from merlin.study.step import MerlinStepRecord, Step
+
+
+def make_step():
+    study_step = StudyStep()
+    study_step.name = "hello"
+    study_step.description = "test step"
+    study_step.run = {"cmd": "echo $(X)", "restart": "echo again $(X)", "task_queue": "test", "shell": "/bin/bash"}
+    return Step(MerlinStepRecord("workspace", study_step))
+
+
+def test_write_step_template(tmpdir):
+    step = make_step()
+    path = write_step_template(str(tmpdir), step, {"type": "local"})
+    assert write_step_template(str(tmpdir), step, {"type": "local"}) == path
+    assert write_step_template(str(tmpdir), step, {"type": "slurm"}) != path
+    assert len(tmpdir.listdir()) == 2
+
+    template_step, adapter_config = load_step_template(path)
+    assert template_step.get_cmd() == "echo $(X)"
+    assert adapter_config == {"type": "local"}
+
+
+def test_step_reference(tmpdir):
+    step = make_step()
+    path = write_step_template(str(tmpdir), step, {"type": "local"})
+    reference = StepReference(path, step.get_task_queue(), "workspace/01", [("$(X)", "1.5")])
+
+    resolved, adapter_config = reference.resolve()
+    assert resolved.get_cmd() == "echo 1.5"
+    assert resolved.get_restart_cmd() == "echo again 1.5"
+    assert resolved.get_workspace() == "workspace/01"
+    assert adapter_config == {"type": "local"}
+    # The cached template is not changed by running the step.
+    adapter_config["batch_type"] = "local"
+    assert load_step_template(path)[1] == {"type": "local"}
+
+    # A restart is sent along with the retried task.
+    resolved.restart = True
+    retried = pickle.loads(pickle.dumps(reference))
+    assert retried.resolve()[0].restart
+    assert not StepReference(path, step.get_task_queue()).resolve()[0].restart
+
+
+def test_reference_signature(tmpdir):
+    step = make_step()
+    reference = StepReference(write_step_template(str(tmpdir), step, {"type": "local"}), step.get_task_queue())
+    sig = step_signature(merlin_step, reference, None)
+    assert sig.kwargs == {}
+    assert sig.options["queue"] == step.get_task_queue()
+    assert len(pickle.dumps(sig)) < len(pickle.dumps(step_signature(merlin_step, step, {"type": "local"})))
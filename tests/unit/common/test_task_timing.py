@@ -0,0 +1,81 @@
+"""
+Tests for the task_timing.py module.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from celery import Celery
+from celery.app.task import Context
+
+import merlin.common.tasks  # noqa: F401 -- connects the publish stamp
+from merlin.common import task_timing
+from merlin.common.task_timing import SENT_TIME_HEADER, TaskTimer, dequeue_latency
+
+
+def test_phases_accumulate():
+    """Repeated phases add up and the record is completed by finish."""
+    timer = TaskTimer()
+    with timer.phase("setup_workspace"):
+        pass
+    first = timer.record["setup_workspace"]
+    with timer.phase("setup_workspace"):
+        pass
+    record = timer.finish(step="hello")
+
+    assert record["setup_workspace"] >= first
+    assert record["total"] >= record["setup_workspace"]
+    assert record["step"] == "hello"
+    assert "start" in record
+
+
+def test_child_resources():
+    """Child cpu time and max rss are recorded for phases running processes."""
+    timer = TaskTimer()
+    with timer.phase("run", children=True):
+        subprocess.call([sys.executable, "-c", "sum(range(2000000))"])
+    assert timer.record["child_cpu"] > 0
+    assert timer.record["child_maxrss"] > 0
+
+
+def test_file_sink_from_env(tmpdir, monkeypatch):
+    """Each worker process writes json lines to its own file in the directory."""
+    monkeypatch.setenv(task_timing.TIMING_ENV, str(tmpdir))
+    sink = task_timing.sink_from_env()
+    try:
+        sink({"step": "hello", "run": 1.5})
+        sink({"step": "world", "run": 0.5})
+    finally:
+        sink.close()
+
+    (timing_file,) = tmpdir.listdir()
+    assert timing_file.basename.endswith(f".{os.getpid()}.jsonl")
+    records = [json.loads(line) for line in timing_file.readlines()]
+    assert [r["step"] for r in records] == ["hello", "world"]
+
+
+def test_set_sink():
+    """Records go to an installed sink, and a failing sink does not raise."""
+    records = []
+    try:
+        task_timing.set_sink(records.append)
+        task_timing.emit({"step": "hello"})
+        task_timing.set_sink(lambda record: 1 / 0)
+        task_timing.emit({"step": "world"})
+    finally:
+        task_timing.set_sink(None)
+    assert records == [{"step": "hello"}]
+
+
+def test_publish_stamp_and_dequeue_latency():
+    """merlin_step messages carry their publish time, from which latency is computed."""
+    app = Celery("test_task_timing", broker="memory://")
+    app.send_task("merlin.common.tasks.merlin_step", queue="timing")
+    with app.connection() as conn:
+        message = conn.SimpleQueue("timing").get(timeout=1)
+    headers = message.headers
+    assert SENT_TIME_HEADER in headers
+
+    assert dequeue_latency(Context(headers)) >= 0
+    assert dequeue_latency(Context({})) is None
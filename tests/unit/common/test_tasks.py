@@ -0,0 +1,212 @@
+"""
+Tests for the helpers of the tasks.py module.
+"""
+import pickle
+from types import SimpleNamespace
+
+import numpy as np
+from maestrowf.datastructures.core.study import StudyStep
+
+from merlin.common import tasks
+from merlin.common.abstracts.enums import ReturnCode
+from merlin.common.opennpylib import OpenNPY
+from merlin.common.retry_queue import retry_key
+from merlin.common.sample_index import uniform_directories
+from merlin.common.tasks import (
+    EXPANSION_HEIGHT,
+    STREAM_INTERVAL,
+    create_sample_index,
+    merlin_step,
+    release_sample_ranges,
+    sample_subtree,
+    split_ranges,
+    step_signature,
+    write_sample_paths_file,
+    write_samples_file,
+)
+from merlin.spec.expansion import parameter_substitutions_for_cmd
+from merlin.study.step import MerlinStepRecord, Step
+
+
+def make_step(name, cmd, restart="", workspace="workspace"):
+    study_step = StudyStep()
+    study_step.name = name
+    study_step.description = "test step"
+    study_step.run = {"cmd": cmd, "restart": restart, "task_queue": "test", "max_retries": 30}
+    return Step(MerlinStepRecord(workspace, study_step))
+
+
+def make_study(tmpdir, cmds, n_samples=30):
+    """A stand-in for a MerlinStudy with one step per cmd."""
+    steps = {f"step_{i}": make_step(f"step_{i}", cmd) for i, cmd in enumerate(cmds)}
+    dag = SimpleNamespace(dag=SimpleNamespace(values=dict(_source=None, **steps)), step=steps.__getitem__)
+    return SimpleNamespace(dag=dag, samples=[[i] for i in range(n_samples)], level_max_dirs=5, info=str(tmpdir))
+
+
+def test_step_references():
+    step = make_step("hello", "echo $(merlin_paths_all)", restart="echo $(MERLIN_GLOB_PATH)")
+    assert step.references("MERLIN_PATHS_ALL")
+    assert step.references("MERLIN_GLOB_PATH")
+    assert not step.references("MERLIN_SAMPLE_ID")
+
+
+def test_paths_all_substituted_only_when_given():
+    pairs = dict(parameter_substitutions_for_cmd("*/*/", None))
+    assert "$(MERLIN_PATHS_ALL)" not in pairs
+    assert pairs["$(MERLIN_GLOB_PATH)"] == "*/*/"
+    assert dict(parameter_substitutions_for_cmd("*/", "0 1"))["$(MERLIN_PATHS_ALL)"] == "0 1"
+
+
+def test_write_sample_paths_file(tmpdir):
+    study = make_study(tmpdir, ["echo $(MERLIN_SAMPLE_ID)", "for p in $(cat $(MERLIN_PATHS_ALL)); do ls $p; done"])
+    filepath = write_sample_paths_file(study)
+
+    sample_index, glob_path = create_sample_index(30, 5)
+    assert glob_path == "*/*/*/"
+    with open(filepath) as _file:
+        assert _file.read().split() == sample_index.make_directory_string().split()
+
+
+def test_no_sample_paths_file_when_unused(tmpdir):
+    study = make_study(tmpdir, ["echo $(MERLIN_SAMPLE_ID)"])
+    assert write_sample_paths_file(study) is None
+    assert tmpdir.listdir() == []
+
+
+def test_step_signature_without_results():
+    step = make_step("hello", "echo hello")
+    sig = step_signature(merlin_step, step, {"type": "local"})
+    assert sig.options == {"queue": step.get_task_queue()}
+    assert "completion_key" not in sig.kwargs
+
+    sig = step_signature(merlin_step, step, {"type": "local"}, "merlin-completed:study")
+    assert sig.options["ignore_result"]
+    assert sig.kwargs["completion_key"] == "merlin-completed:study"
+    assert sig.options["queue"] == step.get_task_queue()
+
+
+def test_write_samples_file(tmpdir):
+    study = make_study(tmpdir, ["echo $(MERLIN_SAMPLE_ID)"])
+    with OpenNPY(write_samples_file(study)) as samples:
+        assert np.array_equal(samples[10:13], [[10], [11], [12]])
+
+
+def test_sample_subtree():
+    for n_samples, level_max_dirs in ((1, 5), (7, 3), (30, 5), (12345, 25)):
+        sample_index, _ = create_sample_index(n_samples, level_max_dirs)
+        height = min(sample_index.height, EXPANSION_HEIGHT)
+        stream = {
+            "directory_sizes": uniform_directories(n_samples, bundle_size=1, level_max_dirs=level_max_dirs),
+            "height": height,
+            "n_digits": len(str(level_max_dirs)),
+        }
+        for path, node in sample_index.traverse_height(height):
+            subtree = sample_subtree(stream, path, node.min, node.max)
+            node.name = path
+            assert subtree.height == node.height
+            assert [subtree.get_path_to_sample(i) for i in range(node.min, node.max)] == [
+                node.get_path_to_sample(i) for i in range(node.min, node.max)
+            ]
+
+
+def test_split_ranges():
+    ranges = [("0", 0, 25), ("1", 25, 50), ("2", 50, 60)]
+    assert split_ranges(ranges, 60) == (ranges, [])
+    assert split_ranges(ranges, 55) == (ranges[:2], ranges[2:])
+    # A range larger than the capacity is released on its own.
+    assert split_ranges(ranges, 10) == (ranges[:1], ranges[1:])
+    assert split_ranges(ranges, 0) == ([], ranges)
+    assert split_ranges(ranges, -5) == ([], ranges)
+
+
+class EmptyQueueStats:
+    """Queue stats reporting every queue as empty."""
+
+    def __init__(self, app=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    @staticmethod
+    def query(queues):
+        return [(queue, 0, 0) for queue in queues]
+
+
+class RedisBackend:
+    """The chord counters and sorted sets of a redis results backend, in memory."""
+
+    def __init__(self):
+        self.client = self
+        self.counters = {}
+        self.sets = {}
+
+    @staticmethod
+    def get_key_for_group(group_id, suffix=""):
+        return f"{group_id}{suffix}"
+
+    @staticmethod
+    def encode(data):
+        return pickle.dumps(data)
+
+    def incrby(self, key, amount):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update(mapping)
+
+
+def release_ranges(tmpdir, monkeypatch, backend):
+    """Release two ranges of 10 samples with room for 10 queued tasks; return the published signatures."""
+    published = []
+    monkeypatch.setattr(tasks, "QueueStatsClient", EmptyQueueStats)
+    monkeypatch.setattr(tasks, "publish_to_chord", lambda task, sigs: published.extend(sigs))
+    samples_file = str(tmpdir.join("samples.npy"))
+    np.save(samples_file, np.arange(20).reshape(20, 1))
+    stream = {
+        "samples_file": samples_file,
+        "max_queued_tasks": 10,
+        "directory_sizes": uniform_directories(20, bundle_size=1, level_max_dirs=10),
+        "height": 2,
+        "n_digits": 2,
+    }
+    request = SimpleNamespace(is_eager=False, chord="chord", group="group", group_index=0, root_id="root")
+    task = SimpleNamespace(app=None, backend=backend, request=request)
+    steps = [make_step("hello", "echo $(X)")]
+    release_sample_ranges(task, merlin_step, steps, ["X"], {"type": "local"}, [("0", 0, 10), ("1", 10, 20)], stream)
+    return steps[0].get_task_queue(), published
+
+
+def test_release_sample_ranges_holds_continuation(tmpdir, monkeypatch):
+    backend = RedisBackend()
+    queue, published = release_ranges(tmpdir, monkeypatch, backend)
+
+    assert len(published) == 1
+    (held,) = backend.sets[retry_key(queue)]
+    continuation = pickle.loads(held)
+    assert continuation["task"] == "merlin.common.tasks.stream_sample_ranges"
+    assert continuation["args"][4] == [("1", 10, 20)]
+    assert continuation["options"]["chord"] == "chord"
+    assert "countdown" not in continuation["options"]
+    # The held continuation is already counted in the chord.
+    assert backend.counters == {"group.t": 1}
+
+
+def test_release_sample_ranges_counts_down_without_redis(tmpdir, monkeypatch):
+    _, published = release_ranges(tmpdir, monkeypatch, SimpleNamespace())
+
+    assert len(published) == 2
+    assert published[1].task == "merlin.common.tasks.stream_sample_ranges"
+    assert published[1].options["countdown"] == STREAM_INTERVAL
+
+
+def test_merlin_step_without_results_returns_nothing(tmpdir):
+    adapter_config = {"type": "local", "dry_run": False, "shell": "/bin/bash"}
+    step = make_step("hello", "echo hello", workspace=str(tmpdir))
+    assert merlin_step.apply(args=(step,), kwargs={"adapter_config": adapter_config}).get() == ReturnCode.OK
+    step = make_step("hello", "echo hello", workspace=str(tmpdir))
+    kwargs = {"adapter_config": adapter_config, "completion_key": "merlin-completed:study"}
+    assert merlin_step.apply(args=(step,), kwargs=kwargs).get() is None
@@ -0,0 +1,106 @@
+"""
+Tests for the autoscaler.py module.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from merlin.study.autoscaler import Autoscaler, WorkerGroup, get_autoscale_bounds, plan_concurrency
+from merlin.study.celeryadapter import get_worker_args
+
+
+class FakeControl:
+    """A celery control api over a fixed set of workers, recording pool resizes."""
+
+    def __init__(self, workers):
+        self.workers = workers  # node name -> (queues, pool size)
+        self.launch = {node: size for node, (_, size) in workers.items()}
+        self.resizes = []
+
+    def inspect(self, destination=None):
+        nodes = [node for node in self.workers if destination is None or node in destination]
+        return SimpleNamespace(
+            active_queues=lambda: {node: [{"name": q} for q in self.workers[node][0]] for node in nodes},
+            # Like celery, max-concurrency keeps the launch size after resizes.
+            stats=lambda: {
+                node: {"pool": {"max-concurrency": self.launch[node], "processes": list(range(self.workers[node][1]))}}
+                for node in nodes
+            },
+        )
+
+    def resize(self, node, n):
+        self.resizes.append((node, n))
+        queues, size = self.workers[node]
+        self.workers[node] = (queues, size + n)
+
+    def pool_grow(self, n, destination=None, reply=False):
+        self.resize(destination[0], n)
+        return [{destination[0]: {"ok": "pool will grow"}}]
+
+    def pool_shrink(self, n, destination=None, reply=False):
+        self.resize(destination[0], -n)
+        return [{destination[0]: {"ok": "pool will shrink"}}]
+
+
+class FakeStatsClient:
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def query(self, queues):
+        return [(q, self.jobs[q], 1) for q in queues if q in self.jobs]
+
+    def close(self):
+        pass
+
+
+def test_autoscale_bounds():
+    assert get_autoscale_bounds({"steps": ["all"]}) is None
+    assert get_autoscale_bounds({"autoscale": {"max": 8}}) == (1, 8)
+    assert get_autoscale_bounds({"autoscale": {"min": 2, "max": 4}}) == (2, 4)
+    with pytest.raises(ValueError):
+        get_autoscale_bounds({"autoscale": {"min": 5, "max": 4}})
+
+
+def test_worker_args_start_at_min():
+    assert get_worker_args({"args": "-l INFO", "autoscale": {"min": 2, "max": 4}}, "") == "-l INFO --concurrency 2"
+    assert get_worker_args({"args": "--concurrency 3", "autoscale": {"max": 4}}, "") == "--concurrency 3"
+    assert get_worker_args({"args": "-c 3 -l INFO", "autoscale": {"max": 4}}, "") == "-c 3 -l INFO"
+    assert get_worker_args({"args": "-c3", "autoscale": {"max": 4}}, "") == "-c3"
+    assert get_worker_args({"args": "-O fair", "autoscale": {"min": 2, "max": 4}}, "") == "-O fair --concurrency 2"
+    assert get_worker_args({"args": None}, "-O fair") == ""
+    assert get_worker_args({}, "-O fair") == "-O fair"
+
+
+def test_plan_concurrency():
+    bounds = (1, 8)
+    # Grow with the backlog per worker, up to the maximum.
+    assert plan_concurrency(2, 3, None, 0, bounds) == 5
+    assert plan_concurrency(2, 6, None, 0, bounds, n_workers=2) == 5
+    assert plan_concurrency(2, 100, None, 0, bounds) == 8
+    # Hold while the backlog empties before the next poll.
+    assert plan_concurrency(4, 10, 25, 0, bounds) == 4
+    # Shrink by half of the excess only after IDLE_POLLS empty polls.
+    assert plan_concurrency(7, 0, 0, 1, bounds) == 7
+    assert plan_concurrency(7, 0, 0, 2, bounds) == 4
+    assert plan_concurrency(2, 0, 0, 5, bounds) == 1
+    assert plan_concurrency(1, 0, 0, 5, bounds) == 1
+
+
+def test_poll_resizes_workers():
+    control = FakeControl({"celery@sim.host": (["[merlin]_sim"], 2), "celery@post.host": (["[merlin]_post"], 6)})
+    groups = [WorkerGroup("sim", ["[merlin]_sim"], (2, 16)), WorkerGroup("post", ["[merlin]_post"], (1, 6))]
+    stats_client = FakeStatsClient({"[merlin]_sim": 10, "[merlin]_post": 0})
+    scaler = Autoscaler(groups, app=SimpleNamespace(control=control), stats_client=stats_client)
+
+    scaler.poll()
+    assert control.resizes == [("celery@sim.host", 10)]
+    scaler.poll()
+    scaler.poll()
+    # The post-processing workers shrink once their queue has stayed empty.
+    assert ("celery@post.host", -2) in control.resizes
+
+    # Later polls start from the resized pools and stay within the bounds.
+    for _ in range(10):
+        scaler.poll()
+    assert control.workers["celery@sim.host"][1] == 16
+    assert control.workers["celery@post.host"][1] == 1
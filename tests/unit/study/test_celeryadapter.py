@@ -0,0 +1,81 @@
+"""
+Tests for the admin commands of the celeryadapter.py module.
+"""
+from types import SimpleNamespace
+
+import pytest
+from celery import Celery
+from kombu import Queue
+
+import merlin.celery
+from merlin.study.celeryadapter import purge_celery_tasks, stop_celery_workers
+
+
+@pytest.fixture
+def memory_app():
+    """
+    A celery app on an in-memory broker holding 3 messages in queue purge_q1
+    and 2 in purge_q2. The in-memory broker is shared by the whole process,
+    so the queues are deleted again afterwards.
+    """
+    app = Celery("test_celeryadapter", broker="memory://")
+    with app.connection() as conn:
+        with conn.Producer() as producer:
+            for name, count in (("purge_q1", 3), ("purge_q2", 2)):
+                Queue(name)(conn.default_channel).declare()
+                for _ in range(count):
+                    producer.publish({"n": 1}, routing_key=name)
+    yield app
+    with app.connection() as conn:
+        for name in ("purge_q1", "purge_q2", "purge_missing"):
+            conn.default_channel.queue_purge(name)
+            conn.default_channel.queue_delete(name)
+
+
+def queue_sizes(app, names):
+    with app.connection() as conn:
+        return [conn.default_channel.queue_declare(queue=name, passive=True)[1] for name in names]
+
+
+def test_purge_in_process(memory_app):
+    assert purge_celery_tasks("purge_q1,purge_missing", True, app=memory_app) == 0
+    assert queue_sizes(memory_app, ["purge_q1", "purge_q2"]) == [0, 2]
+
+
+def test_purge_asks_first(memory_app, monkeypatch):
+    monkeypatch.setattr("builtins.input", lambda prompt: "n")
+    assert purge_celery_tasks("purge_q2", False, app=memory_app) == 1
+    assert queue_sizes(memory_app, ["purge_q2"]) == [2]
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    assert purge_celery_tasks("purge_q2", False, app=memory_app) == 0
+    assert queue_sizes(memory_app, ["purge_q2"]) == [0]
+
+
+class FakeControl:
+    """Records broadcasts, and serves the active queues of two workers."""
+
+    def __init__(self):
+        self.broadcasts = []
+        self.inspections = 0
+
+    def inspect(self):
+        self.inspections += 1
+        return SimpleNamespace(
+            active_queues=lambda: {"celery@sim.a": [{"name": "sim"}], "celery@post.a": [{"name": "post"}]}
+        )
+
+    def broadcast(self, command, destination=None):
+        self.broadcasts.append((command, destination))
+
+
+def test_stop_workers(monkeypatch):
+    control = FakeControl()
+    monkeypatch.setattr(merlin.celery, "get_app", lambda: SimpleNamespace(control=control))
+
+    stop_celery_workers()
+    assert control.broadcasts == [("shutdown", None)]
+    assert control.inspections == 0
+
+    stop_celery_workers(queues=["sim", "post"], spec_worker_names=["sim", "post"])
+    assert control.broadcasts[-1] == ("shutdown", ["celery@post.a", "celery@sim.a"])
+    assert control.inspections == 1
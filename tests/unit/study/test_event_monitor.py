@@ -0,0 +1,185 @@
+"""
+Tests for the event_monitor.py module.
+"""
+import time
+from types import SimpleNamespace
+
+from celery import Celery
+
+from merlin.study.event_monitor import EventMonitor
+
+
+class StaticQueueStats:
+    """Queue stats that report whatever the test last set."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.queries = 0
+
+    def query(self, queues):
+        self.queries += 1
+        return [stat for stat in self.stats if stat[0] in queues]
+
+
+class EventsControl:
+    """Worker remote control that records which workers send task events, and reports the tasks they hold."""
+
+    def __init__(self, workers, sending, active=None, reserved=None):
+        self.workers = workers
+        self.sending = set(sending)
+        self.active = active or {}
+        self.reserved = reserved or {}
+
+    def inspect(self):
+        return SimpleNamespace(active=lambda: self.active, reserved=lambda: self.reserved)
+
+    def enable_events(self, reply=False):
+        replies = [
+            {name: {"ok": "task events already enabled" if name in self.sending else "task events enabled"}}
+            for name in self.workers
+        ]
+        self.sending.update(self.workers)
+        return replies if reply else None
+
+    def disable_events(self, destination=None):
+        self.sending.difference_update(self.workers if destination is None else destination)
+
+
+class DrainingReceiver:
+    """An event receiver whose queues are empty by its first iteration."""
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.on_iteration = None
+        self.should_stop = False
+
+    def capture(self, **kwargs):
+        self.monitor.stats_client.stats = [("[merlin]_q", 0, 1)]
+        self.monitor._last_check = 0.0
+        self.on_iteration()
+        assert self.should_stop
+
+
+class ScriptedReceiver:
+    """An event receiver that delivers events, checking in between, until told to stop."""
+
+    def __init__(self, handlers, events):
+        self.handlers = handlers
+        self.events = events
+        self.on_iteration = None
+        self.should_stop = False
+
+    def capture(self, **kwargs):
+        self.on_iteration()
+        for next_event in self.events:
+            if self.should_stop:
+                break
+            self.handlers["*"](next_event)
+        assert self.should_stop
+
+
+def make_monitor(stats, sleep=60):
+    app = Celery("test_event_monitor", broker="memory://")
+    app.control = EventsControl([], [])
+    return EventMonitor(app, ["[merlin]_q"], ["simworker"], StaticQueueStats(stats), sleep=sleep)
+
+
+def event(event_type, **fields):
+    fields.update({"type": event_type, "timestamp": time.time(), "local_received": time.time(), "clock": 1})
+    return fields
+
+
+def test_finished_when_queues_empty():
+    """An empty queue with no active tasks means monitoring is done."""
+    monitor = make_monitor([("[merlin]_q", 0, 1)])
+    monitor.query_queues()
+    assert monitor.check()
+
+
+def test_waits_for_active_tasks():
+    """An empty queue is not done while a spec worker is still running a task."""
+    monitor = make_monitor([("[merlin]_q", 1, 1)])
+    monitor.query_queues()
+    monitor.handle_event(event("task-started", uuid="t1", hostname="simworker.host"))
+    assert not monitor.check()
+
+    # The last queued task was picked up; the queue query happens on the next task event.
+    monitor.stats_client.stats = [("[merlin]_q", 0, 1)]
+    monitor._last_check = time.monotonic() - 2
+    monitor.handle_event(event("task-started", uuid="t2", hostname="simworker.host"))
+    monitor.handle_event(event("task-succeeded", uuid="t1", hostname="simworker.host"))
+    assert not monitor.check()
+    monitor._last_check = time.monotonic() - 2
+    monitor.handle_event(event("task-succeeded", uuid="t2", hostname="simworker.host"))
+    assert monitor.check()
+
+
+def test_task_events_trigger_queue_query():
+    """Task completions, not the sleep period, should prompt a queue query."""
+    monitor = make_monitor([("[merlin]_q", 5, 1)], sleep=3600)
+    monitor.query_queues()
+    queries = monitor.stats_client.queries
+
+    monitor._last_check = time.monotonic() - 2
+    assert not monitor.check()
+    assert monitor.stats_client.queries == queries
+
+    monitor.handle_event(event("task-succeeded", uuid="t1", hostname="simworker.host"))
+    assert not monitor.check()
+    assert monitor.stats_client.queries == queries + 1
+
+
+def test_worker_heartbeats_detected():
+    """Worker heartbeats should mark spec workers as alive."""
+    monitor = make_monitor([("[merlin]_q", 5, 0)])
+    assert not monitor.workers_alive()
+    monitor.handle_event(event("worker-heartbeat", hostname="simworker.host", freq=2.0, active=0, processed=0))
+    assert monitor.workers_alive()
+    monitor.handle_event(event("worker-heartbeat", hostname="otherworker.host", freq=2.0, active=0, processed=0))
+    monitor.query_queues()
+    assert not monitor.check()
+
+
+def test_run_returns_when_nothing_queued():
+    """With nothing to do, run should return without waiting on events."""
+    monitor = make_monitor([("[merlin]_q", 0, 0)])
+    monitor.run()
+    assert monitor.finished
+
+
+def test_run_restores_task_events(monkeypatch):
+    """Task events are turned back off on the workers the monitor turned them on for."""
+    monitor = make_monitor([("[merlin]_q", 3, 1)])
+    control = EventsControl(["simworker.a", "simworker.b"], sending=["simworker.b"])
+    monkeypatch.setattr(monitor.app, "control", control)
+    monkeypatch.setattr(monitor.app.events, "Receiver", lambda connection, handlers: DrainingReceiver(monitor))
+    monitor.run()
+    assert monitor.finished
+    assert control.sending == {"simworker.b"}
+
+
+def test_run_waits_for_tasks_held_before_subscribing(monkeypatch):
+    """Tasks running or prefetched before the monitor started keep it waiting until they finish."""
+    monitor = make_monitor([("[merlin]_q", 0, 1)])
+    monitor.app.control = EventsControl(
+        [], [], active={"simworker.a": [{"id": "t1"}], "other.a": [{"id": "t3"}]}, reserved={"simworker.a": [{"id": "t2"}]}
+    )
+    done = [event("task-succeeded", uuid=uuid, hostname="simworker.a") for uuid in ("t1", "t2")]
+    monkeypatch.setattr(monitor.app.events, "Receiver", lambda connection, handlers: ScriptedReceiver(handlers, done))
+
+    monitor.seed_tasks()
+    assert monitor.active_tasks == 2
+    monitor.run()
+    assert monitor.finished
+    assert monitor.active_tasks == 0
+
+
+def test_tasks_of_dead_workers_not_counted():
+    """A task left started by a worker whose heartbeats stopped does not hold the monitor."""
+    monitor = make_monitor([("[merlin]_q", 0, 1)])
+    stale = time.time() - 3600
+    started = event("task-started", uuid="t1", hostname="simworker.host")
+    monitor.handle_event(dict(started, timestamp=stale, local_received=stale))
+    assert monitor.active_tasks == 0
+    monitor.query_queues()
+    assert monitor.check()
@@ -0,0 +1,148 @@
+"""
+Tests for the queue_stats.py module.
+"""
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import pytest
+from celery import Celery
+from kombu import Queue
+
+from merlin.study.queue_stats import QueueStatsClient, fetch_management_queue_stats
+
+
+MANAGEMENT_QUEUES = [
+    {"name": "[merlin]_hello", "messages_ready": 12, "consumers": 2},
+    {"name": "[merlin]_world", "messages_ready": 0, "consumers": 1},
+]
+
+
+class ManagementAPIHandler(BaseHTTPRequestHandler):
+    """A local stand-in for the RabbitMQ management api queue listing."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if not self.path.startswith("/api/queues/my%2Fvhost?") or "Authorization" not in self.headers:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(MANAGEMENT_QUEUES).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def management_api():
+    """Serve the management api stand-in on a free local port."""
+    server = HTTPServer(("127.0.0.1", 0), ManagementAPIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield {
+        "url": f"http://127.0.0.1:{server.server_address[1]}",
+        "vhost": "my/vhost",
+        "username": "user",
+        "password": "pass",
+    }
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def memory_app():
+    """A celery app on an in-memory broker holding some queued messages."""
+    app = Celery("test_queue_stats", broker="memory://")
+    with app.connection() as conn:
+        with conn.Producer() as producer:
+            for name, count in (("q1", 3), ("q2", 1)):
+                queue = Queue(name)
+                queue(conn.default_channel).declare()
+                for _ in range(count):
+                    producer.publish({"n": 1}, routing_key=name)
+    return app
+
+
+class RedisPipeline:
+    """The list length and key checks of a redis pipeline, over a dict of keys."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def llen(self, key):
+        self.commands.append(len(self.keys.get(key, [])))
+
+    def exists(self, key):
+        self.commands.append(int(key in self.keys))
+
+    def execute(self):
+        return self.commands
+
+
+class RedisChannel:
+    """The parts of kombu's redis channel that the pipelined query uses."""
+
+    priority_steps = [0, 3, 6, 9]
+    keyprefix_queue = "_kombu.binding.%s"
+    sep = "\x06\x16"
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.client = SimpleNamespace(pipeline=lambda: RedisPipeline(keys))
+
+    @contextmanager
+    def conn_or_acquire(self):
+        yield self.client
+
+    def _q_for_pri(self, queue, pri):
+        return f"{queue}{self.sep}{pri}" if pri else queue
+
+
+def test_query_redis_sums_priorities():
+    """Per-priority lists are summed per queue, and bound empty queues are kept."""
+    keys = {
+        "q1": [1, 2],
+        "q1\x06\x163": [3],
+        "q1\x06\x169": [4, 5, 6],
+        "_kombu.binding.q1": {"binding"},
+        "_kombu.binding.q2": {"binding"},
+        "q3\x06\x166": [7],
+    }
+    client = QueueStatsClient(app=Celery("test_queue_stats", broker="memory://"), management_api={})
+    client._channel = RedisChannel(keys)
+    assert client._query_redis(["q1", "q2", "q3", "q4"]) == {
+        "q1": ("q1", 6, 0),
+        "q2": ("q2", 0, 0),
+        "q3": ("q3", 1, 0),
+    }
+
+
+def test_fetch_management_queue_stats(management_api):
+    """The management api listing should be mapped to (name, jobs, consumers)."""
+    stats = fetch_management_queue_stats(management_api)
+    assert stats == {
+        "[merlin]_hello": ("[merlin]_hello", 12, 2),
+        "[merlin]_world": ("[merlin]_world", 0, 1),
+    }
+
+
+def test_query_with_declares(memory_app):
+    """Queues should be found with passive declares on one reused connection."""
+    with QueueStatsClient(app=memory_app, management_api={}) as client:
+        assert client.query(["q1", "missing", "q2"]) == [("q1", 3, 0), ("q2", 1, 0)]
+        connection = client._connection
+        assert client.query(["q2"]) == [("q2", 1, 0)]
+        assert client._connection is connection
+    assert client._connection is None
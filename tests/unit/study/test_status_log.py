@@ -0,0 +1,106 @@
+"""
+Tests for the status_log.py module and the status csv dump.
+"""
+import numpy as np
+import pytest
+
+from merlin.router import completed_by_queue, dump_status, with_empty_queues
+from merlin.study.status_log import StatusLog, format_summary, summarize
+
+
+def linear_samples(start, slope, n=11, consumers=1, completion_rate=np.nan):
+    """Samples of a queue whose backlog changes by slope tasks per second."""
+    times = np.arange(n, dtype=float)
+    return np.column_stack([times, start + slope * times, np.full(n, consumers), completion_rate * times])
+
+
+def test_append_and_read_changing_queues(tmpdir):
+    """Queues that appear or disappear between samples are kept apart."""
+    with StatusLog(str(tmpdir.join("status.db"))) as status_log:
+        status_log.append(0.0, [("q1", 10, 1)])
+        status_log.append(10.0, [("q1", 5, 1), ("q2", 7, 2)], completed={"q2": 4})
+        status_log.append(20.0, [("q2", 3, 2)], completed={"q2": 9})
+        samples = status_log.read()
+        only_q2 = status_log.read(["q2"])
+
+    assert sorted(samples) == ["q1", "q2"]
+    assert samples["q1"][:, :3].tolist() == [[0.0, 10, 1], [10.0, 5, 1]]
+    assert np.isnan(samples["q1"][:, 3]).all()
+    assert samples["q2"][:, 0].tolist() == [10.0, 20.0]
+    assert samples["q2"][:, 3].tolist() == [4, 9]
+    assert list(only_q2) == ["q2"]
+
+
+def test_summarize_rate_and_eta():
+    """A linearly draining queue reports its rate and time to empty."""
+    samples = {
+        "draining": linear_samples(start=100, slope=-2),
+        "growing": linear_samples(start=10, slope=1),
+    }
+    summary = summarize(samples)
+
+    assert summary["draining"]["rate"] == pytest.approx(2)
+    assert summary["draining"]["jobs"] == 80
+    assert summary["draining"]["eta"] == pytest.approx(40)
+    assert summary["draining"]["peak_jobs"] == 100
+    assert summary["growing"]["rate"] == pytest.approx(-1)
+    assert summary["growing"]["eta"] is None
+    assert summary["draining"]["completion_rate"] is None
+
+    table = format_summary(summary)
+    assert "draining" in table
+    assert "total" in table
+
+
+def test_summarize_completion_and_enqueue_rates():
+    """Counted completions give the rates at which tasks complete and arrive."""
+    summary = summarize({"q": linear_samples(start=100, slope=-2, completion_rate=5)})
+
+    assert summary["q"]["completed"] == 50
+    assert summary["q"]["completion_rate"] == pytest.approx(5)
+    assert summary["q"]["enqueue_rate"] == pytest.approx(3)
+    assert "completion rate" in format_summary(summary)
+
+
+def test_with_empty_queues():
+    """Queues the broker does not report are sampled as empty."""
+    assert with_empty_queues([("q2", 3, 1)], ["q1", "q2", "q3"]) == [("q1", 0, 0), ("q2", 3, 1), ("q3", 0, 0)]
+
+
+def test_completed_by_queue():
+    """Completion counts of steps, parameterized or not, are totalled by queue."""
+
+    class Spec:
+        @staticmethod
+        def get_task_queues():
+            return {"run": "sim", "run_post": "post", "collect": "post"}
+
+    counts = {"run_X.1:OK": 3, "run_X.2:OK": 2, "run_post:OK": 4, "collect:SOFT_FAIL": 1, "unknown:OK": 7}
+    assert completed_by_queue(Spec(), counts) == {"sim": 5, "post": 5}
+
+
+def test_dump_status_header_follows_queues(tmpdir):
+    """A new header is written only when the queues change."""
+    csv_file = str(tmpdir.join("status.csv"))
+    dump_status([("q1", 1, 1)], csv_file)
+    dump_status([("q1", 2, 1)], csv_file)
+    dump_status([("q1", 3, 1), ("q2", 4, 1)], csv_file)
+
+    with open(csv_file) as f:
+        lines = f.read().splitlines()
+    headers = [line for line in lines if line.startswith("# time")]
+    assert headers == ["# time,q1:tasks,q1:consumers", "# time,q1:tasks,q1:consumers,q2:tasks,q2:consumers"]
+    assert len(lines) == 5
+
+
+def test_dump_status_reuses_last_header(tmpdir):
+    """A caller that keeps the returned header does not need the file to be read again."""
+    csv_file = str(tmpdir.join("status.csv"))
+    header = dump_status([("q1", 1, 1)], csv_file)
+    assert header == "# time,q1:tasks,q1:consumers"
+    assert dump_status([("q1", 2, 1)], csv_file, header) == header
+
+    with open(csv_file) as f:
+        lines = f.read().splitlines()
+    assert lines[0] == header
+    assert len(lines) == 3
@@ -0,0 +1,32 @@
+"""
+Tests for the worker_registry.py module.
+"""
+import os
+import subprocess
+import sys
+
+from merlin.study.celeryadapter import get_running_queues
+from merlin.study.worker_registry import WorkerRegistry
+
+
+def test_register_and_read(tmpdir):
+    registry = WorkerRegistry(directory=str(tmpdir), hostname="host")
+    assert registry.running_queues() == []
+    assert registry.register(os.getpid(), "simworkers", ["[merlin]_sim"], "celery worker -Q [merlin]_sim")
+    # The cached entries are updated on registration...
+    assert get_running_queues(registry) == ["[merlin]_sim"]
+    # ...and a fresh registry reads them back from the directory.
+    assert WorkerRegistry(directory=str(tmpdir), hostname="host").running_queues() == ["[merlin]_sim"]
+    assert WorkerRegistry(directory=str(tmpdir), hostname="other").running_queues() == []
+
+
+def test_exited_workers_are_pruned(tmpdir):
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+    registry = WorkerRegistry(directory=str(tmpdir), hostname="host")
+    registry.register(proc.pid, "postworkers", ["[merlin]_post"], "celery worker -Q [merlin]_post")
+    proc.kill()
+    proc.wait()
+
+    assert WorkerRegistry(directory=str(tmpdir), hostname="host").running_queues() == []
+    assert tmpdir.join("host").listdir() == []
+    assert registry.register(proc.pid, "postworkers", ["[merlin]_post"], "") is None
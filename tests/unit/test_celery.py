@@ -0,0 +1,40 @@
+"""
+Tests for the lazy application factory in the celery.py module.
+"""
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import merlin.celery
+from merlin.celery import get_app, setup
+from merlin.common import resource_pool
+
+
+def test_import_does_not_build_app():
+    """Importing the task modules should not configure the celery app."""
+    check = "import merlin.common.tasks, merlin.celery; assert merlin.celery._APP is None"
+    result = subprocess.run([sys.executable, "-c", check], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    assert result.returncode == 0, result.stderr.decode()
+
+
+def test_get_app_is_cached():
+    """get_app should build the app once and return the same object after."""
+    celery_app = get_app()
+    assert celery_app is get_app()
+    assert celery_app.main == "merlin"
+    assert celery_app.conf.task_serializer == "pickle"
+
+
+def test_app_proxy_resolves_to_cached_app():
+    """The module level app handle should point at the cached app."""
+    assert merlin.celery.app.main == get_app().main
+    assert merlin.celery.app._get_current_object() is get_app()
+
+
+def test_setup_skips_pinning_on_bad_policy(monkeypatch, caplog):
+    """An unknown affinity policy should leave the prefork child unpinned, not fail it."""
+    monkeypatch.setenv("CELERY_AFFINITY_POLICY", "no-such-policy")
+    monkeypatch.setattr(merlin.celery.billiard, "current_process", lambda: SimpleNamespace(_identity=(1,)))
+    monkeypatch.setattr(resource_pool, "_PREFORK_CHILD", False)
+    setup()
+    assert "Not pinning worker process 0" in caplog.text
@@ -0,0 +1,50 @@
+"""
+Tests for the server connection checks in the display.py module.
+"""
+import time
+from types import SimpleNamespace
+
+from merlin.display import ConnProcess, check_server_access, round_trip
+
+
+def test_check_server_access_reports_connect_time(capsys):
+    """Reachable servers should be reported OK along with their connect time."""
+    check_server_access({"broker server": "memory://", "results server": "memory://"}, timeout=10)
+    output = capsys.readouterr().out
+    # The in-memory transport has no server to time a round trip to.
+    assert "broker server connection: OK (connect time:" in output
+    assert "results server connection: OK (connect time:" in output
+    assert "round trip" not in output
+    assert "Exceptions" not in output
+
+
+def test_round_trip_pings_redis():
+    """On redis, the round trip is one PING on the established connection."""
+    pings = []
+    channel = SimpleNamespace(client=SimpleNamespace(ping=lambda: pings.append(1)))
+    conn = SimpleNamespace(transport=SimpleNamespace(driver_type="redis"), default_channel=channel)
+    assert round_trip(conn) >= 0
+    assert pings == [1]
+
+
+def test_conn_process_poll_times_out():
+    """Polling a target that has not finished should return without a result."""
+    conn_check = ConnProcess(target=time.sleep, args=(5,))
+    conn_check.start()
+    try:
+        assert not conn_check.poll(0.1)
+        assert conn_check.elapsed is None
+    finally:
+        conn_check.kill()
+        conn_check.join()
+
+
+def test_conn_process_reports_exception():
+    """Exceptions raised by the target should be passed back to the parent."""
+    conn_check = ConnProcess(target=int, args=("not a number",))
+    conn_check.start()
+    assert conn_check.poll(10)
+    conn_check.join()
+    error, _ = conn_check.exception
+    assert isinstance(error, ValueError)
+    assert conn_check.elapsed is None